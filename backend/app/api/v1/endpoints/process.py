@@ -1,59 +1,195 @@
+import math
 import logging
-import json
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form
+from pydantic import ValidationError
+from fastapi.responses import FileResponse, StreamingResponse
 from app.schemas.process import (
     ProcessRequest,
     ProcessResponse,
+    CompactProcessResponse,
     Chunk,
     ChunkActionRequest,
+    ChunkingOptions,
+    BatchOptions,
 )
 from app.services.orchestrator import Orchestrator
 from app.services.file_processing_service import FileProcessingService
+from app.services.batch_service import BatchProcessingService
+from app.services.export_service import ExportService
+from app.services.extraction_store import Extraction, extraction_store
+from app.core.profiling import Profile, create_profile, profile_file, profiling, profiling_allowed
+from app.core.scheduling import AdmissionRejected
+from app.core.serialization import ndjson_line, sse_event
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-def get_orchestrator():
-    return Orchestrator()
+def get_client_key(http_request: Request) -> str:
+    """
+    Key used to share LLM/VLM capacity fairly between clients.
+    """
+    if http_request.headers.get("x-client-id"):
+        return http_request.headers["x-client-id"]
+    return http_request.client.host if http_request.client else "anonymous"
+
+
+def get_orchestrator(client_key: str = Depends(get_client_key)):
+    return Orchestrator(client_key=client_key)
 
 
 def get_file_processing_service():
     return FileProcessingService()
 
 
-@router.post("/", response_model=ProcessResponse)
+def get_batch_processing_service():
+    return BatchProcessingService()
+
+
+def get_profile(http_request: Request) -> Optional[Profile]:
+    """
+    Profile for a request asking for one with an X-Profile header or a
+    ?profile= query parameter, if profiling is enabled (see app.core.profiling).
+    """
+    value = http_request.headers.get("x-profile") or http_request.query_params.get("profile")
+    if not value:
+        return None
+    if not profiling_allowed(value):
+        raise HTTPException(status_code=403, detail="Profiling is not enabled for this request")
+    return create_profile(f"{http_request.method} {http_request.url.path}")
+
+
+def _profile_headers(profile: Optional[Profile]) -> dict:
+    return {"X-Profile-Id": profile.id} if profile else {}
+
+
+async def _profiled(events: AsyncIterator[dict], profile: Optional[Profile]) -> AsyncIterator[dict]:
+    """
+    Run a stream of events under a profile, until the stream ends.
+    """
+    with profiling(profile):
+        async for event in events:
+            yield event
+
+
+def _extraction_response(extraction: Extraction, file_service: FileProcessingService) -> dict:
+    return {
+        "content": extraction.content,
+        **extraction.report(),
+        "usage": file_service.usage.report().model_dump(),
+    }
+
+
+def _too_busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+async def _start_stream(events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+    """
+    Run a processing stream up to its first event, so that admission control
+    can reject the request with a 429, and an invalid one with a 400, before
+    the response has started.
+    """
+    first, error = None, None
+    try:
+        first = await events.__anext__()
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        error = e
+
+    async def resumed():
+        if error is not None:
+            raise error
+        if first is None:
+            return
+        yield first
+        async for event in events:
+            yield event
+
+    return resumed()
+
+
+@router.post("/", response_model=Union[ProcessResponse, CompactProcessResponse])
 async def process_text(
-    request: ProcessRequest, orchestrator: Orchestrator = Depends(get_orchestrator)
+    request: ProcessRequest,
+    response: Response,
+    orchestrator: Orchestrator = Depends(get_orchestrator),
+    profile: Optional[Profile] = Depends(get_profile),
 ):
     """
     Process text: chunk, clean, and summarize.
     """
+    response.headers.update(_profile_headers(profile))
     try:
-        return await orchestrator.process(request)
+        with profiling(profile):
+            return await orchestrator.process(request)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/stream")
 async def process_text_stream(
-    request: ProcessRequest, orchestrator: Orchestrator = Depends(get_orchestrator)
+    request: ProcessRequest,
+    orchestrator: Orchestrator = Depends(get_orchestrator),
+    profile: Optional[Profile] = Depends(get_profile),
 ):
     """
     Process text with streaming response (Server-Sent Events).
     """
+    events = await _start_stream(_profiled(orchestrator.process_stream(request), profile))
+
     async def event_generator():
         try:
-            async for event in orchestrator.process_stream(request):
-                yield f"data: {json.dumps(event)}\n\n"
-            yield "data: [DONE]\n\n"
+            async for event in events:
+                yield sse_event(event)
+            yield b"data: [DONE]\n\n"
+        except Exception as e:
+            logger.error("Error in stream processing: %s", e, exc_info=True)
+            yield sse_event({"error": str(e)})
+
+    return StreamingResponse(
+        event_generator(), media_type="text/event-stream", headers=_profile_headers(profile)
+    )
+
+
+@router.post("/ndjson")
+async def process_text_ndjson(
+    request: ProcessRequest,
+    orchestrator: Orchestrator = Depends(get_orchestrator),
+    profile: Optional[Profile] = Depends(get_profile),
+):
+    """
+    Process text with a newline-delimited JSON response: one event per line,
+    same events as /stream. Combine with response_format="compact" for large documents.
+    """
+    events = await _start_stream(_profiled(orchestrator.process_stream(request), profile))
+
+    async def record_generator():
+        try:
+            async for event in events:
+                yield ndjson_line(event)
         except Exception as e:
-            logger.error(f"Error in stream processing: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            logger.error("Error in NDJSON processing: %s", e, exc_info=True)
+            yield ndjson_line({"error": str(e)})
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return StreamingResponse(
+        record_generator(), media_type="application/x-ndjson", headers=_profile_headers(profile)
+    )
 
 
 @router.post("/chunk", response_model=Chunk)
@@ -65,24 +201,177 @@ async def process_chunk(
     """
     try:
         return await orchestrator.process_single_chunk(request.chunk, request.action)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
     except Exception as e:
-        logger.error(f"Error processing chunk: {e}", exc_info=True)
+        logger.error("Error processing chunk: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/upload_file")
 async def upload_file(
+    response: Response,
     file: UploadFile = File(...),
     file_service: FileProcessingService = Depends(get_file_processing_service),
+    profile: Optional[Profile] = Depends(get_profile),
 ):
     """
     Upload and process a file (PDF, DOCX, TXT, MD, CSV, JSON).
-    Returns the extracted text content.
+    Returns the extracted text content, with the status of each page / image
+    transcribed by the VLM.
     """
+    response.headers.update(_profile_headers(profile))
     try:
-        content = await file_service.process_file(file)
-        return {"content": content}
+        with profiling(profile):
+            extraction = await file_service.extract_file(file)
+        return _extraction_response(extraction, file_service)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/extractions/{extraction_id}/retry")
+async def retry_extraction(
+    extraction_id: str,
+    response: Response,
+    file_service: FileProcessingService = Depends(get_file_processing_service),
+    profile: Optional[Profile] = Depends(get_profile),
+):
+    """
+    Transcribe again only the pages / images of an uploaded file that failed
+    (its extraction_id from /upload_file or /upload_file/stream), and return
+    the extracted text with their new text spliced in.
+    """
+    extraction = extraction_store.get(extraction_id)
+    if extraction is None:
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    response.headers.update(_profile_headers(profile))
+    try:
+        with profiling(profile):
+            extraction = await file_service.retry_failed(extraction)
+        return _extraction_response(extraction, file_service)
+    except AdmissionRejected as e:
+        raise _too_busy(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/upload_file/stream")
+async def upload_file_stream(
+    file: UploadFile = File(...),
+    file_service: FileProcessingService = Depends(get_file_processing_service),
+    profile: Optional[Profile] = Depends(get_profile),
+):
+    """
+    Upload and process a file with streaming response (Server-Sent Events):
+    page / image transcriptions arrive as delta events while the VLM generates
+    them, followed by a done event with the full content.
+    """
+    async def event_generator():
+        try:
+            async for event in _profiled(file_service.process_file_stream(file), profile):
+                yield sse_event(event)
+            yield b"data: [DONE]\n\n"
+        except Exception as e:
+            logger.error("Error in file stream processing: %s", e, exc_info=True)
+            yield sse_event({"error": str(e)})
+
+    return StreamingResponse(
+        event_generator(), media_type="text/event-stream", headers=_profile_headers(profile)
+    )
+
+
+@router.post("/upload_records")
+async def upload_records(
+    file: UploadFile = File(...),
+    options: Optional[str] = Form(
+        None, description="JSON-encoded ChunkingOptions (chunk_size, record_format, repeat_header, size_unit)."
+    ),
+):
+    """
+    Upload a CSV, JSON array or JSONL file and chunk it into whole records
+    while it is read. Streams one NDJSON record per chunk, with its record and
+    byte offsets in the file, then a done record.
+    """
+    try:
+        chunking_options = (
+            ChunkingOptions.model_validate_json(options) if options else ChunkingOptions()
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+    async def record_generator():
+        total = 0
+        try:
+            async for chunk in FileProcessingService.chunk_records(file, chunking_options):
+                total += 1
+                yield ndjson_line({"type": "chunk", "chunk": chunk.model_dump()})
+            yield ndjson_line({"type": "done", "total_chunks": total})
+        except Exception as e:
+            logger.error("Error chunking records: %s", e, exc_info=True)
+            yield ndjson_line({"error": str(e)})
+
+    return StreamingResponse(record_generator(), media_type="application/x-ndjson")
+
+
+@router.post("/upload_batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    options: Optional[str] = Form(
+        None, description="JSON-encoded BatchOptions applied to every document."
+    ),
+    batch_service: BatchProcessingService = Depends(get_batch_processing_service),
+):
+    """
+    Upload many files (or .zip archives of files) and process them as one batch.
+    All pages and images share one fair VLM queue; each document is then chunked
+    and processed on its own. Streams one NDJSON record per finished document.
+    """
+    try:
+        batch_options = (
+            BatchOptions.model_validate_json(options) if options else BatchOptions()
+        )
+        items = await batch_service.expand_uploads(files)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def record_generator():
+        try:
+            async for event in batch_service.process_batch(items, batch_options):
+                yield ndjson_line(event)
+        except Exception as e:
+            logger.error("Error in batch processing: %s", e, exc_info=True)
+            yield ndjson_line({"error": str(e)})
+
+    return StreamingResponse(record_generator(), media_type="application/x-ndjson")
+
+
+@router.get("/exports/{export_id}/{filename}")
+async def download_export(export_id: str, filename: str):
+    """
+    Download a file written by the export stage (see ProcessRequest.export).
+    """
+    path = ExportService.export_file(export_id, filename)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Export file not found")
+    return FileResponse(path, filename=filename)
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, view: str = "speedscope"):
+    """
+    Download the profile of a profiled request (its X-Profile-Id): the
+    speedscope JSON (open it at https://www.speedscope.app), or with
+    ?view=summary the time spent per stage.
+    """
+    path = profile_file(profile_id, view)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
@@ -1,13 +1,13 @@
 import os
 import logging
-from typing import List, Optional
-from openai import OpenAI
+from typing import List, Optional, Protocol, Sequence
 from dotenv import load_dotenv
+from app.core.endpoint_pool import endpoint_pool
+from app.core.log import SAMPLED
+from app.core.usage import UsageTracker
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -17,17 +17,23 @@ class EmbeddingClient:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         model_name: Optional[str] = None,
+        usage_tracker: Optional[UsageTracker] = None,
     ):
         self.api_key = api_key or os.getenv("EMBEDDING_API_KEY")
-        self.base_url = base_url or os.getenv("EMBEDDING_BASE_URL")
+        # One URL or several, comma-separated (see app.core.endpoint_pool)
+        self.base_url = base_url or os.getenv("EMBEDDING_BASE_URLS") or os.getenv("EMBEDDING_BASE_URL")
         self.model_name = model_name or os.getenv(
             "EMBEDDING_MODEL_NAME", "text-embedding-3-small"
         )
+        self.usage = usage_tracker or UsageTracker()
 
         if not self.api_key:
             raise ValueError("EMBEDDING_API_KEY is not set and not provided.")
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.pool = endpoint_pool("EMBEDDING", self.api_key, self.base_url)
+
+    def _record_usage(self, response):
+        self.usage.record("embedding", self.model_name, response.usage)
 
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
@@ -39,17 +45,43 @@ class EmbeddingClient:
         # OpenAI API handles batching, but for very large lists we might want to chunk it manually.
         # For now, we assume the input list size is reasonable.
         try:
-            logger.info(
-                f"Getting embeddings for {len(texts)} texts using {self.model_name}"
+            logger.debug("Getting embeddings for %d texts using %s", len(texts), self.model_name, extra=SAMPLED)
+            response = self.pool.call(
+                lambda client: client.embeddings.create(input=texts, model=self.model_name),
+                on_discarded=self._record_usage,
             )
-            response = self.client.embeddings.create(input=texts, model=self.model_name)
-            logger.info("Successfully retrieved embeddings")
+            logger.debug("Successfully retrieved embeddings", extra=SAMPLED)
+            self._record_usage(response)
             return [data.embedding for data in response.data]
         except Exception as e:
-            logger.error(f"Error getting embeddings: {e}")
+            logger.error("Error getting embeddings: %s", e)
             raise e
 
 
+class EmbeddingBackend(Protocol):
+    """
+    Anything that turns a list of texts into one vector per text.
+    """
+
+    def get_embeddings(self, texts: List[str]) -> Sequence[Sequence[float]]: ...
+
+
+# "remote": the OpenAI-compatible embedding API; "local": CPU-only hashed n-gram vectors
+EMBEDDING_BACKENDS = ("remote", "local")
+
+
+def create_embedding_backend(
+    name: str, usage_tracker: Optional[UsageTracker] = None
+) -> EmbeddingBackend:
+    if name == "remote":
+        return EmbeddingClient(usage_tracker=usage_tracker)
+    if name == "local":
+        from app.core.local_embedding import LocalEmbeddingClient
+
+        return LocalEmbeddingClient()
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
 if __name__ == "__main__":
     # Simple test
     try:
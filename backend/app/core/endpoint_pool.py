@@ -0,0 +1,365 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, TypeVar
+from dotenv import load_dotenv
+from app.core.metrics import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Successful call latencies kept per pool to derive the hedging delay
+LATENCY_WINDOW = 200
+# Calls a pool must have seen before it starts hedging
+MIN_HEDGE_SAMPLES = 20
+# Threads running hedged calls (both the original call and its duplicate)
+HEDGE_WORKERS = 128
+# Recent calls and hedges over which the hedge budget is enforced
+HEDGE_BUDGET_WINDOW = 1000
+
+
+def parse_base_urls(value: Optional[str]) -> List[Optional[str]]:
+    """
+    Comma-separated base URLs; a single None (the SDK default) if there are none.
+    """
+    urls = [url.strip() for url in (value or "").split(",") if url.strip()]
+    return urls or [None]
+
+
+def is_endpoint_error(error: BaseException) -> bool:
+    """
+    Whether an error is the endpoint's fault (connection error, timeout, 5xx,
+    429) rather than the request's (other 4xx), which would fail anywhere.
+    """
+    status = getattr(error, "status_code", None)
+    return status is None or status >= 500 or status in (408, 409, 429)
+
+
+class Endpoint:
+    def __init__(self, base_url: Optional[str], client: Any):
+        self.base_url = base_url
+        self.client = client
+        self.outstanding = 0
+        self.failures = 0  # consecutive
+        self.ejected_until = 0.0
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.base_url!r}, outstanding={self.outstanding})"
+
+
+class EndpointPool:
+    """
+    The OpenAI-compatible servers (e.g. vLLM replicas) behind one kind of
+    model client.
+
+    Each call goes to the healthy endpoint with the fewest requests in flight.
+    An endpoint failing `eject_after` calls in a row is left out for
+    `eject_seconds`, and a call failing on one endpoint is retried on another
+    (up to `max_attempts` endpoints). With `hedge_quantile` set (e.g. 0.95), a
+    call still running after that quantile of recent call latencies is sent
+    again to another healthy endpoint and the first reply wins, which cuts the
+    tail of documents whose chunks are processed in parallel. Hedges are
+    extra upstream requests outside the callers' concurrency limits, so they
+    are capped at `hedge_budget` (e.g. 0.05 = 5%) of the recent calls.
+
+        response = pool.call(lambda client: client.embeddings.create(...))
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_urls: Sequence[Optional[str]],
+        api_key: str,
+        timeout: Optional[float] = None,
+        max_attempts: int = 3,
+        hedge_quantile: float = 0.0,
+        hedge_budget: float = 0.05,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        client_factory: Optional[Callable[[Optional[str]], Any]] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        multiple = len(base_urls) > 1
+        # With a single endpoint, retries are left to the SDK as before
+        self.max_attempts = max(1, max_attempts) if multiple else 1
+
+        if client_factory is None:
+            # Imported lazily: the OpenAI SDK is slow to import (see app.core.startup)
+            from openai import OpenAI
+
+            options: Dict[str, Any] = {}
+            if timeout:
+                options["timeout"] = timeout
+            if multiple:
+                # Failing over to another endpoint beats retrying the same one
+                options["max_retries"] = 0
+
+            def client_factory(base_url):
+                return OpenAI(api_key=api_key, base_url=base_url, **options)
+
+        self.endpoints = [Endpoint(url, client_factory(url)) for url in base_urls]
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        # Recent calls (False) and hedges (True), for the hedge budget
+        self._recent: Deque[bool] = deque(maxlen=HEDGE_BUDGET_WINDOW)
+        self._recent_hedges = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pick(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.ejected_until <= now]
+            candidates = [e for e in healthy if e not in exclude] or healthy
+            if not candidates:
+                # Everything is ejected: try the one coming back first rather than fail
+                candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+            return self._least_outstanding(candidates)
+
+    def _pick_hedge(self, primary: Endpoint) -> Optional[Endpoint]:
+        """
+        Another healthy endpoint for hedging a call to `primary`, or None if
+        there is none or the hedge budget is spent.
+        """
+        now = time.monotonic()
+        with self._lock:
+            calls = len(self._recent) - self._recent_hedges
+            if self._recent_hedges + 1 > self.hedge_budget * calls:
+                return None
+            candidates = [e for e in self.endpoints if e is not primary and e.ejected_until <= now]
+            if not candidates:
+                return None
+            self._count(hedge=True)
+            return self._least_outstanding(candidates)
+
+    def _least_outstanding(self, candidates: Sequence[Endpoint]) -> Endpoint:
+        fewest = min(e.outstanding for e in candidates)
+        endpoint = random.choice([e for e in candidates if e.outstanding == fewest])
+        endpoint.outstanding += 1
+        return endpoint
+
+    def _count(self, hedge: bool = False):
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_hedges -= self._recent[0]
+        self._recent.append(hedge)
+        self._recent_hedges += hedge
+
+    def _release(
+        self,
+        endpoint: Endpoint,
+        started: float,
+        error: Optional[BaseException] = None,
+        timed: bool = True,
+    ):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                if timed:
+                    self._latencies.append(time.monotonic() - started)
+                return
+            if not is_endpoint_error(error):
+                return
+            endpoint.failures += 1
+            # Still at the threshold after a cooldown, so one more failure re-ejects it
+            if endpoint.failures < self.eject_after or len(self.endpoints) == 1:
+                return
+            endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning(
+            "Ejecting %s endpoint %s for %gs after %d consecutive failures: %s",
+            self.name,
+            endpoint.base_url,
+            self.eject_seconds,
+            endpoint.failures,
+            error,
+        )
+        metrics.inc(
+            "endpoint_ejections_total",
+            help_text="Model endpoints taken out of rotation after consecutive failures.",
+            client=self.name,
+        )
+
+    def _call_once(self, fn: Callable[[Any], T], endpoint: Endpoint) -> T:
+        started = time.monotonic()
+        try:
+            result = fn(endpoint.client)
+        except BaseException as e:
+            self._release(endpoint, started, e)
+            raise
+        self._release(endpoint, started)
+        return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        How long a call runs before it is hedged, or None if it isn't.
+        """
+        if not self.hedge_quantile or len(self.endpoints) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < MIN_HEDGE_SAMPLES:
+                return None
+            samples = sorted(self._latencies)
+        return samples[min(len(samples) - 1, int(self.hedge_quantile * len(samples)))]
+
+    def call(self, fn: Callable[[Any], T], on_discarded: Optional[Callable[[T], None]] = None) -> T:
+        """
+        Run `fn(client)` on an endpoint of the pool. Replies of hedged calls
+        that lost the race are passed to `on_discarded` (to account for their
+        usage) when they arrive.
+        """
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._pick(tried)
+            tried.append(endpoint)
+            try:
+                return self._hedged(fn, endpoint, on_discarded, tried)
+            except Exception as e:
+                if len(tried) >= self.max_attempts or not is_endpoint_error(e):
+                    raise
+                logger.warning(
+                    "%s call to %s failed, trying another endpoint: %s", self.name, endpoint.base_url, e
+                )
+                metrics.inc(
+                    "endpoint_failovers_total",
+                    help_text="Model calls retried on another endpoint after an error.",
+                    client=self.name,
+                )
+
+    def _hedged(
+        self,
+        fn: Callable[[Any], T],
+        primary: Endpoint,
+        on_discarded: Optional[Callable[[T], None]],
+        tried: List[Endpoint],
+    ) -> T:
+        with self._lock:
+            self._count()
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._call_once(fn, primary)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix=f"{self.name}-hedge")
+        first = self._executor.submit(self._call_once, fn, primary)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        hedge = self._pick_hedge(primary)
+        if hedge is None:
+            return first.result()
+
+        # A failover after both fail goes to a third endpoint
+        tried.append(hedge)
+        second = self._executor.submit(self._call_once, fn, hedge)
+        metrics.inc(
+            "hedged_requests_total",
+            help_text="Model calls sent a second time because the first was slow.",
+            client=self.name,
+        )
+
+        def discard(future: Future):
+            if on_discarded is None or future.cancelled() or future.exception() is not None:
+                return
+            try:
+                on_discarded(future.result())
+            except Exception as e:
+                logger.error("Error handling a discarded %s reply: %s", self.name, e)
+
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in (done | pending) - {future}:
+                        other.add_done_callback(discard)
+                    if future is second:
+                        metrics.inc(
+                            "hedge_wins_total",
+                            help_text="Hedged model calls answered first by the duplicate.",
+                            client=self.name,
+                        )
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def stream(self, fn: Callable[[Any], Iterator[T]]) -> Iterator[T]:
+        """
+        Iterate over the stream `fn(client)` returns, on an endpoint of the
+        pool. Only opening the stream fails over, and streams aren't hedged;
+        the endpoint counts as busy until the stream is consumed or closed.
+        """
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._pick(tried)
+            tried.append(endpoint)
+            started = time.monotonic()
+            try:
+                stream = fn(endpoint.client)
+                break
+            except Exception as e:
+                self._release(endpoint, started, e, timed=False)
+                if len(tried) >= self.max_attempts or not is_endpoint_error(e):
+                    raise
+                logger.warning(
+                    "%s stream from %s failed, trying another endpoint: %s", self.name, endpoint.base_url, e
+                )
+
+        error: Optional[BaseException] = None
+        try:
+            yield from stream
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(endpoint, started, error, timed=False)
+
+
+_pools: Dict[tuple, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def endpoint_pool(prefix: str, api_key: str, base_url: Optional[str] = None) -> EndpointPool:
+    """
+    The process-wide pool of a client kind ("LLM", "VLM" or "EMBEDDING"), so
+    all client instances share the load and health of its endpoints.
+    `base_url` (comma-separated) overrides the {prefix}_BASE_URLS setting.
+    """
+    urls = parse_base_urls(base_url or os.getenv(f"{prefix}_BASE_URLS") or os.getenv(f"{prefix}_BASE_URL"))
+    timeout = float(os.getenv(f"{prefix}_TIMEOUT", 0)) or None
+    max_attempts = int(os.getenv(f"{prefix}_MAX_ATTEMPTS", 3))
+    hedge_quantile = float(os.getenv(f"{prefix}_HEDGE_QUANTILE", 0))
+    hedge_budget = float(os.getenv(f"{prefix}_HEDGE_BUDGET", 0.05))
+    eject_after = int(os.getenv("ENDPOINT_EJECT_AFTER", 3))
+    eject_seconds = float(os.getenv("ENDPOINT_EJECT_SECONDS", 30))
+
+    key = (
+        prefix, api_key, tuple(urls), timeout, max_attempts, hedge_quantile, hedge_budget, eject_after, eject_seconds
+    )
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool(
+                prefix.lower(),
+                urls,
+                api_key,
+                timeout=timeout,
+                max_attempts=max_attempts,
+                hedge_quantile=hedge_quantile,
+                hedge_budget=hedge_budget,
+                eject_after=eject_after,
+                eject_seconds=eject_seconds,
+            )
+        return pool
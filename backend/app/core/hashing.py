@@ -0,0 +1,31 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def splitmix64(hashes: "np.ndarray") -> "np.ndarray":
+    """
+    The splitmix64 finalizer, applied element-wise to uint64 values.
+    """
+    import numpy as np
+
+    hashes = hashes + np.uint64(0x9E3779B97F4A7C15)
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def char_ngram_hashes(codes: "np.ndarray", n: int) -> "np.ndarray":
+    """
+    Deterministic 64-bit hashes of all length-`n` windows of a uint64 array of
+    code points, computed vectorized: a polynomial hash followed by splitmix64.
+    """
+    import numpy as np
+
+    n = min(n, len(codes))
+    count = len(codes) - n + 1
+    hashes = np.zeros(max(count, 1), dtype=np.uint64)
+    for j in range(n):
+        hashes = hashes * np.uint64(1_000_003) + codes[j : j + count]
+    return splitmix64(hashes)
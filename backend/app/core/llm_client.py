@@ -1,14 +1,16 @@
 import os
 import base64
 import logging
-from typing import Optional
-from openai import OpenAI
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
 from dotenv import load_dotenv
+from app.core.endpoint_pool import endpoint_pool
+from app.core.log import SAMPLED
+from app.core.tokenizer import count_tokens
+from app.core.usage import UsageTracker
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -18,15 +20,21 @@ class LLMClient:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         model_name: Optional[str] = None,
+        usage_tracker: Optional[UsageTracker] = None,
     ):
         self.api_key = api_key or os.getenv("LLM_API_KEY")
-        self.base_url = base_url or os.getenv("LLM_BASE_URL")
+        # One URL or several, comma-separated (see app.core.endpoint_pool)
+        self.base_url = base_url or os.getenv("LLM_BASE_URLS") or os.getenv("LLM_BASE_URL")
         self.model_name = model_name or os.getenv("LLM_MODEL_NAME", "gpt-4o")
+        self.usage = usage_tracker or UsageTracker()
 
         if not self.api_key:
             raise ValueError("LLM_API_KEY is not set and not provided.")
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.pool = endpoint_pool("LLM", self.api_key, self.base_url)
+
+    def _record_usage(self, response):
+        self.usage.record("llm", self.model_name, response.usage)
 
     def get_completion(
         self, prompt: str, system_prompt: str = "You are a helpful assistant."
@@ -35,18 +43,47 @@ class LLMClient:
         Get text completion from the LLM.
         """
         try:
-            logger.info(f"Sending request to LLM: {self.model_name}")
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
+            logger.debug("Sending request to LLM: %s", self.model_name, extra=SAMPLED)
+            response = self.pool.call(
+                lambda client: client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                ),
+                on_discarded=self._record_usage,
             )
-            logger.info("Received response from LLM")
+            logger.debug("Received response from LLM", extra=SAMPLED)
+            self._record_usage(response)
             return response.choices[0].message.content
         except Exception as e:
-            logger.error(f"Error getting completion: {e}")
+            logger.error("Error getting completion: %s", e)
+            raise e
+
+    def stream_completion(
+        self, prompt: str, system_prompt: str = "You are a helpful assistant."
+    ) -> Iterator[str]:
+        """
+        Stream a text completion from the LLM, yielding content deltas as they are generated.
+        """
+        try:
+            logger.debug("Sending streaming request to LLM: %s", self.model_name, extra=SAMPLED)
+            stream = self.pool.stream(
+                lambda client: client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            )
+            yield from _stream_content(stream, self.usage, "llm", self.model_name, system_prompt + prompt)
+            logger.debug("Finished streaming response from LLM", extra=SAMPLED)
+        except Exception as e:
+            logger.error("Error streaming completion: %s", e)
             raise e
 
 
@@ -56,15 +93,21 @@ class VLMClient:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         model_name: Optional[str] = None,
+        usage_tracker: Optional[UsageTracker] = None,
     ):
         self.api_key = api_key or os.getenv("VLM_API_KEY")
-        self.base_url = base_url or os.getenv("VLM_BASE_URL")
+        # One URL or several, comma-separated (see app.core.endpoint_pool)
+        self.base_url = base_url or os.getenv("VLM_BASE_URLS") or os.getenv("VLM_BASE_URL")
         self.model_name = model_name or os.getenv("VLM_MODEL_NAME", "gpt-4o")
+        self.usage = usage_tracker or UsageTracker()
 
         if not self.api_key:
             raise ValueError("VLM_API_KEY is not set and not provided.")
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.pool = endpoint_pool("VLM", self.api_key, self.base_url)
+
+    def _record_usage(self, response):
+        self.usage.record("vlm", self.model_name, response.usage, image_count=1)
 
     def get_image_caption(
         self, image_bytes: bytes, prompt: str = "Describe this image in detail."
@@ -75,31 +118,95 @@ class VLMClient:
         try:
             base64_image = base64.b64encode(image_bytes).decode("utf-8")
 
-            logger.info(f"Sending request to VLM: {self.model_name}")
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                },
-                            },
-                        ],
-                    }
-                ],
+            logger.debug("Sending request to VLM: %s", self.model_name, extra=SAMPLED)
+            response = self.pool.call(
+                lambda client: client.chat.completions.create(
+                    model=self.model_name,
+                    messages=_image_messages(prompt, base64_image),
+                ),
+                on_discarded=self._record_usage,
             )
-            logger.info("Received response from VLM")
+            logger.debug("Received response from VLM", extra=SAMPLED)
+            self._record_usage(response)
             return response.choices[0].message.content
         except Exception as e:
-            logger.error(f"Error getting image caption: {e}")
+            logger.error("Error getting image caption: %s", e)
+            raise e
+
+    def stream_image_caption(
+        self, image_bytes: bytes, prompt: str = "Describe this image in detail."
+    ) -> Iterator[str]:
+        """
+        Stream the caption/description for an image, yielding content deltas.
+        """
+        try:
+            base64_image = base64.b64encode(image_bytes).decode("utf-8")
+
+            logger.debug("Sending streaming request to VLM: %s", self.model_name, extra=SAMPLED)
+            stream = self.pool.stream(
+                lambda client: client.chat.completions.create(
+                    model=self.model_name,
+                    messages=_image_messages(prompt, base64_image),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+            )
+            yield from _stream_content(
+                stream, self.usage, "vlm", self.model_name, prompt, image_count=1
+            )
+            logger.debug("Finished streaming response from VLM", extra=SAMPLED)
+        except Exception as e:
+            logger.error("Error streaming image caption: %s", e)
             raise e
 
 
+def _image_messages(prompt: str, base64_image: str) -> list:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                },
+            ],
+        }
+    ]
+
+
+def _stream_content(
+    stream, usage_tracker: UsageTracker, kind: str, model: str, prompt: str, image_count: int = 0
+) -> Iterator[str]:
+    """
+    Yield the content deltas of a streamed chat completion. Usage arrives in the
+    last chunk (stream_options.include_usage) and is recorded once at the end,
+    also when the stream is closed early (client disconnect, cancellation) or
+    fails: the tokens generated so far are billed all the same, so without the
+    final chunk they are estimated from the prompt and the content received.
+    """
+    usage = None
+    received = False
+    content: List[str] = []
+    try:
+        for chunk in stream:
+            received = True
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                content.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        received = True
+    finally:
+        # A stream that failed to open wasn't billed
+        if received:
+            if usage is None:
+                usage = SimpleNamespace(
+                    prompt_tokens=count_tokens(prompt), completion_tokens=count_tokens("".join(content))
+                )
+            usage_tracker.record(kind, model, usage, image_count=image_count)
+
+
 if __name__ == "__main__":
     # Simple test
     try:
@@ -0,0 +1,101 @@
+import os
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from app.core.hashing import char_ngram_hashes
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Size of the hashed n-gram feature space (2 ** FEATURE_BITS)
+FEATURE_BITS = 20
+# Characters per batch of texts whose n-grams are counted at once
+BATCH_CHARS = 100_000
+
+
+class LocalEmbeddingClient:
+    """
+    CPU-only embeddings for semantic chunking, with no network or model files.
+
+    Each text becomes a TF-IDF vector over hashed character n-grams (which works
+    for spaced and CJK text alike), with IDF computed over the texts of the
+    call (the sentences of one document). The sparse vector is then reduced to
+    `dim` dimensions by a signed random projection (the hashing trick) and L2
+    normalized. Everything runs vectorized over all texts at once.
+    """
+
+    model_name = "local-hashed-ngrams"
+
+    def __init__(self, dim: Optional[int] = None, ngram_range: Tuple[int, int] = (2, 4)):
+        self.dim = dim or int(os.getenv("LOCAL_EMBEDDING_DIM", 256))
+        self.ngram_range = ngram_range
+
+    def get_embeddings(self, texts: List[str]) -> "np.ndarray":
+        """
+        Embeddings for a list of texts, as a (len(texts), dim) float32 array.
+        """
+        import numpy as np
+
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        # Count n-grams in batches of texts to bound the size of the temporaries
+        batches = []
+        batch_start, batch_chars = 0, 0
+        for i, text in enumerate(texts):
+            batch_chars += len(text) + 1
+            if batch_chars >= BATCH_CHARS or i == len(texts) - 1:
+                pairs, tf = self._count_ngrams(texts[batch_start : i + 1], batch_start)
+                batches.append((batch_start, i + 1, pairs, tf))
+                batch_start, batch_chars = i + 1, 0
+
+        # Document frequencies over all texts, then the projection batch by batch
+        feature_mask = (1 << FEATURE_BITS) - 1
+        df = np.zeros(1 << FEATURE_BITS, dtype=np.int64)
+        for _, _, pairs, _ in batches:
+            df += np.bincount(pairs & feature_mask, minlength=1 << FEATURE_BITS)
+        idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float64)
+        for first, last, pairs, tf in batches:
+            features = pairs & feature_mask
+            weights = (1.0 + np.log(tf)) * idf[features]
+            # Signed random projection: each feature adds ±weight to one bucket
+            mixed = (features.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+            buckets = (mixed % np.uint64(self.dim)).astype(np.int64)
+            weights[((mixed >> np.uint64(31)) & np.uint64(1)).astype(bool)] *= -1.0
+            rows = (pairs >> FEATURE_BITS) - first
+            vectors[first:last] = np.bincount(
+                rows * self.dim + buckets, weights=weights, minlength=(last - first) * self.dim
+            ).reshape(last - first, self.dim)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+    def _count_ngrams(self, texts: List[str], first_id: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Unique (text id << FEATURE_BITS | feature) keys of the texts' n-grams,
+        with their counts.
+        """
+        import numpy as np
+
+        # One code point array for all texts, each followed by an end marker;
+        # doc_ids maps positions to texts
+        # (lowering can change a text's length, e.g. "İ" becomes two code points)
+        lowered = [text.lower() for text in texts]
+        joined = "".join(text + "\x00" for text in lowered)
+        codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        lengths = np.array([len(text) + 1 for text in lowered], dtype=np.int64)
+        doc_ids = np.repeat(np.arange(first_id, first_id + len(texts), dtype=np.int64), lengths)
+
+        keys = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if len(codes) < n:
+                break
+            hashes = char_ngram_hashes(codes, n)
+            # Keep windows that lie within a single text
+            valid = doc_ids[: len(hashes)] == doc_ids[n - 1 :]
+            features = (hashes[valid] >> np.uint64(64 - FEATURE_BITS)).astype(np.int64)
+            keys.append((doc_ids[: len(hashes)][valid] << FEATURE_BITS) | features)
+        if not keys:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(keys), return_counts=True)
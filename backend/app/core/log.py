@@ -0,0 +1,196 @@
+import os
+import re
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-call debug lines (one per model call, page, image...) pass `extra=SAMPLED`
+# and only a fraction LOG_SAMPLE_RATE of them is kept
+SAMPLED = {"sampled": True}
+
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+# Attributes every LogRecord has; any other one was passed with `extra=`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "context",
+    "sampled",
+}
+
+_context: ContextVar[Dict[str, object]] = ContextVar("log_context", default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """
+    Add fields (request_id, document, page, chunk...) to every record logged
+    inside the block, including by the tasks it starts and the threads they
+    hand work to (see app.core.streaming.run_in_thread).
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_log_context() -> Dict[str, object]:
+    return _context.get()
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a queue as they are, with the log context of the code
+    logging them; a QueueListener thread formats and writes them, so logging
+    costs the event loop little more than creating the record.
+    """
+
+    def __init__(self, records: queue.SimpleQueue, sample_rate: float = 1.0):
+        super().__init__(records)
+        self.sample_rate = sample_rate
+
+    def emit(self, record: logging.LogRecord):
+        if getattr(record, "sampled", False):
+            if random.random() >= self.sample_rate:
+                return
+            record.sample_rate = self.sample_rate
+        record.context = _context.get()
+        # Unlike QueueHandler.prepare, the message is left unformatted
+        self.enqueue(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, the log context
+    and any `extra=` fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Plain lines for development, with the log context as key=value pairs.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        return line
+
+
+def parse_levels(value: Optional[str]) -> Dict[str, str]:
+    """
+    Per-logger levels from "app.core.llm_client=DEBUG,app.services=WARNING".
+    """
+    levels = {}
+    for item in (value or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, force: bool = False):
+    """
+    Set up the process's logging once: records go through a queue to a
+    background thread writing them to stderr as JSON (LOG_FORMAT=json) or
+    text. LOG_LEVEL sets the root level, LOG_LEVELS the level of subsystems
+    (loggers and their children), LOG_SAMPLE_RATE the share of per-call debug
+    lines kept. Like logging.basicConfig, a root logger that already has
+    handlers is left alone unless `force` is set.
+    """
+    global _listener
+    root = logging.getLogger()
+    if (_listener is not None or root.handlers) and not force:
+        return
+    stop_logging()
+
+    handler = logging.StreamHandler(sys.stderr)
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(ContextQueueHandler(records, float(os.getenv("LOG_SAMPLE_RATE", 0.01))))
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    for name, subsystem_level in parse_levels(os.getenv("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+
+def stop_logging():
+    """
+    Write out the records still queued and stop the background thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware running each HTTP request in a log context with its
+    request_id: the X-Request-Id header if it has a sane one, else a new id,
+    returned in the X-Request-Id response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_id)
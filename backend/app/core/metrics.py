@@ -0,0 +1,61 @@
+import threading
+from typing import Dict, Tuple
+
+# Prefix applied to every exported metric name
+METRIC_PREFIX = "kb_chunker"
+
+
+class MetricsRegistry:
+    """
+    A minimal, thread-safe registry of monotonically increasing counters.
+    Rendered in the Prometheus text exposition format by the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels: str):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+            if help_text and name not in self._help:
+                self._help[name] = help_text
+
+    def get(self, name: str, **labels: str) -> float:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            return self._counters.get(name, {}).get(key, 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._help.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full_name = f"{METRIC_PREFIX}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    if key:
+                        label_str = ",".join(
+                            f'{k}="{_escape_label(v)}"' for k, v in key
+                        )
+                        lines.append(f"{full_name}{{{label_str}}} {value:g}")
+                    else:
+                        lines.append(f"{full_name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry shared by all services
+metrics = MetricsRegistry()
@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_ROOT = str(Path(__file__).resolve().parents[2] / "profiles")
+PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Stage spans kept per profile; later ones only count towards the totals
+MAX_SPANS = 50_000
+# Frames kept per sampled stack, innermost first
+MAX_STACK_DEPTH = 200
+# Stack samples (all threads) kept per profile; sampling stops once it is reached
+MAX_SAMPLES = 200_000
+
+
+def profile_root() -> Path:
+    return Path(os.getenv("PROFILE_ROOT", DEFAULT_PROFILE_ROOT)).resolve()
+
+
+def profiling_allowed(value: Optional[str]) -> bool:
+    """
+    Whether a request asking for a profile (X-Profile header or ?profile=
+    query value) may have one: PROFILING_ENABLED must be on, and if
+    PROFILING_TOKEN is set the value must be that token.
+    """
+    if not value or os.getenv("PROFILING_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return False
+    token = os.getenv("PROFILING_TOKEN")
+    return not token or value == token
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the Python stacks of every thread (the event loop and the executor
+    threads doing parsing, rendering and model calls) at a fixed interval,
+    until `MAX_SAMPLES` stacks are kept (`truncated` is then set).
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.frames: List[dict] = []
+        self.frame_index: Dict[Tuple[str, str, int], int] = {}
+        # thread id -> list of (time, stack of frame indices, outermost first)
+        self.samples: Dict[int, List[Tuple[float, List[int]]]] = {}
+        self.count = 0
+        self.truncated = False
+        self._stop_event = threading.Event()
+
+    def _frame(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if self.count >= MAX_SAMPLES:
+                    self.truncated = True
+                    return
+                self.count += 1
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(self._frame(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.setdefault(thread_id, []).append((now, stack))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    """
+    Profile of one request: a timeline of pipeline stages (chunking, embedding,
+    LLM queue wait and call, PDF render, VLM call, parsing, token counting)
+    plus stack samples of all threads, written as a speedscope JSON file.
+
+    Stages overlap when work runs concurrently, so the timeline is laid out in
+    lanes, each a non-overlapping sequence of stages. Stack samples cover the
+    whole process, so they also contain other requests' work running at the
+    same time.
+    """
+
+    def __init__(self, name: str, interval: float = 0.005):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.interval = interval
+        self.spans: List[Tuple[str, float, float]] = []
+        self.totals: Dict[str, List[float]] = {}  # stage -> [count, seconds]
+        self._lock = threading.Lock()
+        self._sampler: Optional[_Sampler] = None
+        self._start = 0.0
+        self._end = 0.0
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._sampler = _Sampler(self.interval)
+        self._sampler.start()
+
+    def stop(self):
+        self._end = time.perf_counter()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def record(self, stage: str, start: float, end: float):
+        with self._lock:
+            total = self.totals.setdefault(stage, [0, 0.0])
+            total[0] += 1
+            total[1] += end - start
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append((stage, start, end))
+
+    def summary(self) -> dict:
+        return {
+            "profile_id": self.id,
+            "name": self.name,
+            "duration_ms": round((self._end - self._start) * 1000, 3),
+            "stages": {
+                stage: {"count": int(count), "total_ms": round(seconds * 1000, 3)}
+                for stage, (count, seconds) in sorted(self.totals.items())
+            },
+            "truncated_spans": sum(int(count) for count, _ in self.totals.values()) - len(self.spans),
+            "truncated_samples": bool(self._sampler and self._sampler.truncated),
+        }
+
+    def speedscope(self) -> dict:
+        sampler = self._sampler
+        frames = list(sampler.frames) if sampler else []
+        end = (self._end - self._start) * 1000
+        profiles = []
+
+        def ms(t: float) -> float:
+            return round((t - self._start) * 1000, 3)
+
+        # Stage timeline: greedy interval partitioning into lanes
+        lanes: List[List[Tuple[str, float, float]]] = []
+        for span in sorted(self.spans, key=lambda span: span[1]):
+            for lane in lanes:
+                if lane[-1][2] <= span[1]:
+                    lane.append(span)
+                    break
+            else:
+                lanes.append([span])
+        stage_frames: Dict[str, int] = {}
+        for i, lane in enumerate(lanes):
+            events = []
+            for stage, start, stop in lane:
+                if stage not in stage_frames:
+                    stage_frames[stage] = len(frames)
+                    frames.append({"name": f"stage:{stage}"})
+                events.append({"type": "O", "frame": stage_frames[stage], "at": ms(start)})
+                events.append({"type": "C", "frame": stage_frames[stage], "at": ms(stop)})
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"stages {i + 1}",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": end,
+                    "events": events,
+                }
+            )
+
+        # Stack samples, one profile per thread
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, samples in (sampler.samples.items() if sampler else []):
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": f"thread {names.get(thread_id, thread_id)}",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": end,
+                    "samples": [stack for _, stack in samples],
+                    "weights": [self.interval * 1000] * len(samples),
+                }
+            )
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "knowledge-base-chunker",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def save(self) -> Path:
+        root = profile_root()
+        root.mkdir(parents=True, exist_ok=True)
+        (root / f"{self.id}.speedscope.json").write_text(json.dumps(self.speedscope()), encoding="utf-8")
+        (root / f"{self.id}.summary.json").write_text(json.dumps(self.summary()), encoding="utf-8")
+        return root
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+
+def current_profile() -> Optional[Profile]:
+    return _current.get()
+
+
+class _Stage:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.record(self.name, self.start, time.perf_counter())
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """
+    Context manager timing a pipeline stage of the request being profiled;
+    a shared no-op when the request isn't profiled.
+
+        with stage("chunking"):
+            ...
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NO_STAGE
+    return _Stage(profile, name)
+
+
+@contextmanager
+def profiling(profile: Optional[Profile]) -> Iterator[Optional[Profile]]:
+    """
+    Profile the code run inside the block, and the tasks it starts, then save
+    the profile under PROFILE_ROOT. No-op for None.
+    """
+    if profile is None:
+        yield None
+        return
+    previous = _current.get()
+    _current.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _current.set(previous)
+        try:
+            profile.save()
+        except OSError as e:
+            logger.error("Could not save profile %s: %s", profile.id, e)
+
+
+def create_profile(name: str) -> Profile:
+    return Profile(name, interval=float(os.getenv("PROFILING_INTERVAL_MS", 5)) / 1000)
+
+
+def profile_file(profile_id: str, kind: str = "speedscope") -> Optional[Path]:
+    """
+    Path of a saved profile ("speedscope" or "summary"), or None if there is none.
+    """
+    if not PROFILE_ID_RE.match(profile_id) or kind not in ("speedscope", "summary"):
+        return None
+    path = profile_root() / f"{profile_id}.{kind}.json"
+    return path if path.is_file() else None
@@ -0,0 +1,137 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import List, Optional
+from dotenv import load_dotenv
+from app.core.metrics import metrics
+from app.core.tokenizer import count_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around each message (role, separators)
+MESSAGE_OVERHEAD = 8
+
+# Where an oversize text is cut, best first: paragraphs, lines, sentences, words
+BOUNDARIES = [
+    re.compile(r"(?<=\n\n)"),
+    re.compile(r"(?<=\n)"),
+    re.compile(r"(?<=[.!?;。！？；])"),
+    re.compile(r"(?<=\s)"),
+]
+
+OVERSIZE_POLICIES = ("split", "truncate")
+
+# Static prompts are counted once per process
+_static_tokens = lru_cache(maxsize=32)(count_tokens)
+
+
+def split_to_budget(text: str, max_tokens: int, level: int = 0) -> List[str]:
+    """
+    Cut `text` into pieces of at most `max_tokens` tokens that concatenate back
+    to it, at paragraph, line, sentence or word boundaries where possible.
+    """
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return [text]
+    if level == len(BOUNDARIES):
+        # No boundary left: cut by characters, in proportion to the token count
+        size = max(1, len(text) * max_tokens // tokens)
+        return [text[i : i + size] for i in range(0, len(text), size)]
+
+    units = [unit for unit in BOUNDARIES[level].split(text) if unit]
+    if len(units) == 1:
+        return split_to_budget(text, max_tokens, level + 1)
+
+    pieces: List[str] = []
+    current, current_tokens = "", 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if unit_tokens > max_tokens:
+            if current:
+                pieces.append(current)
+                current, current_tokens = "", 0
+            pieces.extend(split_to_budget(unit, max_tokens, level + 1))
+        elif current_tokens + unit_tokens <= max_tokens:
+            # Summing the parts' counts slightly overestimates the joined text
+            current += unit
+            current_tokens += unit_tokens
+        else:
+            pieces.append(current)
+            current, current_tokens = unit, unit_tokens
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class PromptBuilder:
+    """
+    Prompts of one kind of LLM call (cleaning, summarizing) within a token budget.
+
+    The system prompt holds everything static, so it is an identical prefix of
+    every call that the provider (or vLLM's prefix cache) can reuse; the user
+    message only holds the text. Texts that don't fit in the context window
+    next to the prompt and the reserved output tokens are split into pieces,
+    each sent on its own, or truncated (LLM_OVERSIZE_POLICY). For calls whose
+    reply repeats the text (cleaning), the text must also fit in the output;
+    the replies of the other ones (summaries) are only about their piece, so
+    callers reduce them with another call.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        user_template: str,
+        context_window: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        echoes_input: bool = False,
+        oversize: Optional[str] = None,
+    ):
+        self.system_prompt = system_prompt
+        self.user_template = user_template
+        self.echoes_input = echoes_input
+        self.context_window = context_window or int(os.getenv("LLM_CONTEXT_WINDOW", 128_000))
+        self.output_tokens = output_tokens or int(os.getenv("LLM_MAX_OUTPUT_TOKENS", 4096))
+        self.oversize = oversize or os.getenv("LLM_OVERSIZE_POLICY", "split")
+        if self.oversize not in OVERSIZE_POLICIES:
+            raise ValueError(f"Unknown oversize policy: {self.oversize}")
+
+        self.prefix_tokens = _static_tokens(system_prompt) + MESSAGE_OVERHEAD
+        overhead = self.prefix_tokens + _static_tokens(user_template.format(text="")) + MESSAGE_OVERHEAD
+        budget = self.context_window - self.output_tokens - overhead
+        if echoes_input:
+            budget = min(budget, self.output_tokens)
+        self.max_text_tokens = max(1, budget)
+
+    def user_prompt(self, text: str) -> str:
+        return self.user_template.format(text=text)
+
+    def fit(self, text: str) -> List[str]:
+        """
+        The text as pieces that each fit the budget: usually just [text].
+        """
+        # A token is at least one byte, so short texts need no counting
+        if len(text.encode("utf-8")) <= self.max_text_tokens:
+            return [text]
+        pieces = split_to_budget(text, self.max_text_tokens)
+        if len(pieces) == 1:
+            return pieces
+
+        metrics.inc(
+            "oversize_prompts_total",
+            help_text="Texts too long for one LLM call, split or truncated.",
+            policy=self.oversize,
+        )
+        if self.oversize == "truncate":
+            dropped = count_tokens(text[len(pieces[0]) :])
+            logger.warning("Truncating a text to %d tokens, dropping ~%d", self.max_text_tokens, dropped)
+            metrics.inc(
+                "prompt_tokens_truncated_total",
+                dropped,
+                help_text="Tokens cut from texts too long for one LLM call.",
+            )
+            return pieces[:1]
+        logger.info("Splitting a text over %d tokens into %d calls", self.max_text_tokens, len(pieces))
+        return pieces
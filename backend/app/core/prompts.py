@@ -1,6 +1,11 @@
-CLEAN_TEXT_SYSTEM_PROMPT = "You are a helpful editor. Your task is to clean the provided text while preserving its original meaning and language."
-CLEAN_TEXT_USER_PROMPT_TEMPLATE = """
-Please clean the following text.
+# Clean / summarize prompts are laid out for prefix caching (provider or vLLM):
+# everything static, instructions and examples, is in the system message, which
+# is identical for every call, and the user message only carries the text.
+# See app.core.prompt_builder.
+
+CLEAN_TEXT_SYSTEM_PROMPT = """You are a helpful editor. Your task is to clean the provided text while preserving its original meaning and language.
+
+Please clean the text in the user message.
 1. Fix grammar and spelling errors.
 2. Remove irrelevant noise, such as page numbers, headers, footers, or random characters.
 3. Ensure the text is coherent and flows well.
@@ -34,14 +39,14 @@ Output:
 <cleaned_text>
 这是一个简单的文本，有一些错误。
 </cleaned_text>
-
-Text:
+"""
+CLEAN_TEXT_USER_PROMPT_TEMPLATE = """Text:
 {text}
 """
 
-SUMMARIZE_TEXT_SYSTEM_PROMPT = "You are a helpful summarizer. Your task is to provide a concise summary of the text in the same language as the original text."
-SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE = """
-Please provide a concise summary of the following text.
+SUMMARIZE_TEXT_SYSTEM_PROMPT = """You are a helpful summarizer. Your task is to provide a concise summary of the text in the same language as the original text.
+
+Please provide a concise summary of the text in the user message.
 1. Capture the main points and key ideas.
 2. Keep the summary brief and to the point.
 3. **CRITICAL**: Output the summary in the SAME LANGUAGE as the original text.
@@ -73,8 +78,8 @@ Output:
 <summary>
 人工智能是机器智能，通过感知环境并采取行动来实现目标，区别于自然智能。
 </summary>
-
-Text:
+"""
+SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE = """Text:
 {text}
 """
 
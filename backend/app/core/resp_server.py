@@ -0,0 +1,221 @@
+"""
+A small in-memory server speaking the Redis protocol, implementing the
+commands the shared store needs (GET, SET with NX/PX/EX, DEL, RPUSH, LPOP,
+BLPOP, PING, SELECT, AUTH). It stands in for Redis in tests and local
+multi-worker setups:
+
+    python -m app.core.resp_server --port 6379
+    SHARED_STORE_URL=redis://127.0.0.1:6379/0 uvicorn app.main:app --workers 4
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b"+OK\r\n" if value else b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespServer:
+    """
+    Runs the server on its own event loop in a background thread.
+
+        with RespServer() as server:
+            os.environ["SHARED_STORE_URL"] = server.url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._values: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._lists: Dict[bytes, Deque[bytes]] = {}
+        self._waiters: Dict[bytes, Deque[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start(started))
+            try:
+                self._loop.run_forever()
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        if not started.wait(10):
+            raise RuntimeError("RESP server failed to start")
+
+    async def _start(self, started: threading.Event):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        started.set()
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+            # Drop the connections still open
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                try:
+                    reply = await self._execute(args)
+                except Exception as e:
+                    reply = e
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def _execute(self, args: List[bytes]):
+        name = args[0].upper()
+        if name == b"PING":
+            return True if len(args) == 1 else args[1]
+        if name in (b"SELECT", b"AUTH"):
+            return True
+        if name == b"GET":
+            return self._get(args[1])
+        if name == b"SET":
+            key, value = args[1], args[2]
+            options = [arg.upper() for arg in args[3:]]
+            expires = None
+            for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+                if unit in options:
+                    expires = time.monotonic() + int(options[options.index(unit) + 1]) / scale
+            if b"NX" in options and self._get(key) is not None:
+                return None
+            self._values[key] = (value, expires)
+            return True
+        if name == b"DEL":
+            return sum(
+                self._values.pop(key, None) is not None or self._lists.pop(key, None) is not None
+                for key in args[1:]
+            )
+        if name == b"RPUSH":
+            key = args[1]
+            items = self._lists.setdefault(key, deque())
+            for value in args[2:]:
+                # Hand the item straight to a blocked BLPOP if there is one
+                waiters = self._waiters.get(key)
+                while waiters and waiters[0].done():
+                    waiters.popleft()
+                if waiters:
+                    waiters.popleft().set_result((key, value))
+                else:
+                    items.append(value)
+            length = len(items)
+            if not items:
+                del self._lists[key]
+            return length
+        if name == b"LPOP":
+            return self._pop(args[1])
+        if name == b"BLPOP":
+            keys, timeout = args[1:-1], float(args[-1])
+            for key in keys:
+                value = self._pop(key)
+                if value is not None:
+                    return [key, value]
+            future = asyncio.get_running_loop().create_future()
+            for key in keys:
+                self._waiters.setdefault(key, deque()).append(future)
+            try:
+                key, value = await asyncio.wait_for(future, timeout or None)
+                return [key, value]
+            except asyncio.TimeoutError:
+                return None
+        raise ValueError(f"unknown command '{name.decode()}'")
+
+    def _pop(self, key: bytes) -> Optional[bytes]:
+        items = self._lists.get(key)
+        if not items:
+            return None
+        value = items.popleft()
+        if not items:
+            del self._lists[key]
+        return value
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the in-memory Redis protocol stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(RespServer(args.host, args.port).serve())
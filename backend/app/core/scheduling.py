@@ -0,0 +1,329 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Hashable, Iterator, Optional
+from dotenv import load_dotenv
+from app.core.metrics import metrics
+from app.core.profiling import stage
+from app.core.shared_store import ClusterSemaphore, SharedStoreError, shared_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """
+    A concurrency limiter that shares its slots fairly between keys.
+
+    Behaves like an asyncio.Semaphore(limit), but when slots are contended the
+    waiting keys (e.g. documents of a batch) are served round-robin, so one large
+    document can't starve the others.
+
+        async with scheduler.slot("report.pdf"):
+            ...
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    def waiting_by_key(self) -> Dict[Hashable, int]:
+        return {key: len(queue) for key, queue in self._waiters.items()}
+
+    async def acquire(self, key: Hashable = None):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before cancellation; pass it on
+                self.release()
+            else:
+                self._remove_waiter(key, future)
+            raise
+
+    def release(self):
+        # Hand the slot directly to the next key in round-robin order
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove_waiter(self, key: Hashable, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            return
+        if not queue:
+            del self._waiters[key]
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable = None):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)  # Served in this order
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised by `PriorityScheduler.admit` when the backlog is over its limits.
+    `retry_after` is the estimated wait in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PriorityScheduler(FairScheduler):
+    """
+    A FairScheduler with an interactive and a bulk class of work.
+
+    Waiting interactive calls (a single chunk action clicked in the UI) are
+    always served before bulk ones, and `reserved` slots are never given to
+    bulk work, so an interactive call doesn't wait behind a long bulk run.
+    Within a class, keys (clients) are served round-robin.
+
+    `admit()` implements admission control: it rejects new work early when its
+    class already has `max_queued` calls waiting or the estimated wait exceeds
+    `max_wait` seconds (0 = no limit).
+
+    With a `cluster` semaphore, each slot also takes one of the cluster-wide
+    slots, capping concurrency across all replicas. Calls handed to the work
+    queue instead of taking a slot here (distributed mode) are counted as
+    waiting while they are `offloaded`, so admission control sees them too.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        reserved: int = 1,
+        max_queued: Optional[Dict[str, int]] = None,
+        max_wait: float = 0.0,
+        cluster: Optional[ClusterSemaphore] = None,
+        name: str = "scheduler",
+    ):
+        super().__init__(limit)
+        self.cluster = cluster
+        self.name = name  # Used in profiles: "<name>_queue_wait"
+        self.reserved = min(max(0, reserved), self.limit - 1)
+        self.max_queued = max_queued or {}
+        self.max_wait = max_wait
+        self.active_by_priority = {priority: 0 for priority in PRIORITIES}
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._offloaded = {priority: 0 for priority in PRIORITIES}
+        self._service_time: Optional[float] = None  # EWMA of slot hold times
+
+    @property
+    def waiting(self) -> int:
+        return sum(self.waiting_for(priority) for priority in PRIORITIES)
+
+    def waiting_for(self, priority: str) -> int:
+        return sum(len(queue) for queue in self._queues[priority].values()) + self._offloaded[priority]
+
+    def waiting_by_key(self) -> Dict[Hashable, int]:
+        counts: Dict[Hashable, int] = {}
+        for waiters in self._queues.values():
+            for key, queue in waiters.items():
+                counts[key] = counts.get(key, 0) + len(queue)
+        return counts
+
+    def _capacity(self, priority: str) -> int:
+        return self.limit if priority == INTERACTIVE else self.limit - self.reserved
+
+    def estimated_wait(self, priority: str = BULK, calls: int = 0) -> float:
+        """
+        Rough time in seconds until `calls` new calls of `priority` have all
+        started, from the backlog ahead of them and the average call duration.
+        """
+        if not self._service_time:
+            return 0.0
+        ahead = self.waiting_for(INTERACTIVE)
+        if priority == BULK:
+            ahead += self.waiting_for(BULK)
+        rounds = math.ceil((ahead + calls) / self._capacity(priority))
+        if self.active < self.limit:
+            rounds = max(0, rounds - 1)
+        return rounds * self._service_time
+
+    def admit(self, priority: str = BULK, calls: int = 1) -> float:
+        """
+        Check whether `calls` new calls of `priority` may be queued; raises
+        AdmissionRejected if not. Returns the estimated wait in seconds.
+        """
+        wait = self.estimated_wait(priority, calls)
+        queued = self.waiting_for(priority)
+        max_queued = self.max_queued.get(priority, 0)
+        reason = None
+        if max_queued and queued and queued + calls > max_queued:
+            reason = f"Too many queued {priority} calls ({queued} waiting)"
+        elif self.max_wait and wait > self.max_wait:
+            reason = f"Estimated wait for {priority} work is {wait:.0f}s"
+        if reason:
+            metrics.inc(
+                "admission_rejected_total",
+                help_text="Requests rejected by admission control.",
+                priority=priority,
+            )
+            raise AdmissionRejected(reason, wait)
+        return wait
+
+    async def acquire(self, key: Hashable = None, priority: str = BULK):
+        # Always queue then dispatch, so new calls can't overtake waiting ones
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(key, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            else:
+                self._remove_waiter(key, future, priority)
+            raise
+
+    def release(self, priority: str = BULK):
+        self.active -= 1
+        self.active_by_priority[priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.limit:
+            for priority in PRIORITIES:
+                waiters = self._queues[priority]
+                if waiters and self.active_by_priority[priority] < self._capacity(priority):
+                    break
+            else:
+                return
+            key, queue = next(iter(waiters.items()))
+            future = queue.popleft()
+            if queue:
+                waiters.move_to_end(key)
+            else:
+                del waiters[key]
+            if not future.done():
+                self.active += 1
+                self.active_by_priority[priority] += 1
+                future.set_result(None)
+
+    def _remove_waiter(self, key: Hashable, future: asyncio.Future, priority: str = BULK):
+        waiters = self._queues[priority]
+        queue = waiters.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            return
+        if not queue:
+            del waiters[key]
+
+    @contextmanager
+    def offloaded(self, priority: str = BULK) -> Iterator[None]:
+        """
+        Count a call submitted to the work queue as waiting until it is done.
+        """
+        self._offloaded[priority] += 1
+        try:
+            yield
+        finally:
+            self._offloaded[priority] -= 1
+
+    def _observe(self, elapsed: float):
+        if self._service_time is None:
+            self._service_time = elapsed
+        else:
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable = None, priority: str = BULK):
+        with stage(f"{self.name}_queue_wait"):
+            await self.acquire(key, priority)
+        lease = None
+        try:
+            if self.cluster is not None:
+                with stage(f"{self.name}_queue_wait"):
+                    lease = await self.cluster.acquire()
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                self._observe(time.monotonic() - start)
+        finally:
+            if lease is not None:
+                try:
+                    await self.cluster.release(lease)
+                except SharedStoreError as e:
+                    # The lease expires on its own
+                    logger.warning("Could not release cluster slot: %s", e)
+            self.release(priority)
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _cluster_semaphore(name: str, limit_env: str) -> Optional[ClusterSemaphore]:
+    """
+    Cluster-wide cap for distributed mode (0 or no shared store = none).
+    """
+    limit = _int_env(limit_env, 0)
+    if shared_store is None or limit <= 0:
+        return None
+    return ClusterSemaphore(
+        shared_store, name, limit, lease=float(os.getenv("SHARED_TASK_TIMEOUT", 600))
+    )
+
+
+# Process-wide schedulers in front of the LLM and VLM clients
+llm_scheduler = PriorityScheduler(
+    _int_env("LLM_CONCURRENCY_LIMIT", 5),
+    reserved=_int_env("LLM_INTERACTIVE_RESERVED_SLOTS", 1),
+    max_queued={
+        INTERACTIVE: _int_env("LLM_MAX_QUEUED_INTERACTIVE", 100),
+        BULK: _int_env("LLM_MAX_QUEUED_BULK", 20000),
+    },
+    max_wait=float(os.getenv("LLM_MAX_ESTIMATED_WAIT", 0)),
+    cluster=_cluster_semaphore("llm", "LLM_CLUSTER_CONCURRENCY_LIMIT"),
+    name="llm",
+)
+vlm_scheduler = PriorityScheduler(
+    _int_env("VLM_CONCURRENCY_LIMIT", 5),
+    reserved=_int_env("VLM_INTERACTIVE_RESERVED_SLOTS", 0),
+    max_queued={BULK: _int_env("VLM_MAX_QUEUED_BULK", 0)},
+    max_wait=float(os.getenv("VLM_MAX_ESTIMATED_WAIT", 0)),
+    cluster=_cluster_semaphore("vlm", "VLM_CLUSTER_CONCURRENCY_LIMIT"),
+    name="vlm",
+)
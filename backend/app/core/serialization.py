@@ -0,0 +1,31 @@
+import json
+from typing import Any
+
+# orjson is an optional dependency (`pip install .[fast]`); fall back to the stdlib encoder.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON bytes, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def sse_event(obj: Any) -> bytes:
+    """
+    Encode one Server-Sent Event carrying `obj` as JSON.
+    """
+    return b"data: " + dumps(obj) + b"\n\n"
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """
+    Encode one newline-delimited JSON record.
+    """
+    return dumps(obj) + b"\n"
@@ -0,0 +1,334 @@
+import os
+import time
+import random
+import socket
+import sqlite3
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SharedStoreError(Exception):
+    """
+    Raised when the shared store can't be reached or rejects a command.
+    """
+
+
+class SharedStore(ABC):
+    """
+    The little state replicas share in distributed mode: a key/value cache
+    with expiry, FIFO queues with blocking pops, and leased locks.
+
+    Methods are blocking; async code calls them in an executor.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def push(self, queue: str, value: bytes): ...
+
+    @abstractmethod
+    def pop(self, queues: List[str], timeout: float) -> Optional[Tuple[str, bytes]]:
+        """
+        Pop the oldest item of the first non-empty queue, waiting up to
+        `timeout` seconds. Returns (queue, item), or None on timeout.
+        """
+
+    @abstractmethod
+    def try_lock(self, key: str, holder: str, ttl: float) -> bool:
+        """
+        Take the lock if it is free or its lease expired.
+        """
+
+    @abstractmethod
+    def unlock(self, key: str, holder: str): ...
+
+
+class SQLiteStore(SharedStore):
+    """
+    Shared store in one SQLite file, for several worker processes on one
+    host (or pods sharing a volume that supports file locking).
+    """
+
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # executescript manages its own transaction
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL);
+            CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, value BLOB);
+            CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id);
+            CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, holder TEXT, expires REAL);
+            """
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None),
+            )
+            # Expired entries are purged now and then
+            if random.random() < 0.01:
+                db.execute("DELETE FROM kv WHERE expires <= ?", (now,))
+
+    def delete(self, key: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def push(self, queue: str, value: bytes):
+        with self._transaction() as db:
+            db.execute("INSERT INTO queue (name, value) VALUES (?, ?)", (queue, value))
+
+    def pop(self, queues: List[str], timeout: float) -> Optional[Tuple[str, bytes]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._transaction() as db:
+                for queue in queues:
+                    row = db.execute(
+                        "SELECT id, value FROM queue WHERE name = ? ORDER BY id LIMIT 1", (queue,)
+                    ).fetchone()
+                    if row:
+                        db.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+                        return queue, row[1]
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def try_lock(self, key: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT expires FROM locks WHERE key = ?", (key,)).fetchone()
+            if row and row[0] > now:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO locks (key, holder, expires) VALUES (?, ?, ?)",
+                (key, holder, now + ttl),
+            )
+            return True
+
+    def unlock(self, key: str, holder: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM locks WHERE key = ? AND holder = ?", (key, holder))
+
+
+class RespConnection:
+    """
+    Minimal client for the Redis serialization protocol (RESP2), enough for
+    the commands RedisStore uses.
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None):
+        self.host, self.port, self.db, self.password = host, port, db, password
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=30)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", str(self.db))
+
+    def close(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = None
+
+    def command(self, *args):
+        # Reconnect once, e.g. after the server restarted
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._call(*args)
+            except (OSError, EOFError) as e:
+                self.close()
+                if attempt:
+                    raise SharedStoreError(f"Shared store at {self.host}:{self.port} unavailable: {e}")
+
+    def _call(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise EOFError("Connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise SharedStoreError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise SharedStoreError(f"Unexpected reply: {line!r}")
+
+
+class RedisStore(SharedStore):
+    """
+    Shared store on a Redis-compatible server (Redis, Valkey, or the local
+    stand-in in app.core.resp_server).
+    """
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self._local = threading.local()
+
+    def _connection(self) -> RespConnection:
+        # One connection per thread: a blocking pop must not hold up other commands
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = RespConnection(self.host, self.port, self.db, self.password)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._connection().command("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl:
+            self._connection().command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._connection().command("SET", key, value)
+
+    def delete(self, key: str):
+        self._connection().command("DEL", key)
+
+    def push(self, queue: str, value: bytes):
+        self._connection().command("RPUSH", queue, value)
+
+    def pop(self, queues: List[str], timeout: float) -> Optional[Tuple[str, bytes]]:
+        reply = self._connection().command("BLPOP", *queues, f"{timeout:.3f}")
+        if reply is None:
+            return None
+        return reply[0].decode("utf-8"), reply[1]
+
+    def try_lock(self, key: str, holder: str, ttl: float) -> bool:
+        return self._connection().command("SET", key, holder, "NX", "PX", int(ttl * 1000)) == "OK"
+
+    def unlock(self, key: str, holder: str):
+        # Not atomic, but a lease only changes holder after it has expired
+        if self._connection().command("GET", key) == holder.encode("utf-8"):
+            self._connection().command("DEL", key)
+
+
+def create_shared_store(url: Optional[str]) -> Optional[SharedStore]:
+    """
+    Store for a SHARED_STORE_URL: sqlite:///path/to/file.db or
+    redis://[:password@]host[:port][/db]. None (single process mode) if unset.
+    """
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///") :])
+    if url.startswith("redis://"):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported SHARED_STORE_URL: {url}")
+
+
+class ClusterSemaphore:
+    """
+    A concurrency cap shared by all replicas: `limit` leased lock keys in the
+    shared store. A replica that dies without releasing only holds its slot
+    until the lease expires.
+    """
+
+    def __init__(self, store: SharedStore, name: str, limit: int, lease: float = 300.0):
+        self.store = store
+        self.name = name
+        self.limit = max(1, limit)
+        self.lease = lease
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+    async def acquire(self) -> str:
+        loop = asyncio.get_running_loop()
+        delay = 0.01
+        while True:
+            keys = [f"slots:{self.name}:{i}" for i in range(self.limit)]
+            random.shuffle(keys)
+            for key in keys:
+                holder = f"{self.holder}:{random.getrandbits(32):08x}"
+                if await loop.run_in_executor(None, self.store.try_lock, key, holder, self.lease):
+                    return f"{key} {holder}"
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def release(self, lease: str):
+        key, holder = lease.split(" ", 1)
+        await asyncio.get_running_loop().run_in_executor(None, self.store.unlock, key, holder)
+
+    @asynccontextmanager
+    async def slot(self):
+        lease = await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release(lease)
+
+
+# Process-wide shared store; None unless distributed mode is configured
+shared_store = create_shared_store(os.getenv("SHARED_STORE_URL"))
@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar, Union
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+
+def flight_key(*parts: Union[str, bytes]) -> str:
+    """
+    Digest of the parts that identify a computation (content, prompt, options...).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async computations: while a computation for
+    a key is in flight, later callers with the same key wait for its result
+    instead of starting their own.
+
+    The computation runs as its own task, so one caller going away (e.g. a
+    client disconnecting) doesn't cancel it for the others; it is only
+    cancelled once nobody is waiting for it. Callers share the result object,
+    so it must not be mutated afterwards.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        result, _ = await self.join(key, func)
+        return result
+
+    async def join(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Like `do`, also telling whether the result was shared from another
+        caller's computation rather than computed for this one.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._done(key, call))
+        else:
+            metrics.inc(
+                "coalesced_calls_total",
+                help_text="Calls that shared an identical in-flight computation.",
+                kind=self.name,
+            )
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _done(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            call.task.exception()
+
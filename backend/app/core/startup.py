@@ -0,0 +1,26 @@
+import time
+import logging
+import importlib
+from app.core.tokenizer import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules imported lazily by the services; warmed once at startup instead
+HEAVY_MODULES = ("openai", "numpy", "fitz")
+
+
+def warm_up() -> float:
+    """
+    Import the heavy dependencies and load the tokenizer, so the first request
+    doesn't pay for them. Returns the elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    for module in HEAVY_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning("Could not import %s during warm-up: %s", module, e)
+    get_tokenizer()
+    elapsed = time.perf_counter() - start
+    logger.info("Warm-up finished in %.0f ms", elapsed * 1000)
+    return elapsed
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import contextvars
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def run_in_thread(func: Callable[..., T], *args) -> T:
+    """
+    Run a blocking call in an executor thread, in a copy of the caller's
+    context, so what it logs carries the caller's log context.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, contextvars.copy_context().run, func, *args)
+
+
+async def iterate_in_thread(func: Callable[..., Iterator[T]], *args) -> AsyncIterator[T]:
+    """
+    Consume a blocking iterator (e.g. a streamed completion from the synchronous
+    OpenAI client) in an executor thread, yielding its items on the event loop
+    as they are produced.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in func(*args):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, e))
+            return
+        loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+    future = loop.run_in_executor(None, contextvars.copy_context().run, run)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Let the thread finish early if the consumer stopped iterating
+        stop.set()
+        await asyncio.shield(future)
@@ -0,0 +1,249 @@
+import re
+from typing import List, Optional, Tuple
+
+# The XML-like tags our prompts ask the models to emit (see app/core/prompts.py)
+ROOT_TAG = "processed_content"
+KNOWN_TAGS = (ROOT_TAG, "text", "figure_caption", "cleaned_text", "summary")
+
+TAG_RE = re.compile(r"<(/?)(" + "|".join(KNOWN_TAGS) + r")>")
+CLOSE_TAGS = {tag: f"</{tag}>" for tag in KNOWN_TAGS}
+ALL_TAG_TOKENS = tuple(f"<{tag}>" for tag in KNOWN_TAGS) + tuple(CLOSE_TAGS.values())
+MAX_TAG_LENGTH = max(len(token) for token in ALL_TAG_TOKENS)
+EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+
+# (kind, tag, text): kind is "open", "data" or "close"; tag is the enclosing
+# element for "data" (None outside of any element)
+TagEvent = Tuple[str, Optional[str], str]
+
+
+class TagParser:
+    """
+    Single-pass, incremental parser for the tag family above.
+
+    Text can be fed in arbitrary pieces (e.g. streamed completion deltas); a
+    piece ending in what may be the start of a tag is held back until the next
+    feed. Tags other than the root don't nest: inside an element, only its own
+    closing tag is recognized and everything else is data. Unclosed elements
+    (truncated output) are closed by `close()`.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self.current: Optional[str] = None  # Innermost open element
+        self._in_root = False
+
+    def feed(self, data: str) -> List[TagEvent]:
+        buffer = self._buffer + data if self._buffer else data
+        events: List[TagEvent] = []
+        append = events.append
+        pos = 0
+        end = len(buffer)
+
+        while pos < end:
+            current = self.current
+            if current is not None:
+                # Inside an element only its own closing tag matters: plain find
+                close_tag = CLOSE_TAGS[current]
+                idx = buffer.find(close_tag, pos)
+                if idx == -1:
+                    break
+                if idx > pos:
+                    append(("data", current, buffer[pos:idx]))
+                append(("close", current, ""))
+                self.current = None
+                pos = idx + len(close_tag)
+                continue
+
+            match = TAG_RE.search(buffer, pos)
+            if match is None:
+                break
+            closing, tag = match.group(1), match.group(2)
+            if closing and not (tag == ROOT_TAG and self._in_root):
+                # Stray closing tag: literal text
+                append(("data", None, buffer[pos : match.end()]))
+                pos = match.end()
+                continue
+            if match.start() > pos:
+                append(("data", None, buffer[pos : match.start()]))
+            if closing:
+                append(("close", tag, ""))
+                self._in_root = False
+            else:
+                append(("open", tag, ""))
+                if tag == ROOT_TAG:
+                    self._in_root = True
+                else:
+                    self.current = tag
+            pos = match.end()
+
+        # Hold back a trailing partial tag such as "</clea"
+        self._buffer = ""
+        if pos < end:
+            tail_start = buffer.rfind("<", pos)
+            if tail_start != -1 and end - tail_start < MAX_TAG_LENGTH:
+                tail = buffer[tail_start:]
+                if any(t.startswith(tail) for t in self._candidate_tags()):
+                    self._buffer = tail
+                    end = tail_start
+            if end > pos:
+                append(("data", self.current, buffer[pos:end]))
+        return events
+
+    def _candidate_tags(self):
+        if self.current is not None:
+            return (CLOSE_TAGS[self.current],)
+        return ALL_TAG_TOKENS
+
+    def close(self) -> List[TagEvent]:
+        """
+        Flush held-back text and close any element left open.
+        """
+        events: List[TagEvent] = []
+        if self._buffer:
+            events.append(("data", self.current, self._buffer))
+            self._buffer = ""
+        if self.current is not None:
+            events.append(("close", self.current, ""))
+            self.current = None
+        if self._in_root:
+            events.append(("close", ROOT_TAG, ""))
+            self._in_root = False
+        return events
+
+
+def parse(text: str) -> List[TagEvent]:
+    parser = TagParser()
+    return parser.feed(text) + parser.close()
+
+
+def extract_tag(text: str, tag: str) -> str:
+    """
+    Content of the first `tag` element (even if unclosed), or the whole text if
+    the tag is absent.
+    """
+    parts: List[str] = []
+    found = False
+    for kind, event_tag, data in parse(text):
+        if event_tag != tag:
+            continue
+        if kind == "open":
+            found = True
+        elif kind == "data" and found:
+            parts.append(data)
+        elif kind == "close" and found:
+            break
+    if not found:
+        return text.strip()
+    return "".join(parts).strip()
+
+
+def render_vlm_output(text: str) -> str:
+    """
+    Convert the VLM's XML-like page output to plain text:
+    <text>content</text> -> content
+    <figure_caption>content</figure_caption> -> [Image: content]
+    Text outside of elements is kept; whitespace right inside the root tag is dropped.
+    """
+    out: List[str] = []
+    element: List[str] = []
+    after_root_open = False
+    last_was_data = False  # Whether out[-1] is text from outside any element
+    for kind, tag, data in parse(text):
+        if kind == "open":
+            after_root_open = tag == ROOT_TAG
+            element = []
+            continue
+        if kind == "data":
+            if tag is None:
+                if after_root_open:
+                    data = data.lstrip()
+                out.append(data)
+                last_was_data = True
+            else:
+                element.append(data)
+            after_root_open = False
+            continue
+        after_root_open = False
+        if tag == ROOT_TAG:
+            if last_was_data:
+                out[-1] = out[-1].rstrip()
+        elif tag == "figure_caption":
+            out.append(f"[Image: {''.join(element).strip()}]\n\n")
+            last_was_data = False
+        else:
+            out.append("".join(element).strip() + "\n\n")
+            last_was_data = False
+    return EXTRA_NEWLINES_RE.sub("\n\n", "".join(out)).strip()
+
+
+class TagContentStream:
+    """
+    Incrementally extract the content of one tag from a streamed completion,
+    e.g. the <cleaned_text> of an LLM answer, returning new content per piece.
+    Leading whitespace of the element is dropped; the final value should still
+    be taken from `extract_tag` on the full text.
+    """
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self._parser = TagParser()
+        self._started = False
+        self._done = False
+
+    def feed(self, piece: str) -> str:
+        return self._collect(self._parser.feed(piece))
+
+    def close(self) -> str:
+        return self._collect(self._parser.close())
+
+    def _collect(self, events: List[TagEvent]) -> str:
+        out = []
+        for kind, tag, data in events:
+            if self._done or tag != self.tag:
+                continue
+            if kind == "close":
+                self._done = True
+            elif kind == "data":
+                if not self._started:
+                    data = data.lstrip()
+                    self._started = bool(data)
+                out.append(data)
+        return "".join(out)
+
+
+class VLMOutputStream:
+    """
+    Incrementally render streamed VLM page output to plain text deltas, in the
+    same shape as `render_vlm_output` (whitespace is only normalized by the
+    final, non-incremental rendering).
+    """
+
+    def __init__(self):
+        self._parser = TagParser()
+        self._strip_leading = False
+
+    def feed(self, piece: str) -> str:
+        return self._render(self._parser.feed(piece))
+
+    def close(self) -> str:
+        return self._render(self._parser.close())
+
+    def _render(self, events: List[TagEvent]) -> str:
+        out = []
+        for kind, tag, data in events:
+            if kind == "open":
+                if tag == "figure_caption":
+                    out.append("[Image: ")
+                self._strip_leading = tag != ROOT_TAG
+            elif kind == "data":
+                if tag is None:
+                    continue  # Whitespace between elements
+                if self._strip_leading:
+                    data = data.lstrip()
+                    self._strip_leading = not data
+                out.append(data)
+            elif tag == "figure_caption":
+                out.append("]\n\n")
+            elif tag != ROOT_TAG:
+                out.append("\n\n")
+        return "".join(out)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Where tiktoken looks up its BPE files; bundled with the app so no download is
+# needed at runtime (populated at image build time, see Dockerfile)
+DEFAULT_CACHE_DIR = str(Path(__file__).resolve().parents[2] / "tiktoken_cache")
+
+ENCODING_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "o200k_base": "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+}
+
+
+def _cache_dir() -> str:
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return os.environ["TIKTOKEN_CACHE_DIR"]
+
+
+def seed_cache(bpe_file: str, encoding: str = TOKENIZER_ENCODING) -> str:
+    """
+    Copy a local .tiktoken file to the path tiktoken's cache expects for `encoding`,
+    so it is never downloaded (air-gapped deployments).
+    """
+    url = ENCODING_URLS[encoding]
+    cache_dir = _cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    target = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+    shutil.copyfile(bpe_file, target)
+    return target
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """
+    Load the tiktoken encoding once per process. Returns None if it is unavailable,
+    in which case token counts are estimated.
+    """
+    _cache_dir()
+    bpe_file = os.getenv("TIKTOKEN_BPE_FILE")
+    try:
+        if bpe_file:
+            seed_cache(bpe_file)
+        import tiktoken
+
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.error(
+            "Could not load tokenizer %s, token counts will be estimated "
+            "(pre-seed it with `python -m app.core.tokenizer` or TIKTOKEN_BPE_FILE): %s",
+            TOKENIZER_ENCODING,
+            e,
+        )
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate: ~4 characters per token for ASCII, ~1 token per other character.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer:
+        return len(tokenizer.encode(text))
+    return estimate_tokens(text)
+
+
+if __name__ == "__main__":
+    # Pre-seed the bundled cache: downloads the encoding, or copies the given file
+    import sys
+
+    if len(sys.argv) > 1:
+        print(f"Seeded {seed_cache(sys.argv[1])}")
+    else:
+        _cache_dir()
+        import tiktoken
+
+        tiktoken.get_encoding(TOKENIZER_ENCODING)
+        print(f"Cached {TOKENIZER_ENCODING} in {os.environ['TIKTOKEN_CACHE_DIR']}")
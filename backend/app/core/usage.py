@@ -0,0 +1,148 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+from app.core.metrics import metrics
+from app.schemas.process import TokenUsage, UsageReport
+
+USAGE_KINDS = ("llm", "vlm", "embedding")
+
+
+def _price(kind: str, token_type: str, default: float = 0.0) -> float:
+    """
+    Price per 1K tokens, e.g. LLM_PROMPT_PRICE_PER_1K or VLM_COMPLETION_PRICE_PER_1K.
+    """
+    try:
+        return float(os.getenv(f"{kind.upper()}_{token_type}_PRICE_PER_1K") or default)
+    except ValueError:
+        return default
+
+
+class UsageTracker:
+    """
+    Thread-safe accumulator for the `usage` block returned by OpenAI-compatible APIs.
+    Clients record into it from executor threads; services read a report at the end.
+    Every record is also exported to the process-wide metrics registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[str, TokenUsage] = {kind: TokenUsage() for kind in USAGE_KINDS}
+        self._shared = False
+
+    def record(
+        self,
+        kind: str,
+        model: str,
+        usage: Optional[Any],
+        image_count: int = 0,
+    ):
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        total_tokens = int(
+            getattr(usage, "total_tokens", 0) or (prompt_tokens + completion_tokens)
+        )
+        # Prompt prefix reused from the provider's cache, usually billed at a discount
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = min(prompt_tokens, int(getattr(details, "cached_tokens", 0) or 0))
+        prompt_price = _price(kind, "PROMPT")
+        cost = (
+            (prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * _price(kind, "CACHED_PROMPT", prompt_price)
+            + completion_tokens * _price(kind, "COMPLETION")
+        ) / 1000
+
+        with self._lock:
+            entry = self._usage[kind]
+            entry.requests += 1
+            entry.prompt_tokens += prompt_tokens
+            entry.cached_prompt_tokens += cached_tokens
+            entry.completion_tokens += completion_tokens
+            entry.total_tokens += total_tokens
+            entry.image_count += image_count
+            entry.estimated_cost += cost
+
+        metrics.inc(
+            "model_requests_total",
+            help_text="Number of calls to model backends.",
+            client=kind,
+            model=model,
+        )
+        metrics.inc(
+            "model_tokens_total",
+            prompt_tokens,
+            help_text="Tokens consumed by model backends.",
+            client=kind,
+            model=model,
+            type="prompt",
+        )
+        if cached_tokens:
+            metrics.inc(
+                "model_cached_prompt_tokens_total",
+                cached_tokens,
+                help_text="Prompt tokens served from the provider's prefix cache.",
+                client=kind,
+                model=model,
+            )
+        metrics.inc(
+            "model_tokens_total",
+            completion_tokens,
+            client=kind,
+            model=model,
+            type="completion",
+        )
+        if image_count:
+            metrics.inc(
+                "model_images_total",
+                image_count,
+                help_text="Images sent to vision models.",
+                client=kind,
+                model=model,
+            )
+        if cost:
+            metrics.inc(
+                "model_cost_total",
+                cost,
+                help_text="Estimated cost of model calls.",
+                client=kind,
+                model=model,
+            )
+
+    def add(self, kind: str, usage: TokenUsage):
+        """
+        Add usage already recorded elsewhere (another tracker, another replica),
+        without counting it in this process's metrics again.
+        """
+        with self._lock:
+            entry = self._usage[kind]
+            for field in TokenUsage.model_fields:
+                setattr(entry, field, getattr(entry, field) + getattr(usage, field))
+
+    def mark_shared(self):
+        """
+        Note that some of the work was shared from an identical call in flight,
+        whose usage is recorded by the caller that made it.
+        """
+        self._shared = True
+
+    def report(self) -> UsageReport:
+        with self._lock:
+            usage = {kind: entry.model_copy() for kind, entry in self._usage.items()}
+        return UsageReport(
+            **usage,
+            total_tokens=sum(entry.total_tokens for entry in usage.values()),
+            estimated_cost=sum(entry.estimated_cost for entry in usage.values()),
+            shared=self._shared,
+        )
+
+
+def combine_reports(*reports: UsageReport) -> UsageReport:
+    """
+    Sum several usage reports, e.g. of the parsing and processing stages.
+    """
+    combined = UsageTracker()
+    for report in reports:
+        for kind in USAGE_KINDS:
+            combined.add(kind, getattr(report, kind))
+        if report.shared:
+            combined.mark_shared()
+    return combined.report()
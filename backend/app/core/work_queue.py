@@ -0,0 +1,193 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from app.core.log import current_log_context, log_context
+from app.core.shared_store import SharedStore, SharedStoreError, shared_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# handler(payload) -> result; both JSON-serializable
+TaskHandler = Callable[[dict], Awaitable[dict]]
+
+
+class RemoteTaskError(Exception):
+    """
+    Raised by `WorkQueue.submit` when the task failed on the replica that ran it.
+    """
+
+
+class WorkQueue:
+    """
+    Task queue shared by all replicas through the shared store.
+
+    `submit()` pushes a task onto the shared queue and waits for its result.
+    Every replica (the submitting one included) runs workers that pop tasks,
+    run the handler registered for their kind, and push the result onto the
+    submitter's reply queue. The pages and chunks of one large document are
+    thus spread over the whole cluster.
+
+    A task interrupted by a shutdown is put back on the queue; a task lost with
+    a crashed replica makes its submitter time out after `timeout` seconds.
+    """
+
+    # Blocking pops wake up at least this often, to notice a shutdown
+    POLL_TIMEOUT = 1.0
+
+    def __init__(
+        self,
+        store: SharedStore,
+        name: str = "tasks",
+        concurrency: int = 10,
+        timeout: float = 600.0,
+    ):
+        self.store = store
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.node_id = uuid.uuid4().hex
+        self._handlers: Dict[str, TaskHandler] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._loops: List[asyncio.Task] = []
+        self._running: Set[asyncio.Task] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopping = False
+
+    @property
+    def reply_queue(self) -> str:
+        return f"{self.name}:results:{self.node_id}"
+
+    def register(self, kind: str, handler: TaskHandler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        """
+        Start the workers on the running event loop (no-op if already started).
+        """
+        if self._loops:
+            return
+        self._stopping = False
+        # Blocking pops get their own threads, so they never hold up the default executor
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="work-queue")
+        self._loops = [
+            asyncio.ensure_future(self._fetch_tasks()),
+            asyncio.ensure_future(self._collect_results()),
+        ]
+
+    async def stop(self):
+        if not self._loops:
+            return
+        self._stopping = True
+        # The loops exit after their current pop, so no popped item is dropped
+        await asyncio.wait(self._loops, timeout=self.POLL_TIMEOUT * 3)
+        for task in self._loops + list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._loops, *self._running, return_exceptions=True)
+        self._loops = []
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def submit(self, kind: str, payload: dict) -> dict:
+        """
+        Run a task on whichever replica picks it up, and return its result.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        task_id = uuid.uuid4().hex
+        future = loop.create_future()
+        self._futures[task_id] = future
+        message = json.dumps(
+            {
+                "id": task_id,
+                "kind": kind,
+                "payload": payload,
+                "reply": self.reply_queue,
+                # So the replica running it logs the task with the submitter's request id, page...
+                "log_context": current_log_context(),
+            },
+            default=str,
+        ).encode("utf-8")
+        try:
+            await loop.run_in_executor(None, self.store.push, self.name, message)
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._futures.pop(task_id, None)
+
+    async def _pop(self, queue: str):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, self.store.pop, [queue], self.POLL_TIMEOUT
+            )
+        except SharedStoreError as e:
+            logger.warning("Shared store unavailable, retrying: %s", e)
+            await asyncio.sleep(self.POLL_TIMEOUT)
+            return None
+
+    async def _fetch_tasks(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while not self._stopping:
+            await slots.acquire()
+            item = await self._pop(self.name)
+            if item is None:
+                slots.release()
+                continue
+            task = asyncio.ensure_future(self._run(item[1], slots))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, data: bytes, slots: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        try:
+            message = json.loads(data)
+            handler = self._handlers.get(message["kind"])
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler for task kind '{message['kind']}'")
+                with log_context(**message.get("log_context", {}), task=message["id"]):
+                    result = await handler(message["payload"])
+                reply = {"id": message["id"], "result": result}
+            except asyncio.CancelledError:
+                # Shutting down: leave the task to another replica
+                self.store.push(self.name, data)
+                raise
+            except Exception as e:
+                logger.error("Task %s failed: %s", message["kind"], e)
+                reply = {"id": message["id"], "error": f"{type(e).__name__}: {e}"}
+            await loop.run_in_executor(
+                None, self.store.push, message["reply"], json.dumps(reply).encode("utf-8")
+            )
+        finally:
+            slots.release()
+
+    async def _collect_results(self):
+        while not self._stopping:
+            item = await self._pop(self.reply_queue)
+            if item is None:
+                continue
+            reply = json.loads(item[1])
+            future = self._futures.get(reply["id"])
+            if future is None or future.done():
+                continue
+            if "error" in reply:
+                future.set_exception(RemoteTaskError(reply["error"]))
+            else:
+                future.set_result(reply["result"])
+
+
+# Process-wide work queue; None unless distributed mode is configured
+work_queue = (
+    WorkQueue(
+        shared_store,
+        concurrency=int(os.getenv("SHARED_WORKER_CONCURRENCY", 10)),
+        timeout=float(os.getenv("SHARED_TASK_TIMEOUT", 600)),
+    )
+    if shared_store is not None
+    else None
+)
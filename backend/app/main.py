@@ -1,12 +1,38 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from app.api.v1.api import api_router
+from app.core.log import RequestContextMiddleware, configure_logging
+from app.core.metrics import metrics
+from app.core.startup import warm_up
+from app.core.work_queue import work_queue
 
 from fastapi.middleware.cors import CORSMiddleware
 
+# JSON records through a background thread, see app.core.log
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy imports are deferred; load them once in the background of startup
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+        await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    # Distributed mode: this replica also works on tasks queued by the others
+    if work_queue is not None:
+        work_queue.start()
+    yield
+    if work_queue is not None:
+        await work_queue.stop()
+
+
 app = FastAPI(
     title="Knowledge Base Chunker API",
     description="API for chunking and processing text for RAG systems.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -16,7 +42,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Request-Id", "X-Profile-Id"],
 )
+# Outermost, so everything logged for a request carries its request_id
+app.add_middleware(RequestContextMiddleware)
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -24,3 +53,11 @@ app.include_router(api_router, prefix="/api/v1")
 @app.get("/")
 def root():
     return {"message": "Welcome to Knowledge Base Chunker API"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Export process-wide counters (token usage, cost, ...) in Prometheus format.
+    """
+    return metrics.render()
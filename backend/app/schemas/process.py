@@ -3,8 +3,9 @@ from typing import List, Optional, Literal
 
 
 class ChunkingOptions(BaseModel):
-    method: Literal["fixed_size", "semantic", "recursive"] = Field(
-        default="fixed_size", description="The chunking method to use."
+    method: Literal["fixed_size", "semantic", "recursive", "records"] = Field(
+        default="fixed_size",
+        description="The chunking method to use (records: whole CSV rows / JSON records per chunk).",
     )
     chunk_size: int = Field(
         default=500, description="The target size of each chunk (in characters)."
@@ -16,9 +17,40 @@ class ChunkingOptions(BaseModel):
         default=0.5,
         description="The similarity threshold for semantic chunking (0.0 to 1.0).",
     )
+    semantic_breakpoint: Literal["threshold", "percentile", "std_dev"] = Field(
+        default="threshold",
+        description="How semantic breakpoints are chosen: a fixed similarity threshold, "
+        "a percentile of the document's similarities, or standard deviations below their mean.",
+    )
+    semantic_breakpoint_amount: Optional[float] = Field(
+        default=None,
+        description="Percentile (default 95) or number of standard deviations (default 3) for the breakpoint.",
+    )
+    min_chunk_size: int = Field(
+        default=0,
+        description="Semantic chunking: chunks smaller than this are merged into a neighbour.",
+    )
+    embedding_backend: Optional[Literal["remote", "local"]] = Field(
+        default=None,
+        description="Semantic chunking: embeddings from the remote API or the built-in local "
+        "CPU backend (defaults to the EMBEDDING_BACKEND setting).",
+    )
+    size_unit: Literal["chars", "tokens"] = Field(
+        default="chars",
+        description="Semantic chunking: unit of chunk_size (the maximum size) and min_chunk_size.",
+    )
     separators: Optional[List[str]] = Field(
         default=None, description="List of separators for recursive chunking."
     )
+    record_format: Literal["auto", "csv", "json"] = Field(
+        default="auto",
+        description="Records chunking: csv rows, or json records (a JSON array, JSONL or "
+        "concatenated JSON values). auto detects it from the file extension or the content.",
+    )
+    repeat_header: bool = Field(
+        default=False,
+        description="Records chunking: treat the first CSV row as a header and repeat it in every chunk.",
+    )
 
 
 class ProcessingOptions(BaseModel):
@@ -28,12 +60,75 @@ class ProcessingOptions(BaseModel):
     generate_summary: bool = Field(
         default=False, description="Whether to generate a summary for each chunk."
     )
+    deduplicate: bool = Field(
+        default=False,
+        description="Whether to collapse exact and near-duplicate chunks before LLM processing.",
+    )
+    dedup_mode: Literal["fan_out", "drop"] = Field(
+        default="fan_out",
+        description="fan_out: exact duplicates reuse the representative's result, near duplicates are processed on their own; drop: duplicates (exact and near) are removed.",
+    )
+    dedup_max_distance: int = Field(
+        default=3,
+        description="Maximum SimHash bit distance for two chunks to count as near duplicates (0 = exact only).",
+    )
+    stream_tokens: bool = Field(
+        default=False,
+        description="Streaming endpoints only: also emit cleaned text / summaries token-by-token as delta events.",
+    )
+    clean_precheck: Optional[bool] = Field(
+        default=None,
+        description="Only send chunks that a local quality check finds noisy to the LLM for cleaning "
+        "(default: CLEAN_PRECHECK).",
+    )
+    clean_precheck_threshold: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=1,
+        description="Noise score (0-1) from which a chunk is cleaned (default: CLEAN_PRECHECK_THRESHOLD).",
+    )
+
+
+class ExportOptions(BaseModel):
+    format: Literal["npy", "parquet", "arrow"] = Field(
+        default="npy",
+        description="npy: embeddings.npy (float32) + chunks.jsonl; parquet / arrow: one table "
+        "with an embedding column (requires pyarrow).",
+    )
+    embed: bool = Field(default=True, description="Whether to embed the final chunks.")
+    embedding_backend: Optional[Literal["remote", "local"]] = Field(
+        default=None,
+        description="Backend used for the chunk embeddings (defaults to the EMBEDDING_BACKEND setting).",
+    )
+    batch_size: int = Field(default=256, ge=1, description="Chunks per embedding call.")
+    directory: Optional[str] = Field(
+        default=None,
+        pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]*$",
+        description="Name of the directory to write to under the server's EXPORT_ROOT, also used "
+        "as the export id (default: a new random id).",
+    )
 
 
 class ProcessRequest(BaseModel):
     text: str = Field(..., description="The input text to process.")
     chunking_options: ChunkingOptions = Field(default_factory=ChunkingOptions)
     processing_options: ProcessingOptions = Field(default_factory=ProcessingOptions)
+    response_format: Literal["full", "compact"] = Field(
+        default="full",
+        description="full: every chunk carries its text; compact: chunks are (start, end) spans into the input text, with content only when it differs from the span.",
+    )
+    previous_session_id: Optional[str] = Field(
+        default=None,
+        description="Session id of a previous response; chunks whose content is unchanged reuse its processed results.",
+    )
+    previous_chunk_hashes: Optional[List[str]] = Field(
+        default=None,
+        description="Content hashes of previously processed chunks, as an alternative to previous_session_id.",
+    )
+    export: Optional[ExportOptions] = Field(
+        default=None,
+        description="Also write the final chunks (and their embeddings) to columnar files.",
+    )
 
 
 class Chunk(BaseModel):
@@ -47,11 +142,163 @@ class Chunk(BaseModel):
     token_count: Optional[int] = Field(
         None, description="The estimated token count of the chunk."
     )
+    content_hash: Optional[str] = Field(
+        None,
+        description="Hash of the original chunk content, used for incremental re-processing.",
+    )
+
+
+class TokenUsage(BaseModel):
+    requests: int = Field(default=0, description="Number of API calls made.")
+    prompt_tokens: int = Field(default=0, description="Prompt (input) tokens.")
+    cached_prompt_tokens: int = Field(
+        default=0, description="Prompt tokens served from the provider's prefix cache."
+    )
+    completion_tokens: int = Field(
+        default=0, description="Completion (output) tokens."
+    )
+    total_tokens: int = Field(default=0, description="Total tokens billed.")
+    image_count: int = Field(
+        default=0, description="Number of images sent to the model."
+    )
+    estimated_cost: float = Field(
+        default=0.0, description="Estimated cost based on the configured prices."
+    )
+
+
+class UsageReport(BaseModel):
+    llm: TokenUsage = Field(default_factory=TokenUsage)
+    vlm: TokenUsage = Field(default_factory=TokenUsage)
+    embedding: TokenUsage = Field(default_factory=TokenUsage)
+    total_tokens: int = Field(default=0, description="Total tokens across models.")
+    estimated_cost: float = Field(
+        default=0.0, description="Total estimated cost across models."
+    )
+    shared: bool = Field(
+        default=False,
+        description="This request joined identical work in flight (the whole request or some model "
+        "calls): that usage is reported by the request that did the work and not here, so it isn't "
+        "counted twice.",
+    )
+
+
+class DedupReport(BaseModel):
+    duplicate_chunks: int = Field(
+        default=0, description="Chunks identified as exact or near duplicates."
+    )
+    near_duplicate_chunks: int = Field(
+        default=0,
+        description="Of those, near duplicates: with fan_out they are processed on their own, with drop they are removed.",
+    )
+    dropped_chunks: int = Field(
+        default=0, description="Duplicate chunks removed from the output."
+    )
+    llm_calls_saved: int = Field(
+        default=0, description="LLM calls skipped thanks to deduplication."
+    )
+
+
+class QualityReport(BaseModel):
+    checked_chunks: int = Field(
+        default=0, description="Chunks scored by the local quality check."
+    )
+    skipped_chunks: int = Field(
+        default=0, description="Chunks found clean enough to skip LLM cleaning (one LLM call each)."
+    )
+
+
+class ExportResult(BaseModel):
+    export_id: str = Field(..., description="Id of the export, used in download URLs.")
+    format: str = Field(..., description="Format of the written files.")
+    directory: str = Field(..., description="Server-side directory the files were written to.")
+    files: List[str] = Field(..., description="Names of the written files.")
+    rows: int = Field(..., description="Number of chunks exported.")
+    embedding_dim: Optional[int] = Field(
+        None, description="Dimension of the exported embeddings (if embedded)."
+    )
+    embedding_model: Optional[str] = Field(
+        None, description="Model that produced the embeddings (if embedded)."
+    )
 
 
 class ProcessResponse(BaseModel):
     chunks: List[Chunk] = Field(..., description="The list of processed chunks.")
     total_chunks: int = Field(..., description="The total number of chunks.")
+    usage: Optional[UsageReport] = Field(
+        None, description="Token usage and estimated cost for this request."
+    )
+    dedup: Optional[DedupReport] = Field(
+        None, description="Deduplication statistics (if enabled)."
+    )
+    quality: Optional[QualityReport] = Field(
+        None, description="Cleaning pre-check statistics (if enabled)."
+    )
+    session_id: Optional[str] = Field(
+        None, description="Session id to pass as previous_session_id on the next request."
+    )
+    reused_chunks: int = Field(
+        default=0, description="Chunks whose processed result was reused from a previous request."
+    )
+    export: Optional[ExportResult] = Field(
+        None, description="Files written by the export stage (if requested)."
+    )
+
+
+class CompactChunk(BaseModel):
+    start: int = Field(..., description="Start offset of the chunk in the original text.")
+    end: int = Field(..., description="End offset (exclusive) of the chunk in the original text.")
+    content: Optional[str] = Field(
+        None,
+        description="The chunk content, only present when it differs from text[start:end] (e.g. after cleaning).",
+    )
+    summary: Optional[str] = Field(
+        None, description="The summary of the chunk (if generated)."
+    )
+    token_count: Optional[int] = Field(
+        None, description="The estimated token count of the chunk."
+    )
+    content_hash: Optional[str] = Field(
+        None,
+        description="Hash of the original chunk content, used for incremental re-processing.",
+    )
+
+
+class CompactProcessResponse(BaseModel):
+    chunks: List[CompactChunk] = Field(..., description="The list of chunk spans.")
+    total_chunks: int = Field(..., description="The total number of chunks.")
+    usage: Optional[UsageReport] = Field(
+        None, description="Token usage and estimated cost for this request."
+    )
+    dedup: Optional[DedupReport] = Field(
+        None, description="Deduplication statistics (if enabled)."
+    )
+    quality: Optional[QualityReport] = Field(
+        None, description="Cleaning pre-check statistics (if enabled)."
+    )
+    session_id: Optional[str] = Field(
+        None, description="Session id to pass as previous_session_id on the next request."
+    )
+    reused_chunks: int = Field(
+        default=0, description="Chunks whose processed result was reused from a previous request."
+    )
+    export: Optional[ExportResult] = Field(
+        None, description="Files written by the export stage (if requested)."
+    )
+
+
+class BatchOptions(BaseModel):
+    chunking_options: ChunkingOptions = Field(default_factory=ChunkingOptions)
+    processing_options: ProcessingOptions = Field(default_factory=ProcessingOptions)
+    response_format: Literal["full", "compact"] = Field(
+        default="full", description="Response format of each document's result."
+    )
+
+
+class RecordChunk(Chunk):
+    record_start: int = Field(..., description="Index of the first record in the chunk.")
+    record_end: int = Field(..., description="Index after the last record in the chunk.")
+    byte_start: int = Field(..., description="Byte offset of the first record in the file.")
+    byte_end: int = Field(..., description="Byte offset after the last record in the file.")
 
 
 class ChunkActionRequest(BaseModel):
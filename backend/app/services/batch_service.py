@@ -0,0 +1,155 @@
+import io
+import os
+import uuid
+import asyncio
+import logging
+import zipfile
+from typing import AsyncIterator, Callable, List, Tuple
+from fastapi import UploadFile
+from app.schemas.process import BatchOptions, ProcessRequest
+from app.services.file_processing_service import FileProcessingService
+from app.services.orchestrator import Orchestrator
+from app.core.log import log_context
+from app.core.streaming import run_in_thread
+from app.core.usage import combine_reports
+
+logger = logging.getLogger(__name__)
+
+# (filename, loader) pairs; archive members are only read when their turn comes
+BatchItem = Tuple[str, Callable[[], UploadFile]]
+
+DEFAULT_MAX_FILES = 1000
+DEFAULT_MAX_UNCOMPRESSED_BYTES = 1024 * 1024 * 1024
+
+
+class BatchProcessingService:
+    """
+    Parses many files in parallel, with all their pages and images sharing one
+    fair VLM queue, then chunks and processes each document on its own.
+    Results are yielded per document as soon as it is finished.
+    """
+
+    def __init__(self):
+        # Pages and images of all documents share the fair, process-wide VLM scheduler
+        self.file_service = FileProcessingService()
+        self.file_concurrency = int(os.getenv("BATCH_FILE_CONCURRENCY", 8))
+        self._processing_usage = []
+
+    @staticmethod
+    async def expand_uploads(files: List[UploadFile]) -> List[BatchItem]:
+        """
+        Turn the uploaded files into batch items, expanding .zip archives.
+        Raises ValueError if the batch has more than BATCH_MAX_FILES documents,
+        or if its archives would unpack to more than
+        BATCH_MAX_UNCOMPRESSED_BYTES (checked from the archives' directories,
+        before anything is decompressed).
+        """
+        max_files = int(os.getenv("BATCH_MAX_FILES", DEFAULT_MAX_FILES))
+        max_bytes = int(os.getenv("BATCH_MAX_UNCOMPRESSED_BYTES", DEFAULT_MAX_UNCOMPRESSED_BYTES))
+        items: List[BatchItem] = []
+        uncompressed = 0
+        for file in files:
+            if not file.filename.lower().endswith(".zip"):
+                items.append((file.filename, lambda file=file: file))
+                continue
+
+            # Read from the spooled upload rather than copied into memory; reading
+            # the central directory blocks, so it happens off the event loop
+            archive = await run_in_thread(zipfile.ZipFile, file.file)
+            for info in archive.infolist():
+                if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                    continue
+                # Members can't unpack to more than their declared size
+                uncompressed += info.file_size
+                if uncompressed > max_bytes:
+                    raise ValueError(
+                        f"Archives unpack to more than {max_bytes} bytes (BATCH_MAX_UNCOMPRESSED_BYTES)"
+                    )
+                if len(items) >= max_files:
+                    raise ValueError(f"Batch has more than {max_files} files (BATCH_MAX_FILES)")
+                items.append(
+                    (
+                        info.filename,
+                        lambda archive=archive, info=info: UploadFile(
+                            file=io.BytesIO(archive.read(info)), filename=info.filename
+                        ),
+                    )
+                )
+        if len(items) > max_files:
+            raise ValueError(f"Batch has more than {max_files} files (BATCH_MAX_FILES)")
+        return items
+
+    async def _process_document(
+        self, index: int, item: BatchItem, options: BatchOptions, batch_id: str
+    ) -> dict:
+        filename, load = item
+        try:
+            # Decompressing an archive member blocks, so it happens off the event loop
+            upload = await run_in_thread(load)
+            extraction = await self.file_service.extract_file(
+                upload, document_key=f"{batch_id}:{index}"
+            )
+            orchestrator = Orchestrator()
+            result = await orchestrator.process(
+                ProcessRequest(
+                    text=extraction.content,
+                    chunking_options=options.chunking_options,
+                    processing_options=options.processing_options,
+                    response_format=options.response_format,
+                )
+            )
+            self._processing_usage.append(result.usage)
+            event = {
+                "type": "document",
+                "index": index,
+                "filename": filename,
+                "result": result.model_dump(),
+            }
+            failed = len(extraction.failed_units)
+            if failed:
+                # Retried through /extractions/{id}/retry, then processed again
+                event.update(extraction_id=extraction.id, failed_units=failed)
+            return event
+        except Exception as e:
+            logger.error("Error processing batch file %s: %s", filename, e)
+            return {"type": "document", "index": index, "filename": filename, "error": str(e)}
+
+    async def process_batch(
+        self, items: List[BatchItem], options: BatchOptions
+    ) -> AsyncIterator[dict]:
+        logger.info("Starting batch of %d files", len(items))
+        self._processing_usage = []
+        yield {"type": "batch", "total_files": len(items)}
+
+        semaphore = asyncio.Semaphore(self.file_concurrency)
+        # Each document gets its own queue in the fair VLM scheduler, distinct
+        # from those of the documents of other batches
+        batch_id = uuid.uuid4().hex
+
+        async def bounded(index: int, item: BatchItem) -> dict:
+            async with semaphore:
+                with log_context(document=item[0]):
+                    return await self._process_document(index, item, options, batch_id)
+
+        tasks = [
+            asyncio.ensure_future(bounded(index, item))
+            for index, item in enumerate(items)
+        ]
+        failed = 0
+        try:
+            for completed in asyncio.as_completed(tasks):
+                event = await completed
+                failed += "error" in event
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        usage = combine_reports(self.file_service.usage.report(), *self._processing_usage)
+        logger.info("Finished batch of %d files (%d failed)", len(items), failed)
+        yield {
+            "type": "batch_done",
+            "total_files": len(items),
+            "failed_files": failed,
+            "usage": usage.model_dump(),
+        }
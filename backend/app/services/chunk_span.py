@@ -0,0 +1,77 @@
+from typing import Optional
+from app.schemas.process import Chunk
+
+
+class ChunkSpan:
+    """
+    Internal representation of a chunk: a (start, end) span of the source text,
+    which every span of a document shares. Its content is sliced from the
+    source on access rather than copied when chunking, so overlapping chunks
+    don't duplicate the document; only content that differs from the span
+    (after cleaning, for a joined recursive chunk...) is stored.
+
+    Chunkers and the orchestrator work on spans; they become Pydantic `Chunk`s
+    (or plain dicts) only when a response is serialized.
+    """
+
+    __slots__ = ("source", "start", "end", "_content", "summary", "token_count", "content_hash")
+
+    def __init__(self, source: str, start: int, end: int, content: Optional[str] = None):
+        self.source = source
+        self.start = start
+        self.end = end
+        self._content = content
+        self.summary: Optional[str] = None
+        self.token_count: Optional[int] = None
+        self.content_hash: Optional[str] = None
+
+    @classmethod
+    def of(cls, source: str, start: int, content: str) -> "ChunkSpan":
+        """
+        Span for `content` found at `start`; the content is only kept if it
+        isn't the source text at that position.
+        """
+        end = start + len(content)
+        if source.startswith(content, start):
+            return cls(source, start, end)
+        return cls(source, start, end, content)
+
+    @property
+    def content(self) -> str:
+        if self._content is not None:
+            return self._content
+        return self.source[self.start : self.end]
+
+    @content.setter
+    def content(self, value: str):
+        self._content = value
+
+    @property
+    def edited_content(self) -> Optional[str]:
+        """
+        Content that is not a slice of the source, or None.
+        """
+        return self._content
+
+    @property
+    def original_index(self) -> int:
+        return self.start
+
+    def to_dict(self) -> dict:
+        """
+        Same as `self.to_chunk().model_dump()`, without building the model.
+        """
+        return {
+            "content": self.content,
+            "original_index": self.start,
+            "summary": self.summary,
+            "token_count": self.token_count,
+            "content_hash": self.content_hash,
+        }
+
+    def to_chunk(self) -> Chunk:
+        # The fields are already of the right types, so validation is skipped
+        return Chunk.model_construct(**self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"ChunkSpan(start={self.start}, end={self.end}, content={self.content[:30]!r})"
@@ -1,74 +1,193 @@
-from typing import List
-import numpy as np
-from app.schemas.process import Chunk
-from app.core.embedding_client import EmbeddingClient
+import re
+from typing import List, Optional, Tuple
+from app.services.chunk_span import ChunkSpan
+from app.core.embedding_client import EmbeddingBackend
+from app.core.profiling import stage
+from app.core.tokenizer import count_tokens
+
+# A sentence: text up to and including its terminal punctuation (or a line break)
+SENTENCE_RE = re.compile(r"[^.!?。！？\n]+[.!?。！？]*")
+
+# Default breakpoint_amount per breakpoint type
+DEFAULT_BREAKPOINT_AMOUNTS = {"threshold": 0.5, "percentile": 95.0, "std_dev": 3.0}
 
 
 class SemanticChunker:
-    def __init__(self, embedding_client: EmbeddingClient):
+    def __init__(self, embedding_client: EmbeddingBackend):
         self.embedding_client = embedding_client
 
-    def chunk_by_semantics(self, text: str, threshold: float = 0.5) -> List[Chunk]:
+    def chunk_by_semantics(
+        self,
+        text: str,
+        threshold: float = 0.5,
+        breakpoint_type: str = "threshold",
+        breakpoint_amount: Optional[float] = None,
+        max_chunk_size: Optional[int] = None,
+        min_chunk_size: int = 0,
+        size_unit: str = "chars",
+    ) -> List[ChunkSpan]:
         """
-        Chunk text based on semantic similarity.
-        This is a simplified implementation. A real one would split by sentences first.
+        Chunk text based on semantic similarity between adjacent sentences.
+
+        Breakpoints are placed where the similarity drops:
+        - threshold: below `threshold` (or `breakpoint_amount`)
+        - percentile: below the (100 - amount)th percentile of all similarities,
+          i.e. the weakest (100 - amount)% of boundaries
+        - std_dev: more than `amount` standard deviations below the mean
+
+        Groups larger than `max_chunk_size` are split recursively at their
+        weakest internal similarity, and groups smaller than `min_chunk_size`
+        are merged into their more similar neighbour while that fits.
+        Sizes are in characters or, with size_unit="tokens", tokens.
         """
-        # 1. Split text into sentences (simple split by period for MVP)
-        sentences = [s.strip() + "." for s in text.split(".") if s.strip()]
-        if not sentences:
+        import numpy as np
+
+        # 1. Split text into sentences, keeping their spans in the original text
+        spans = self._split_sentences(text, max_chunk_size, size_unit)
+        if not spans:
             return []
+        starts = np.array([span[0] for span in spans], dtype=np.int64)
+        ends = np.array([span[1] for span in spans], dtype=np.int64)
+        if len(spans) == 1:
+            return [ChunkSpan(text, int(starts[0]), int(ends[0]))]
 
         # 2. Get embeddings for all sentences
-        embeddings = self.embedding_client.get_embeddings(sentences)
-
-        if len(embeddings) < 2:
-            return [Chunk(content=text, original_index=0)]
-
-        # 3. Calculate cosine similarity between adjacent sentences
-        similarities = []
-        for i in range(len(embeddings) - 1):
-            sim = np.dot(embeddings[i], embeddings[i + 1]) / (
-                np.linalg.norm(embeddings[i]) * np.linalg.norm(embeddings[i + 1])
+        sentences = [text[start:end] for start, end in spans]
+        with stage("embedding"):
+            embeddings = np.asarray(self.embedding_client.get_embeddings(sentences), dtype=np.float64)
+
+        # 3. Cosine similarity between adjacent sentences
+        norms = np.linalg.norm(embeddings, axis=1)
+        norms[norms == 0] = 1.0
+        unit = embeddings / norms[:, None]
+        similarities = np.einsum("ij,ij->i", unit[:-1], unit[1:])
+
+        # 4. Group sentences at the breakpoints
+        breaks = self._breakpoints(similarities, threshold, breakpoint_type, breakpoint_amount)
+        bounds = np.concatenate(([0], np.flatnonzero(breaks) + 1, [len(spans)]))
+        groups = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        # 5. Enforce the size bounds
+        if size_unit == "tokens":
+            token_counts = np.array([count_tokens(sentence) for sentence in sentences])
+            cumulative = np.concatenate(([0], np.cumsum(token_counts)))
+
+            def size(a: int, b: int) -> int:
+                return int(cumulative[b] - cumulative[a])
+        else:
+
+            def size(a: int, b: int) -> int:
+                return int(ends[b - 1] - starts[a])
+
+        if max_chunk_size:
+            groups = self._split_oversized(groups, similarities, size, max_chunk_size)
+        if min_chunk_size:
+            groups = self._merge_undersized(
+                groups, similarities, size, min_chunk_size, max_chunk_size
             )
-            similarities.append(sim)
 
-        # 4. Group sentences based on similarity threshold
-        chunks = []
-        current_chunk_sentences = [sentences[0]]
-        current_start_index = 0
-        current_char_count = 0
-
-        for i, sim in enumerate(similarities):
-            if sim < threshold:
-                # Break point found
-                chunk_content = " ".join(current_chunk_sentences)
-                chunks.append(
-                    Chunk(content=chunk_content, original_index=current_start_index)
-                )
-
-                # Reset for next chunk
-                current_start_index += (
-                    len(chunk_content) + 1
-                )  # +1 for space/separator approximation
-                current_chunk_sentences = [sentences[i + 1]]
+        return [ChunkSpan(text, int(starts[a]), int(ends[b - 1])) for a, b in groups]
+
+    @staticmethod
+    def _split_sentences(
+        text: str, max_chunk_size: Optional[int], size_unit: str
+    ) -> List[Tuple[int, int]]:
+        """
+        (start, end) spans of the sentences, whitespace trimmed. A sentence that
+        is itself larger than `max_chunk_size` is cut into pieces that fit.
+        """
+        spans = []
+        for match in SENTENCE_RE.finditer(text):
+            sentence = match.group()
+            stripped = sentence.strip()
+            if not stripped:
+                continue
+            start = match.start() + len(sentence) - len(sentence.lstrip())
+            end = start + len(stripped)
+            piece = max_chunk_size
+            if piece and size_unit == "tokens":
+                tokens = count_tokens(stripped)
+                piece = max(1, len(stripped) * max_chunk_size // tokens) if tokens > max_chunk_size else None
+            if piece and end - start > piece:
+                spans.extend((i, min(i + piece, end)) for i in range(start, end, piece))
             else:
-                current_chunk_sentences.append(sentences[i + 1])
+                spans.append((start, end))
+        return spans
 
-        # Add the last chunk
-        if current_chunk_sentences:
-            chunk_content = " ".join(current_chunk_sentences)
-            chunks.append(
-                Chunk(content=chunk_content, original_index=current_start_index)
-            )
+    @staticmethod
+    def _breakpoints(similarities, threshold: float, breakpoint_type: str, amount: Optional[float]):
+        import numpy as np
+
+        if amount is None:
+            amount = threshold if breakpoint_type == "threshold" else DEFAULT_BREAKPOINT_AMOUNTS[breakpoint_type]
+        if breakpoint_type == "percentile":
+            cutoff = np.percentile(similarities, 100 - amount)
+        elif breakpoint_type == "std_dev":
+            cutoff = similarities.mean() - amount * similarities.std()
+        elif breakpoint_type == "threshold":
+            cutoff = amount
+        else:
+            raise ValueError(f"Invalid breakpoint type: {breakpoint_type}")
+        return similarities < cutoff
 
-        return chunks
+    @staticmethod
+    def _split_oversized(groups, similarities, size, max_chunk_size: int) -> List[Tuple[int, int]]:
+        """
+        Recursively split groups larger than `max_chunk_size` at their weakest
+        internal similarity.
+        """
+        import numpy as np
+
+        result = []
+        stack = list(reversed(groups))
+        while stack:
+            a, b = stack.pop()
+            if b - a < 2 or size(a, b) <= max_chunk_size:
+                result.append((a, b))
+                continue
+            # similarities[k] is the boundary between sentences k and k + 1
+            k = a + int(np.argmin(similarities[a : b - 1])) + 1
+            stack.append((k, b))
+            stack.append((a, k))
+        return result
+
+    @staticmethod
+    def _merge_undersized(
+        groups, similarities, size, min_chunk_size: int, max_chunk_size: Optional[int]
+    ) -> List[Tuple[int, int]]:
+        """
+        Merge groups smaller than `min_chunk_size` into the neighbour they are
+        more similar to, as long as the result stays within `max_chunk_size`.
+        """
+        groups = list(groups)
+        i = 0
+        while i < len(groups):
+            a, b = groups[i]
+            if size(a, b) >= min_chunk_size:
+                i += 1
+                continue
+            neighbours = []
+            if i > 0:
+                neighbours.append((similarities[a - 1], i - 1))
+            if i < len(groups) - 1:
+                neighbours.append((similarities[b - 1], i + 1))
+            for _, j in sorted(neighbours, reverse=True):
+                lo, hi = min(i, j), max(i, j)
+                merged = (groups[lo][0], groups[hi][1])
+                if not max_chunk_size or size(*merged) <= max_chunk_size:
+                    groups[lo : hi + 1] = [merged]
+                    i = lo
+                    break
+            else:
+                i += 1
+        return groups
 
 
 class RuleBasedChunker:
     @staticmethod
     def chunk_by_fixed_size(
         text: str, chunk_size: int, chunk_overlap: int
-    ) -> List[Chunk]:
+    ) -> List[ChunkSpan]:
         """
         Chunk text by fixed size with overlap.
         """
@@ -81,9 +200,7 @@ class RuleBasedChunker:
 
         while start < text_len:
             end = min(start + chunk_size, text_len)
-            chunk_content = text[start:end]
-
-            chunks.append(Chunk(content=chunk_content, original_index=start))
+            chunks.append(ChunkSpan(text, start, end))
 
             start += chunk_size - chunk_overlap
 
@@ -96,7 +213,7 @@ class RuleBasedChunker:
     @staticmethod
     def chunk_recursively(
         text: str, chunk_size: int, chunk_overlap: int, separators: List[str] = None
-    ) -> List[Chunk]:
+    ) -> List[ChunkSpan]:
         """
         Recursive character text splitter logic.
         Prioritizes splitting by provided separators.
@@ -108,70 +225,74 @@ class RuleBasedChunker:
         if "" not in separators:
             separators.append("")
 
-        final_chunks = []
-
-        def _split_text(text: str, separators: List[str]) -> List[str]:
-            final_splits = []
-            separator = separators[-1]
-            new_separators = []
-
-            for i, sep in enumerate(separators):
-                if sep == "":
-                    separator = ""
-                    break
-                if sep in text:
-                    separator = sep
-                    new_separators = separators[i + 1 :]
-                    break
-
-            splits = text.split(separator) if separator else list(text)
-
-            good_splits = []
-            for split in splits:
-                if not split:
-                    continue
-                if len(split) < chunk_size:
-                    good_splits.append(split)
-                else:
-                    if new_separators:
-                        good_splits.extend(_split_text(split, new_separators))
-                    else:
-                        good_splits.append(split)
-
-            return good_splits
-
-        # Use the recursive splitting logic
-        # Note: This is a simplified implementation. A full implementation would need to handle merging small chunks back together.
-        # For now, we will use the fixed size chunker as a fallback if the recursive split fails to produce chunks of the desired size,
-        # or if we want to ensure strict size limits.
-
-        # However, to respect the user's request for recursive splitting with separators:
-        # We will implement a basic recursive split and then group them to fit chunk_size
-
-        splits = _split_text(text, separators)
-
-        current_chunk = ""
-        current_start_index = 0
-
-        for split in splits:
-            if len(current_chunk) + len(split) + 1 <= chunk_size:
-                current_chunk += (
-                    split + " "
-                )  # Adding space as a generic joiner, ideally should use the separator that was used
-            else:
-                if current_chunk:
-                    final_chunks.append(
-                        Chunk(
-                            content=current_chunk.strip(),
-                            original_index=current_start_index,
-                        )
-                    )
-                    current_start_index += len(current_chunk)
-                current_chunk = split + " "
-
-        if current_chunk:
-            final_chunks.append(
-                Chunk(content=current_chunk.strip(), original_index=current_start_index)
-            )
-
-        return final_chunks
+        # Split recursively, then group the splits to fit chunk_size
+        splits = split_recursively(text, separators, chunk_size)
+        return [
+            ChunkSpan.of(text, start, content.strip())
+            for _, start, content in pack_splits(splits, chunk_size)
+        ]
+
+
+def split_recursively(text: str, separators: List[str], chunk_size: int) -> List[str]:
+    """
+    Split text at the first separator it contains, then split the pieces that
+    are still `chunk_size` or longer at the following separators.
+    """
+    separator = separators[-1]
+    new_separators = []
+
+    for i, sep in enumerate(separators):
+        if sep == "":
+            separator = ""
+            break
+        if sep in text:
+            separator = sep
+            new_separators = separators[i + 1 :]
+            break
+
+    splits = text.split(separator) if separator else list(text)
+    return refine_splits(splits, new_separators, chunk_size)
+
+
+def refine_splits(splits: List[str], separators: List[str], chunk_size: int) -> List[str]:
+    good_splits = []
+    for split in splits:
+        if not split:
+            continue
+        if len(split) < chunk_size:
+            good_splits.append(split)
+        elif separators:
+            good_splits.extend(split_recursively(split, separators, chunk_size))
+        else:
+            good_splits.append(split)
+    return good_splits
+
+
+def pack_splits(splits: List[str], chunk_size: int) -> List[Tuple[int, int, str]]:
+    """
+    Group consecutive splits greedily into chunks of at most `chunk_size`.
+    Returns (index of the first split, start, content) per chunk.
+
+    Splits are joined with a space, whatever separator they were cut at, and a
+    chunk's start is the length of the joined splits before it, so chunk
+    contents and starts can drift from the source text.
+    """
+    chunks = []
+    current_chunk = ""
+    current_first = 0
+    current_start_index = 0
+
+    for i, split in enumerate(splits):
+        if len(current_chunk) + len(split) + 1 <= chunk_size:
+            current_chunk += split + " "
+        else:
+            if current_chunk:
+                chunks.append((current_first, current_start_index, current_chunk))
+                current_start_index += len(current_chunk)
+            current_chunk = split + " "
+            current_first = i
+
+    if current_chunk:
+        chunks.append((current_first, current_start_index, current_chunk))
+
+    return chunks
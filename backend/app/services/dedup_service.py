@@ -0,0 +1,124 @@
+import re
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+from app.services.chunk_span import ChunkSpan
+from app.core.hashing import char_ngram_hashes
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Page framing inserted by FileProcessingService ("--- Page 3 ---", "--- Page 3 (Error) ---")
+PAGE_MARKER_RE = re.compile(r"---\s*Page\s+\d+(?:\s*\(Error\))?\s*---")
+WHITESPACE_RE = re.compile(r"\s+")
+
+FINGERPRINT_BITS = 64
+
+
+class ChunkDeduplicator:
+    """
+    Groups exact and near-duplicate chunks with 64-bit SimHash fingerprints.
+
+    Near duplicates are chunks whose fingerprints differ in at most
+    `max_distance` bits. Candidates are found through `max_distance + 1` bit bands:
+    by the pigeonhole principle two fingerprints within that distance share at
+    least one identical band, so no pairwise comparison over all chunks is needed.
+    """
+
+    def __init__(self, max_distance: int = 3, shingle_size: int = 4):
+        self.max_distance = max(0, min(max_distance, 15))
+        self.shingle_size = shingle_size
+        self.num_bands = self.max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.num_bands
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize text so page framing and formatting don't defeat matching.
+        Numbers in the text itself, page references included, are kept:
+        chunks differing only in them are not duplicates.
+        """
+        text = PAGE_MARKER_RE.sub(" ", text)
+        return WHITESPACE_RE.sub(" ", text).strip().lower()
+
+    def _shingle_hashes(self, text: str) -> "np.ndarray":
+        """
+        Deterministic 64-bit hashes of all character shingles.
+        """
+        import numpy as np
+
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        return char_ngram_hashes(codes, self.shingle_size)
+
+    def fingerprint(self, text: str) -> int:
+        """
+        SimHash over character shingles (works for both spaced and CJK text).
+        """
+        import numpy as np
+
+        hashes = self._shingle_hashes(self.normalize(text))
+        # (n, 64) bit matrix -> per-bit vote -> sign
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+        packed = np.packbits(votes > 0, bitorder="little")
+        return int.from_bytes(packed.tobytes(), "little")
+
+    def _bands(self, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [
+            (band << self.band_bits) | ((fingerprint >> (band * self.band_bits)) & mask)
+            for band in range(self.num_bands)
+        ]
+
+    def group(self, texts: Sequence[str]) -> List[int]:
+        """
+        Return, for each text, the index of its representative (the first
+        occurrence of its duplicate group). Unique texts map to themselves.
+        """
+        return self.group_with_copies(texts)[0]
+
+    def group_with_copies(self, texts: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """
+        Return, for each text, the index of its representative and the index
+        of the first occurrence of its exact (normalized) text. The two differ
+        for near duplicates and their identical copies.
+        """
+        representatives: List[int] = []
+        first_copies: List[int] = []
+        exact: Dict[str, int] = {}
+        fingerprints: Dict[int, int] = {}
+        band_index: Dict[int, List[int]] = {}
+
+        for i, text in enumerate(texts):
+            normalized = self.normalize(text)
+            if normalized in exact:
+                first = exact[normalized]
+                representatives.append(representatives[first])
+                first_copies.append(first)
+                continue
+            exact[normalized] = i
+            first_copies.append(i)
+            if self.max_distance == 0:
+                representatives.append(i)
+                continue
+
+            fingerprint = self.fingerprint(text)
+            bands = self._bands(fingerprint)
+            match = None
+            for band in bands:
+                for candidate in band_index.get(band, ()):
+                    if bin(fingerprint ^ fingerprints[candidate]).count("1") <= self.max_distance:
+                        match = candidate
+                        break
+                if match is not None:
+                    break
+
+            if match is None:
+                match = i
+                fingerprints[i] = fingerprint
+                for band in bands:
+                    band_index.setdefault(band, []).append(i)
+            representatives.append(match)
+
+        return representatives, first_copies
+
+    def group_chunks(self, chunks: List[ChunkSpan]) -> Tuple[List[int], List[int]]:
+        return self.group_with_copies([chunk.content for chunk in chunks])
@@ -0,0 +1,132 @@
+import io
+import logging
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+VML_IMAGEDATA = "{urn:schemas-microsoft-com:vml}imagedata"
+PACKAGE_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+DOCUMENT_PART = "word/document.xml"
+DOCUMENT_RELS = "word/_rels/document.xml.rels"
+
+# ("text", paragraph or table text) or ("image", (relationship id, image bytes))
+DocxBlock = Tuple[str, Union[str, Tuple[str, bytes]]]
+
+
+def _image_targets(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """
+    Relationship id -> archive path of the images embedded in the document.
+    """
+    try:
+        root = ET.fromstring(archive.read(DOCUMENT_RELS))
+    except KeyError:
+        return {}
+    targets = {}
+    for rel in root.iter(PACKAGE_RELS):
+        if rel.get("Type") != IMAGE_REL_TYPE or rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            targets[rel.get("Id")] = target.lstrip("/")
+        else:
+            targets[rel.get("Id")] = posixpath.normpath(posixpath.join("word", target))
+    return targets
+
+
+def iter_docx_blocks(content: bytes) -> Iterator[DocxBlock]:
+    """
+    Paragraphs, tables and images of a DOCX file in document order.
+
+    word/document.xml is parsed incrementally straight from the zip, and each
+    top-level element is discarded once it has been emitted, so memory stays
+    flat however long the document is. Tables are rendered one row per line
+    with " | " between cells; an image inside a paragraph splits the paragraph
+    around it, and images inside a table follow the table.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        targets = _image_targets(archive)
+        with archive.open(DOCUMENT_PART) as xml:
+            yield from _iter_body(xml, archive, targets)
+
+
+def _iter_body(xml, archive: zipfile.ZipFile, targets: Dict[str, str]) -> Iterator[DocxBlock]:
+    body = None
+    text: List[str] = []  # Current paragraph
+    table_depth = 0
+    rows: List[List[str]] = []  # Rows of the current (outermost) table
+    cell: List[str] = []  # Paragraphs of the current cell
+    table_images: List[str] = []
+
+    def image(rel_id: str) -> Optional[DocxBlock]:
+        try:
+            return "image", (rel_id, archive.read(targets[rel_id]))
+        except KeyError:
+            # A relationship to a part missing from the archive: skip the image
+            logger.warning("Skipping DOCX image %s: %s is not in the archive", rel_id, targets[rel_id])
+            return None
+
+    for event, elem in ET.iterparse(xml, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == W + "body":
+                body = elem
+            elif tag == W + "tbl":
+                table_depth += 1
+            elif tag == W + "tr" and table_depth == 1:
+                rows.append([])
+            continue
+
+        if tag == W + "t":
+            text.append(elem.text or "")
+        elif tag == W + "tab":
+            text.append("\t")
+        elif tag in (W + "br", W + "cr"):
+            text.append("\n")
+        elif tag in (BLIP, VML_IMAGEDATA):
+            rel_id = elem.get(R + "embed") or elem.get(R + "id")
+            if rel_id in targets:
+                if table_depth:
+                    table_images.append(rel_id)
+                else:
+                    # Emit the paragraph's text so far, so the image stays in place
+                    if "".join(text).strip():
+                        yield "text", "".join(text)
+                    text = []
+                    block = image(rel_id)
+                    if block is not None:
+                        yield block
+        elif tag == W + "p":
+            paragraph = "".join(text)
+            text = []
+            if table_depth:
+                if paragraph.strip():
+                    cell.append(paragraph.strip())
+            elif paragraph.strip():
+                yield "text", paragraph
+        elif tag == W + "tc" and table_depth == 1:
+            rows[-1].append(" ".join(cell))
+            cell = []
+            elem.clear()
+        elif tag == W + "tbl":
+            table_depth -= 1
+            if table_depth == 0:
+                lines = [" | ".join(row) for row in rows if any(row)]
+                if lines:
+                    yield "text", "\n".join(lines)
+                for rel_id in table_images:
+                    block = image(rel_id)
+                    if block is not None:
+                        yield block
+                rows, table_images = [], []
+
+        # Drop every finished top-level element
+        if body is not None and table_depth == 0 and tag in (W + "p", W + "tbl", W + "sdt"):
+            body.clear()
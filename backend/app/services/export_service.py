@@ -0,0 +1,197 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+from dotenv import load_dotenv
+from app.schemas.process import ExportOptions, ExportResult
+from app.services.chunk_span import ChunkSpan
+from app.core.embedding_client import create_embedding_backend
+from app.core.profiling import stage
+from app.core.serialization import ndjson_line
+from app.core.usage import UsageTracker
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_ROOT = str(Path(__file__).resolve().parents[2] / "exports")
+MANIFEST = "manifest.json"
+
+# Files written per format (besides the manifest)
+EXPORT_FILES = {
+    "npy": ["chunks.jsonl", "embeddings.npy"],
+    "parquet": ["chunks.parquet"],
+    "arrow": ["chunks.arrow"],
+}
+
+
+def export_root() -> Path:
+    return Path(os.getenv("EXPORT_ROOT", DEFAULT_EXPORT_ROOT)).resolve()
+
+
+class ExportService:
+    """
+    Final pipeline stage: embeds the final chunks in batches and writes them,
+    with their offsets, summaries and token counts, to columnar files under
+    EXPORT_ROOT, ready for bulk loading into a vector store.
+
+    Embeddings are float32 and row-aligned with the chunks: row i of
+    embeddings.npy (or the embedding column) belongs to chunk i.
+    """
+
+    def __init__(self, usage_tracker: Optional[UsageTracker] = None):
+        self.usage = usage_tracker or UsageTracker()
+
+    @staticmethod
+    def check_format(format: str):
+        """
+        Raise ValueError if the format needs an optional dependency that isn't
+        installed, so the request fails before any chunk is processed or embedded.
+        """
+        if format not in ("parquet", "arrow"):
+            return
+        # pyarrow is an optional dependency (`pip install .[export]`)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(
+                "Parquet / Arrow export requires pyarrow (pip install .[export]); use format 'npy' instead."
+            )
+
+    async def export(
+        self,
+        chunks: List[ChunkSpan],
+        options: ExportOptions,
+    ) -> ExportResult:
+        self.check_format(options.format)
+        loop = asyncio.get_running_loop()
+        export_id = options.directory or uuid.uuid4().hex
+        directory = export_root() / export_id
+
+        records = []
+        for i, chunk in enumerate(chunks):
+            records.append(
+                {
+                    "index": i,
+                    "start": chunk.start,
+                    "end": chunk.end,
+                    "content": chunk.content,
+                    "summary": chunk.summary,
+                    "token_count": chunk.token_count,
+                    "content_hash": chunk.content_hash,
+                }
+            )
+
+        embeddings, model = None, None
+        if options.embed:
+            backend_name = options.embedding_backend or os.getenv("EMBEDDING_BACKEND", "remote")
+            backend = create_embedding_backend(backend_name, usage_tracker=self.usage)
+            model = getattr(backend, "model_name", backend_name)
+            with stage("embedding"):
+                embeddings = await loop.run_in_executor(
+                    None, self._embed, backend, [chunk.content for chunk in chunks], options.batch_size
+                )
+
+        logger.info("Exporting %d chunks as %s to %s", len(records), options.format, directory)
+        with stage("export_write"):
+            files = await loop.run_in_executor(
+                None, self._write, directory, options.format, records, embeddings
+            )
+        result = ExportResult(
+            export_id=export_id,
+            format=options.format,
+            directory=str(directory),
+            files=files,
+            rows=len(records),
+            embedding_dim=int(embeddings.shape[1]) if embeddings is not None else None,
+            embedding_model=model,
+        )
+        (directory / MANIFEST).write_text(result.model_dump_json(), encoding="utf-8")
+        return result
+
+    @staticmethod
+    def _embed(backend, texts: List[str], batch_size: int) -> "np.ndarray":
+        import numpy as np
+
+        batches = [
+            np.asarray(backend.get_embeddings(texts[i : i + batch_size]), dtype=np.float32)
+            for i in range(0, len(texts), batch_size)
+        ]
+        if not batches:
+            return np.zeros((0, getattr(backend, "dim", 0)), dtype=np.float32)
+        return np.vstack(batches)
+
+    @classmethod
+    def _write(
+        cls,
+        directory: Path,
+        format: str,
+        records: List[dict],
+        embeddings: Optional["np.ndarray"],
+    ) -> List[str]:
+        directory.mkdir(parents=True, exist_ok=True)
+        if format == "npy":
+            import numpy as np
+
+            with open(directory / "chunks.jsonl", "wb") as f:
+                for record in records:
+                    f.write(ndjson_line(record))
+            if embeddings is None:
+                return ["chunks.jsonl"]
+            np.save(directory / "embeddings.npy", embeddings)
+            return EXPORT_FILES["npy"]
+
+        table = cls._arrow_table(records, embeddings)
+        if format == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, directory / "chunks.parquet")
+        else:
+            import pyarrow as pa
+
+            with pa.OSFile(str(directory / "chunks.arrow"), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        return EXPORT_FILES[format]
+
+    @staticmethod
+    def _arrow_table(records: List[dict], embeddings: Optional["np.ndarray"]):
+        import pyarrow as pa
+
+        columns = {
+            "index": pa.array([r["index"] for r in records], pa.int64()),
+            "start": pa.array([r["start"] for r in records], pa.int64()),
+            "end": pa.array([r["end"] for r in records], pa.int64()),
+            "content": pa.array([r["content"] for r in records], pa.string()),
+            "summary": pa.array([r["summary"] for r in records], pa.string()),
+            "token_count": pa.array([r["token_count"] for r in records], pa.int64()),
+            "content_hash": pa.array([r["content_hash"] for r in records], pa.string()),
+        }
+        if embeddings is not None:
+            # Fixed-size lists over one flat float32 buffer, without per-row copies
+            columns["embedding"] = pa.FixedSizeListArray.from_arrays(
+                pa.array(embeddings.reshape(-1), pa.float32()), embeddings.shape[1]
+            )
+        return pa.table(columns)
+
+    @staticmethod
+    def export_file(export_id: str, filename: str) -> Optional[Path]:
+        """
+        Path of a file of a finished export, or None if there is no such file.
+        """
+        directory = export_root() / export_id
+        if directory.resolve().parent != export_root():
+            return None
+        try:
+            manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if filename != MANIFEST and filename not in manifest.get("files", []):
+            return None
+        return directory / filename
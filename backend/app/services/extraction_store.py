@@ -0,0 +1,229 @@
+import os
+import json
+import base64
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Union
+from app.core.shared_store import SharedStore, SharedStoreError, shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractedUnit:
+    """
+    One page of a PDF or image of a DOCX transcribed by the VLM: its text, or
+    the error it failed with after all attempts.
+    """
+
+    __slots__ = ("unit", "index", "text", "error", "attempts")
+
+    def __init__(self, unit: str, index: int):
+        self.unit = unit  # "page" or "image"
+        self.index = index  # 0-based
+        self.text = ""
+        self.error: Optional[str] = None
+        self.attempts = 0
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def render(self) -> str:
+        """
+        The unit's part of the document text.
+        """
+        number = self.index + 1
+        if self.unit == "page":
+            if self.failed:
+                return f"--- Page {number} (Error) ---\n[Error processing page: {self.error}]\n"
+            return f"--- Page {number} ---\n{self.text}\n"
+        if self.failed:
+            return f"[Error processing image {number}: {self.error}]"
+        return self.text
+
+    def status(self) -> dict:
+        return {
+            "unit": self.unit,
+            "index": self.index + 1,
+            "status": "failed" if self.failed else "ok",
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExtractedUnit":
+        unit = cls(data["unit"], data["index"])
+        unit.text, unit.error, unit.attempts = data["text"], data["error"], data["attempts"]
+        return unit
+
+
+class Extraction:
+    """
+    Text extracted from a file, as its plain text parts and VLM units in
+    document order, joined on access, so units transcribed again later are
+    spliced back in place. `source`, the file itself, is kept (once) for
+    rendering the failed pages / images again on retry.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        parts: Iterable[Union[str, ExtractedUnit]],
+        extraction_id: Optional[str] = None,
+        source: Optional[bytes] = None,
+    ):
+        self.id = extraction_id or uuid.uuid4().hex
+        self.filename = filename
+        self.parts: List[Union[str, ExtractedUnit]] = list(parts)
+        self.source = source
+
+    @property
+    def units(self) -> List[ExtractedUnit]:
+        # Several parts can be the same unit (a DOCX image used twice)
+        seen = {}
+        for part in self.parts:
+            if isinstance(part, ExtractedUnit):
+                seen.setdefault(id(part), part)
+        return list(seen.values())
+
+    @property
+    def failed_units(self) -> List[ExtractedUnit]:
+        return [unit for unit in self.units if unit.failed]
+
+    @property
+    def content(self) -> str:
+        return "\n".join(part if isinstance(part, str) else part.render() for part in self.parts)
+
+    def report(self) -> dict:
+        units = self.units
+        return {
+            "extraction_id": self.id,
+            "units": [unit.status() for unit in units],
+            "failed_units": sum(unit.failed for unit in units),
+        }
+
+    def to_dict(self) -> dict:
+        units = self.units
+        positions = {id(unit): i for i, unit in enumerate(units)}
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "units": [unit.to_dict() for unit in units],
+            # Text parts as strings, units as their position in "units"
+            "parts": [part if isinstance(part, str) else positions[id(part)] for part in self.parts],
+            "source": base64.b64encode(self.source).decode("ascii") if self.source is not None else None,
+        }
+
+    def copy(self) -> "Extraction":
+        """
+        Copy with its own id and units, for another caller sharing this
+        extraction, so retrying one doesn't change the other.
+        """
+        units = {id(unit): ExtractedUnit.from_dict(unit.to_dict()) for unit in self.units}
+        parts = [part if isinstance(part, str) else units[id(part)] for part in self.parts]
+        return Extraction(self.filename, parts, source=self.source)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Extraction":
+        units = [ExtractedUnit.from_dict(unit) for unit in data["units"]]
+        parts = [part if isinstance(part, str) else units[part] for part in data["parts"]]
+        source = base64.b64decode(data["source"]) if data.get("source") is not None else None
+        return cls(data["filename"], parts, extraction_id=data["id"], source=source)
+
+
+class ExtractionStore:
+    """
+    Process-wide LRU store of the extractions that have failed units, so that
+    only those units are transcribed again on retry. Like the result store, it
+    writes through to the shared store in distributed mode, so a retry can
+    reach any replica.
+
+    The source files kept for retries are bounded: one larger than
+    `max_source_bytes` isn't kept (its failed units can't be retried, the file
+    has to be uploaded again), and the oldest extractions are evicted while
+    the sources held here total more than `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100,
+        shared: Optional[SharedStore] = None,
+        shared_ttl: float = 7 * 24 * 3600,
+        max_source_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.max_source_bytes = max_source_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._extractions: "OrderedDict[str, Extraction]" = OrderedDict()
+        self._bytes = 0
+
+    def put(self, extraction: Extraction):
+        if extraction.source is not None and len(extraction.source) > self.max_source_bytes:
+            logger.warning(
+                "Not keeping the %d byte source of extraction %s "
+                "(EXTRACTION_SOURCE_MAX_BYTES), its failed units can't be retried",
+                len(extraction.source),
+                extraction.id,
+            )
+            extraction.source = None
+        self._put_local(extraction)
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(
+                f"extraction:{extraction.id}",
+                json.dumps(extraction.to_dict()).encode("utf-8"),
+                self.shared_ttl,
+            )
+        except SharedStoreError as e:
+            logger.warning("Shared store unavailable, keeping extraction %s locally: %s", extraction.id, e)
+
+    def _put_local(self, extraction: Extraction):
+        with self._lock:
+            previous = self._extractions.pop(extraction.id, None)
+            if previous is not None:
+                self._bytes -= len(previous.source or b"")
+            self._extractions[extraction.id] = extraction
+            self._bytes += len(extraction.source or b"")
+            while len(self._extractions) > self.max_entries or (
+                self._bytes > self.max_bytes and len(self._extractions) > 1
+            ):
+                _, evicted = self._extractions.popitem(last=False)
+                self._bytes -= len(evicted.source or b"")
+
+    def get(self, extraction_id: str) -> Optional[Extraction]:
+        with self._lock:
+            extraction = self._extractions.get(extraction_id)
+            if extraction is not None:
+                self._extractions.move_to_end(extraction_id)
+                return extraction
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.get(f"extraction:{extraction_id}")
+        except SharedStoreError as e:
+            logger.warning("Shared store unavailable, using the local extractions only: %s", e)
+            return None
+        if value is None:
+            return None
+        extraction = Extraction.from_dict(json.loads(value))
+        self._put_local(extraction)
+        return extraction
+
+
+extraction_store = ExtractionStore(
+    max_entries=int(os.getenv("EXTRACTION_STORE_MAX_ENTRIES", 100)),
+    shared=shared_store,
+    shared_ttl=float(os.getenv("SHARED_CACHE_TTL", 7 * 24 * 3600)),
+    max_source_bytes=int(os.getenv("EXTRACTION_SOURCE_MAX_BYTES", 64 * 1024 * 1024)),
+    max_bytes=int(os.getenv("EXTRACTION_STORE_MAX_BYTES", 512 * 1024 * 1024)),
+)
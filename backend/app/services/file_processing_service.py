@@ -1,24 +1,80 @@
-import io
-import re
 import os
+import copy
+import base64
+import uuid
+import random
 import logging
+import threading
 import asyncio
-import fitz  # PyMuPDF
-import docx
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple, Union
 from fastapi import UploadFile
+from app.schemas.process import ChunkingOptions, RecordChunk, TokenUsage
+from app.services.docx_extractor import iter_docx_blocks
+from app.services.extraction_store import Extraction, ExtractedUnit, extraction_store
+from app.services.record_chunker import BLOCK_SIZE, RecordChunker
+from app.core.endpoint_pool import is_endpoint_error
 from app.core.llm_client import VLMClient
+from app.core.log import SAMPLED, log_context
+from app.core.metrics import metrics
 from app.core.prompts import VLM_PROCESS_DOCUMENT_PAGE_PROMPT
+from app.core.profiling import current_profile, stage
+from app.core.streaming import iterate_in_thread, run_in_thread
+from app.core.tag_parser import VLMOutputStream, render_vlm_output
+from app.core.scheduling import BULK, PriorityScheduler, vlm_scheduler
+from app.core.singleflight import SingleFlight, flight_key
+from app.core.usage import UsageTracker
+from app.core.work_queue import WorkQueue, work_queue
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# on_delta(unit, index, text): unit is "page" or "image", index is 0-based
+DeltaCallback = Callable[[str, int, str], None]
+
+# Identical files and VLM calls in flight are shared across requests
+file_flights = SingleFlight("file")
+vlm_calls = SingleFlight("vlm")
+
+# Longest wait between two attempts at transcribing a page/image (seconds)
+MAX_RETRY_BACKOFF = 30.0
+
+# VLM client used for tasks run on behalf of other replicas (distributed mode)
+_worker_client: Optional[VLMClient] = None
+
+
+async def run_vlm_task(payload: dict) -> dict:
+    """
+    Work queue handler: one page/image submitted by any replica, run under
+    this replica's VLM scheduler. Returns the raw output and its usage.
+    """
+    global _worker_client
+    if _worker_client is None:
+        _worker_client = VLMClient()
+    client = copy.copy(_worker_client)
+    client.usage = UsageTracker()
+    async with vlm_scheduler.slot(payload.get("document_key"), BULK):
+        text = await run_in_thread(client.get_image_caption, base64.b64decode(payload["image"]), payload["prompt"])
+    return {"text": text, "usage": client.usage.report().vlm.model_dump()}
+
+
+if work_queue is not None:
+    work_queue.register("vlm", run_vlm_task)
+
 
 class FileProcessingService:
-    def __init__(self):
-        self.vlm_client = VLMClient()
-        self.concurrency_limit = int(os.getenv("VLM_CONCURRENCY_LIMIT", 5))
-        self.semaphore = asyncio.Semaphore(self.concurrency_limit)
+    def __init__(
+        self,
+        scheduler: Optional[PriorityScheduler] = None,
+        queue: Optional[WorkQueue] = None,
+    ):
+        self.usage = UsageTracker()
+        self.vlm_client = VLMClient(usage_tracker=self.usage)
+        # VLM slots are shared process-wide, round-robin between documents
+        self.scheduler = scheduler or vlm_scheduler
+        # In distributed mode pages and images are spread over all replicas
+        self.work_queue = queue or work_queue
+        # Attempts at each page/image before it is marked failed, and the first backoff
+        self.max_attempts = max(1, int(os.getenv("VLM_UNIT_MAX_ATTEMPTS", 3)))
+        self.retry_backoff = float(os.getenv("VLM_UNIT_RETRY_BACKOFF", 1.0))
 
     def _parse_vlm_output(self, vlm_output: str) -> str:
         """
@@ -26,146 +82,412 @@ class FileProcessingService:
         <text>content</text> -> content
         <figure_caption>content</figure_caption> -> [Image: content]
         """
-        # Remove the root tag
-        content = re.sub(r"<processed_content>\s*", "", vlm_output)
-        content = re.sub(r"\s*</processed_content>", "", content)
+        with stage("parsing"):
+            return render_vlm_output(vlm_output)
 
-        # Process text tags
-        # We use a loop to handle multiple text blocks
-        def replace_text(match):
-            return match.group(1).strip() + "\n\n"
+    async def process_file(
+        self,
+        file: UploadFile,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> str:
+        extraction = await self.extract_file(file, document_key, on_delta)
+        return extraction.content
 
-        content = re.sub(r"<text>(.*?)</text>", replace_text, content, flags=re.DOTALL)
-
-        # Process figure_caption tags
-        def replace_caption(match):
-            return f"[Image: {match.group(1).strip()}]\n\n"
-
-        content = re.sub(
-            r"<figure_caption>(.*?)</figure_caption>",
-            replace_caption,
-            content,
-            flags=re.DOTALL,
-        )
-
-        # Clean up extra newlines
-        content = re.sub(r"\n{3,}", "\n\n", content)
-
-        return content.strip()
-
-    async def process_file(self, file: UploadFile) -> str:
-        logger.info(f"Starting processing for file: {file.filename}")
+    async def extract_file(
+        self,
+        file: UploadFile,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> Extraction:
+        """
+        Extract the text of a file, with the status of each page / image the
+        VLM transcribed. Extractions with failed units are kept in the
+        extraction store for `retry_failed`.
+        """
+        logger.info("Starting processing for file: %s", file.filename)
         content = await file.read()
         filename = file.filename.lower()
+        # Key of the document's queue in the fair VLM scheduler, unique per upload
+        document_key = document_key or uuid.uuid4().hex
 
         try:
-            if filename.endswith(".pdf"):
-                result = await self._process_pdf(content)
-            elif filename.endswith(".docx"):
-                result = await self._process_docx(content)
-            elif (
-                filename.endswith(".txt")
-                or filename.endswith(".md")
-                or filename.endswith(".csv")
-                or filename.endswith(".json")
-            ):
-                result = content.decode("utf-8")
+            if on_delta is None and current_profile() is None:
+                # The same file uploaded again while it is still being processed
+                # shares the in-flight result (unless this request is profiled);
+                # its usage is reported by the upload that did the work
+                extension = os.path.splitext(filename)[1]
+                extraction, shared = await file_flights.join(
+                    flight_key(extension, content),
+                    lambda: self._process_content(filename, content, document_key),
+                )
+                if shared:
+                    extraction = extraction.copy()
+                    extraction.filename = filename
+                    self.usage.mark_shared()
             else:
-                raise ValueError(f"Unsupported file type: {filename}")
-
-            logger.info(f"Successfully processed file: {file.filename}")
-            return result
+                extraction = await self._process_content(filename, content, document_key, on_delta)
         except Exception as e:
-            logger.error(f"Error processing file {file.filename}: {e}")
+            logger.error("Error processing file %s: %s", file.filename, e)
             raise e
 
-    async def _process_pdf_page(self, page_num: int, img_data: bytes) -> str:
-        async with self.semaphore:
+        failed = len(extraction.failed_units)
+        if failed:
+            logger.warning("Processed file %s with %d failed pages/images", file.filename, failed)
+            # The file is kept instead of the images of its failed units, which
+            # are rendered again on retry
+            extraction.source = content
+            extraction_store.put(extraction)
+        else:
+            logger.info("Successfully processed file: %s", file.filename)
+        return extraction
+
+    async def retry_failed(self, extraction: Extraction) -> Extraction:
+        """
+        Transcribe the failed pages / images of an extraction again, splicing
+        the new text in place. Raises ValueError when the extraction's file
+        wasn't kept (larger than EXTRACTION_SOURCE_MAX_BYTES).
+        """
+        failed = extraction.failed_units
+        if not failed:
+            return extraction
+        if extraction.source is None:
+            raise ValueError(
+                f"The file of extraction {extraction.id} is too large to be kept for retries, upload it again"
+            )
+        self.scheduler.admit(BULK, len(failed))
+        logger.info("Retrying %d failed pages/images of %s", len(failed), extraction.filename)
+        images = await self._render_units(extraction, {unit.index for unit in failed})
+        await asyncio.gather(*(self._transcribe(unit, images[unit.index], extraction.id) for unit in failed))
+        extraction_store.put(extraction)
+        return extraction
+
+    async def _render_units(self, extraction: Extraction, indexes: Set[int]) -> Dict[int, bytes]:
+        """
+        The images of the pages (PDF) or images (DOCX) `indexes` of an
+        extraction, rendered again from its source file.
+        """
+        images: Dict[int, bytes] = {}
+        if extraction.filename.endswith(".pdf"):
+            import fitz  # PyMuPDF
+
+            loop = asyncio.get_event_loop()
+            doc = await loop.run_in_executor(None, lambda: fitz.open(stream=extraction.source, filetype="pdf"))
             try:
-                logger.info(f"Calling VLM for page {page_num + 1}")
-                # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
-                loop = asyncio.get_event_loop()
-                vlm_output = await loop.run_in_executor(
-                    None,
-                    self.vlm_client.get_image_caption,
-                    img_data,
-                    VLM_PROCESS_DOCUMENT_PAGE_PROMPT,
-                )
-                parsed_text = self._parse_vlm_output(vlm_output)
-                logger.info(f"Finished VLM for page {page_num + 1}")
-                return f"--- Page {page_num + 1} ---\n{parsed_text}\n"
-            except Exception as e:
-                logger.error(f"Error processing page {page_num + 1}: {e}")
-                return f"--- Page {page_num + 1} (Error) ---\n[Error processing page: {e}]\n"
-
-    async def _process_pdf(self, content: bytes) -> str:
-        doc = fitz.open(stream=content, filetype="pdf")
-        total_pages = len(doc)
-        logger.info(f"Processing PDF with {total_pages} pages")
+                for index in sorted(indexes):
+                    images[index] = await loop.run_in_executor(None, self._render_pdf_page, doc, index)
+            finally:
+                doc.close()
+        else:
+            # Images are numbered in the order of their first appearance, as in _process_docx
+            seen: Set[str] = set()
+            async for kind, value in iterate_in_thread(iter_docx_blocks, extraction.source):
+                if kind == "text" or value[0] in seen:
+                    continue
+                if len(seen) in indexes:
+                    images[len(seen)] = value[1]
+                seen.add(value[0])
+        return images
 
-        tasks = []
-        for page_num, page in enumerate(doc):
-            # Render page to image
-            # zoom=2 for better resolution for OCR
-            matrix = fitz.Matrix(2, 2)
-            pix = page.get_pixmap(matrix=matrix)
-            img_data = pix.tobytes("png")
+    async def _process_content(
+        self,
+        filename: str,
+        content: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> Extraction:
+        if filename.endswith(".pdf"):
+            return Extraction(filename, await self._process_pdf(content, document_key, on_delta))
+        elif filename.endswith(".docx"):
+            return Extraction(filename, await self._process_docx(content, document_key, on_delta))
+        elif (
+            filename.endswith(".txt")
+            or filename.endswith(".md")
+            or filename.endswith(".csv")
+            or filename.endswith(".json")
+            or filename.endswith(".jsonl")
+        ):
+            with stage("parsing"):
+                return Extraction(filename, [content.decode("utf-8")])
+        else:
+            raise ValueError(f"Unsupported file type: {filename}")
 
-            tasks.append(self._process_pdf_page(page_num, img_data))
+    @staticmethod
+    async def chunk_records(
+        file: UploadFile, options: ChunkingOptions
+    ) -> AsyncIterator[RecordChunk]:
+        """
+        Chunk a CSV / JSON / JSONL upload into whole records while reading it
+        block by block, without decoding or holding the whole file.
+        """
+        logger.info("Chunking records of file: %s", file.filename)
+        blocks = iter(lambda: file.file.read(BLOCK_SIZE), b"")
+        async for chunk in iterate_in_thread(
+            lambda: RecordChunker.chunk_stream(
+                blocks,
+                options.chunk_size,
+                record_format=options.record_format,
+                repeat_header=options.repeat_header,
+                size_unit=options.size_unit,
+                filename=file.filename,
+            )
+        ):
+            yield chunk
 
-        results = await asyncio.gather(*tasks)
-        return "\n".join(results)
+    async def process_file_stream(self, file: UploadFile) -> AsyncIterator[dict]:
+        """
+        Process a file while streaming the VLM output: yields
+        {"type": "delta", "page"|"image": n, "delta": text} events as pages and
+        images are transcribed, then {"type": "done", "content": ..., "units":
+        ..., "usage": ...}.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
 
-    async def _process_docx_image(self, index: int, image_data: bytes) -> str:
-        async with self.semaphore:
-            try:
-                logger.info(f"Processing image {index + 1} in DOCX")
-                # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
-                loop = asyncio.get_event_loop()
-                vlm_output = await loop.run_in_executor(
-                    None,
-                    self.vlm_client.get_image_caption,
-                    image_data,
-                    VLM_PROCESS_DOCUMENT_PAGE_PROMPT,
-                )
-                parsed_caption = self._parse_vlm_output(vlm_output)
-                logger.info(f"Finished processing image {index + 1}")
-                return parsed_caption
-            except Exception as e:
-                logger.error(f"Failed to process image {index + 1} in DOCX: {e}")
-                return f"[Error processing image {index + 1}: {e}]"
-
-    async def _process_docx(self, content: bytes) -> str:
-        logger.info("Processing DOCX file")
-        # python-docx is synchronous and CPU bound, so we run it in executor
-        loop = asyncio.get_event_loop()
-        doc = await loop.run_in_executor(
-            None, lambda: docx.Document(io.BytesIO(content))
-        )
+        def on_delta(unit: str, index: int, text: str):
+            queue.put_nowait({"type": "delta", unit: index + 1, "delta": text})
+
+        task = asyncio.ensure_future(self.extract_file(file, on_delta=on_delta))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            extraction = task.result()
+            yield {
+                "type": "done",
+                "content": extraction.content,
+                **extraction.report(),
+                "usage": self.usage.report().model_dump(),
+            }
+        finally:
+            task.cancel()
+
+    async def _run_vlm(
+        self,
+        image_data: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+        unit: str = "page",
+        index: int = 0,
+    ) -> str:
+        """
+        Raw VLM output for one page/image. Identical images in flight at the
+        same time share one call. With `on_delta`, the completion is streamed
+        and its rendered text reported as it arrives.
+        """
+        if on_delta is None:
 
-        full_text = []
+            async def run() -> Tuple[str, object]:
+                # The result carries the client whose tracker recorded the call's usage
+                if self.work_queue is not None:
+                    with self.scheduler.offloaded(BULK), stage("vlm_call"):
+                        result = await self.work_queue.submit(
+                            "vlm",
+                            {
+                                "image": base64.b64encode(image_data).decode("ascii"),
+                                "prompt": VLM_PROCESS_DOCUMENT_PAGE_PROMPT,
+                                "document_key": document_key,
+                            },
+                        )
+                    self.usage.add("vlm", TokenUsage(**result["usage"]))
+                    return result["text"], self.vlm_client
+                async with self.scheduler.slot(document_key):
+                    # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
+                    with stage("vlm_call"):
+                        text = await run_in_thread(
+                            self.vlm_client.get_image_caption, image_data, VLM_PROCESS_DOCUMENT_PAGE_PROMPT
+                        )
+                        return text, self.vlm_client
 
-        # Extract text from paragraphs
-        logger.info("Extracting text from paragraphs")
-        for para in doc.paragraphs:
-            if para.text.strip():
-                full_text.append(para.text)
+            key = flight_key(self.vlm_client.model_name, VLM_PROCESS_DOCUMENT_PAGE_PROMPT, image_data)
+            (text, caller), shared = await vlm_calls.join(key, run)
+            # Usage recorded by another upload's client isn't reported by this one
+            if shared and caller is not self.vlm_client:
+                self.usage.mark_shared()
+            return text
 
-        # Extract images and caption them
-        logger.info("Scanning for images in DOCX")
-        image_tasks = []
+        async with self.scheduler.slot(document_key):
+            renderer = VLMOutputStream()
+            pieces = []
+            with stage("vlm_call"):
+                async for piece in iterate_in_thread(
+                    self.vlm_client.stream_image_caption, image_data, VLM_PROCESS_DOCUMENT_PAGE_PROMPT
+                ):
+                    pieces.append(piece)
+                    delta = renderer.feed(piece)
+                    if delta:
+                        on_delta(unit, index, delta)
+            delta = renderer.close()
+            if delta:
+                on_delta(unit, index, delta)
+            return "".join(pieces)
 
-        for i, rel in enumerate(doc.part.rels.values()):
-            if "image" in rel.target_ref:
+    async def _transcribe(
+        self,
+        unit: ExtractedUnit,
+        image_data: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> ExtractedUnit:
+        """
+        Transcribe one page/image into `unit`, retrying failed VLM calls with
+        exponential backoff. A unit still failing after `max_attempts`, or
+        with an error a retry won't fix, keeps its error.
+        """
+        label = f"{unit.unit} {unit.index + 1}"
+        streamed = False
+
+        def on_unit_delta(kind: str, index: int, text: str):
+            nonlocal streamed
+            streamed = True
+            on_delta(kind, index, text)
+
+        # Records logged for the unit, here and in the VLM client, carry its page/image number
+        with log_context(**{unit.unit: unit.index + 1}):
+            for attempt in range(1, self.max_attempts + 1):
+                unit.attempts += 1
                 try:
-                    image_data = rel.target_part.blob
-                    image_tasks.append(self._process_docx_image(i, image_data))
+                    logger.debug("Calling VLM for %s", label, extra=SAMPLED)
+                    vlm_output = await self._run_vlm(
+                        image_data, document_key, on_unit_delta if on_delta else None, unit.unit, unit.index
+                    )
+                    unit.text = self._parse_vlm_output(vlm_output)
+                    unit.error = None
+                    logger.debug("Finished VLM for %s", label, extra=SAMPLED)
+                    return unit
                 except Exception as e:
-                    logger.error(f"Failed to extract image data for image {i + 1}: {e}")
+                    # Text already streamed to the client can't be taken back
+                    if attempt == self.max_attempts or streamed or not is_endpoint_error(e):
+                        logger.error("Error processing %s: %s", label, e)
+                        unit.error = str(e)
+                        metrics.inc(
+                            "vlm_units_failed_total",
+                            help_text="Pages and images left untranscribed after all attempts.",
+                            unit=unit.unit,
+                        )
+                        return unit
+                    delay = min(MAX_RETRY_BACKOFF, self.retry_backoff * 2 ** (attempt - 1))
+                    delay *= random.uniform(0.5, 1.0)
+                    logger.warning("Error processing %s (attempt %d), retrying in %.1fs: %s", label, attempt, delay, e)
+                    metrics.inc(
+                        "vlm_unit_retries_total",
+                        help_text="Page and image transcriptions attempted again after an error.",
+                        unit=unit.unit,
+                    )
+                    await asyncio.sleep(delay)
+
+    async def _process_pdf_page(
+        self,
+        page_num: int,
+        img_data: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> ExtractedUnit:
+        return await self._transcribe(ExtractedUnit("page", page_num), img_data, document_key, on_delta)
+
+    @staticmethod
+    def _render_pdf_page(doc, page_num: int) -> bytes:
+        import fitz  # PyMuPDF
+
+        # Render page to image
+        # zoom=2 for better resolution for OCR
+        matrix = fitz.Matrix(2, 2)
+        pix = doc[page_num].get_pixmap(matrix=matrix)
+        return pix.tobytes("png")
+
+    async def _process_pdf(
+        self,
+        content: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> List[ExtractedUnit]:
+        import fitz  # PyMuPDF, imported on first use to keep startup fast
+
+        loop = asyncio.get_event_loop()
+        with stage("parsing"):
+            doc = await loop.run_in_executor(
+                None, lambda: fitz.open(stream=content, filetype="pdf")
+            )
+        total_pages = len(doc)
+        logger.info("Processing PDF with %d pages", total_pages)
+        try:
+            self.scheduler.admit(BULK, total_pages)
+        except Exception:
+            doc.close()
+            raise
+
+        # A render still running in its thread when this is cancelled finishes
+        # before the document is closed
+        lock = threading.Lock()
+
+        def render(page_num: int) -> bytes:
+            with lock:
+                return self._render_pdf_page(doc, page_num)
+
+        def close():
+            with lock:
+                doc.close()
+
+        # Pages are rendered off the event loop, and each page is queued for the VLM
+        # as soon as it is rendered
+        tasks = []
+        try:
+            for page_num in range(total_pages):
+                with stage("pdf_render"):
+                    img_data = await loop.run_in_executor(None, render, page_num)
+                tasks.append(
+                    asyncio.ensure_future(
+                        self._process_pdf_page(page_num, img_data, document_key, on_delta)
+                    )
+                )
+            return await asyncio.gather(*tasks)
+        finally:
+            # On a render error or cancellation, the pages already queued are not left running
+            for task in tasks:
+                task.cancel()
+            loop.run_in_executor(None, close)
+
+    async def _process_docx_image(
+        self,
+        index: int,
+        image_data: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> ExtractedUnit:
+        return await self._transcribe(ExtractedUnit("image", index), image_data, document_key, on_delta)
+
+    async def _process_docx(
+        self,
+        content: bytes,
+        document_key: Optional[str] = None,
+        on_delta: Optional[DeltaCallback] = None,
+    ) -> List[Union[str, ExtractedUnit]]:
+        logger.info("Processing DOCX file")
+        # The document is parsed in a thread as a stream of blocks; each image is
+        # queued for the VLM as soon as it is reached and its caption is put back
+        # where the image appeared
+        parts: List[Union[str, asyncio.Future]] = []
+        captions: Dict[str, asyncio.Future] = {}
+        try:
+            with stage("parsing"):
+                async for kind, value in iterate_in_thread(iter_docx_blocks, content):
+                    if kind == "text":
+                        parts.append(value)
+                        continue
+                    rel_id, image_data = value
+                    if rel_id not in captions:
+                        captions[rel_id] = asyncio.ensure_future(
+                            self._process_docx_image(len(captions), image_data, document_key, on_delta)
+                        )
+                    parts.append(captions[rel_id])
 
-        if image_tasks:
-            image_captions = await asyncio.gather(*image_tasks)
-            full_text.append("\n--- Extracted Images Content ---\n")
-            full_text.extend(image_captions)
+            if captions:
+                logger.info("Waiting for %d DOCX image captions", len(captions))
+                await asyncio.gather(*captions.values())
+        finally:
+            for task in captions.values():
+                task.cancel()
 
-        return "\n".join(full_text)
+        return [part if isinstance(part, str) else part.result() for part in parts]
@@ -1,59 +1,102 @@
+import os
+import asyncio
 import logging
-from typing import List
-from app.schemas.process import ProcessRequest, ProcessResponse, Chunk
+import contextvars
+from typing import Dict, List, Optional, Set, Tuple, Union
+from app.schemas.process import (
+    ProcessRequest,
+    ProcessResponse,
+    ProcessingOptions,
+    Chunk,
+    CompactChunk,
+    CompactProcessResponse,
+    DedupReport,
+    QualityReport,
+    UsageReport,
+)
+from app.services.chunk_span import ChunkSpan
 from app.services.chunking_service import RuleBasedChunker, SemanticChunker
+from app.services.dedup_service import ChunkDeduplicator
+from app.services.parallel_chunking import chunk_recursively_parallel, use_parallel_chunking
+from app.services.export_service import ExportService
+from app.services.record_chunker import RecordChunker
+from app.services.result_store import result_store
 from app.services.processing_service import ProcessingService
-from app.core.embedding_client import EmbeddingClient
+from app.services.quality_check import DEFAULT_THRESHOLD, QualityChecker
+from app.core.embedding_client import EmbeddingClient, create_embedding_backend
 from app.core.llm_client import LLMClient
-import tiktoken
+from app.core.metrics import metrics
+from app.core.profiling import current_profile, stage
+from app.core.scheduling import INTERACTIVE
+from app.core.singleflight import SingleFlight, flight_key
+from app.core.tokenizer import count_tokens
+from app.core.usage import UsageTracker
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+request_flights = SingleFlight("process")
+
+# Texts from this long are chunked in a thread, off the event loop
+PLAN_IN_THREAD_MIN_CHARS = 1_000_000
+
+
+class _ProcessingPlan:
+    """
+    The chunks of one request and the subset that still needs LLM calls.
+    """
+
+    def __init__(self, chunks: List[ChunkSpan]):
+        self.chunks = chunks  # Output chunks, in order
+        self.to_process = chunks  # One representative per duplicate group
+        self.pending: List[ChunkSpan] = chunks  # Representatives without a reusable result
+        self.reused: List[ChunkSpan] = []
+        self.duplicates: Dict[int, List[ChunkSpan]] = {}
+        self.dedup_report: Optional[DedupReport] = None
+        self.skip_clean: Set[int] = set()  # Ids of pending chunks the quality check found clean
+        self.quality_report: Optional[QualityReport] = None
+        self.compact = False
+        self.clean = False
+        self.summarize = False
+        self.estimated_wait = 0.0  # Seconds until the LLM calls are expected to start
+
 
 class Orchestrator:
-    def __init__(self):
+    def __init__(self, client_key: Optional[str] = None):
         # Initialize clients lazily or here.
         # For simplicity, we initialize them here, assuming env vars are set.
+        # All clients record into one tracker so usage is reported per request.
+        self.usage = UsageTracker()
+
         try:
-            self.embedding_client = EmbeddingClient()
+            self.embedding_client = EmbeddingClient(usage_tracker=self.usage)
             self.semantic_chunker = SemanticChunker(self.embedding_client)
         except Exception as e:
-            logger.warning(f"Could not initialize EmbeddingClient: {e}")
+            logger.warning("Could not initialize EmbeddingClient: %s", e)
             self.semantic_chunker = None
 
         try:
-            self.llm_client = LLMClient()
-            self.processing_service = ProcessingService(self.llm_client)
+            self.llm_client = LLMClient(usage_tracker=self.usage)
+            self.processing_service = ProcessingService(
+                self.llm_client, client_key=client_key
+            )
         except Exception as e:
-            logger.warning(f"Could not initialize LLMClient: {e}")
+            logger.warning("Could not initialize LLMClient: %s", e)
             self.processing_service = None
 
-        try:
-            self.tokenizer = tiktoken.get_encoding(
-                "cl100k_base"
-            )  # Default for GPT-4/3.5
-        except Exception as e:
-            logger.warning(f"Could not initialize tokenizer: {e}")
-            self.tokenizer = None
+        self.export_service = ExportService(usage_tracker=self.usage)
 
     def _count_tokens(self, text: str) -> int:
-        if self.tokenizer:
-            return len(self.tokenizer.encode(text))
-        return 0
-
-    async def process(self, request: ProcessRequest) -> ProcessResponse:
-        logger.info(f"Starting processing request. Text length: {len(request.text)}")
-        chunks: List[Chunk] = []
+        # The encoding is loaded once per process (see app.core.tokenizer)
+        with stage("token_counting"):
+            return count_tokens(text)
 
-        # 1. Chunking Phase
+    def _chunk_text(self, request: ProcessRequest) -> List[ChunkSpan]:
         method = request.chunking_options.method
         chunk_size = request.chunking_options.chunk_size
         chunk_overlap = request.chunking_options.chunk_overlap
 
         logger.info(
-            f"Chunking method: {method}, Size: {chunk_size}, Overlap: {chunk_overlap}"
+            "Chunking method: %s, Size: %s, Overlap: %s", method, chunk_size, chunk_overlap
         )
 
         if method == "fixed_size":
@@ -61,134 +104,464 @@ class Orchestrator:
                 request.text, chunk_size, chunk_overlap
             )
         elif method == "semantic":
-            if self.semantic_chunker:
-                threshold = request.chunking_options.semantic_threshold or 0.5
-                chunks = self.semantic_chunker.chunk_by_semantics(
-                    request.text, threshold=threshold
-                )
-            else:
-                # Fallback
-                logger.warning(
-                    "Semantic chunker not available, falling back to fixed size."
-                )
-                chunks = RuleBasedChunker.chunk_by_fixed_size(
-                    request.text, chunk_size, chunk_overlap
+            options = request.chunking_options
+            backend = options.embedding_backend or os.getenv("EMBEDDING_BACKEND", "remote")
+            kwargs = dict(
+                threshold=options.semantic_threshold or 0.5,
+                breakpoint_type=options.semantic_breakpoint,
+                breakpoint_amount=options.semantic_breakpoint_amount,
+                max_chunk_size=chunk_size,
+                min_chunk_size=options.min_chunk_size,
+                size_unit=options.size_unit,
+            )
+            chunks = None
+            if backend == "remote" and self.semantic_chunker:
+                try:
+                    chunks = self.semantic_chunker.chunk_by_semantics(request.text, **kwargs)
+                except Exception as e:
+                    logger.warning("Remote embeddings failed (%s), using the local backend.", e)
+            elif backend == "remote":
+                logger.warning("Remote embedding backend not available, using the local backend.")
+            if chunks is None:
+                chunks = SemanticChunker(
+                    create_embedding_backend("local")
+                ).chunk_by_semantics(request.text, **kwargs)
+        elif method == "records":
+            options = request.chunking_options
+            chunks = [
+                ChunkSpan.of(request.text, chunk.original_index, chunk.content)
+                for chunk in RecordChunker.chunk_text(
+                    request.text,
+                    chunk_size,
+                    record_format=options.record_format,
+                    repeat_header=options.repeat_header,
+                    size_unit=options.size_unit,
                 )
+            ]
         elif method == "recursive":
             separators = request.chunking_options.separators
-            chunks = RuleBasedChunker.chunk_recursively(
-                request.text, chunk_size, chunk_overlap, separators=separators
-            )
+            if use_parallel_chunking(request.text):
+                chunks = chunk_recursively_parallel(request.text, chunk_size, separators=separators)
+            else:
+                chunks = RuleBasedChunker.chunk_recursively(
+                    request.text, chunk_size, chunk_overlap, separators=separators
+                )
         else:
             # Default fallback
             chunks = RuleBasedChunker.chunk_by_fixed_size(
                 request.text, chunk_size, chunk_overlap
             )
 
-        logger.info(f"Generated {len(chunks)} chunks")
+        logger.info("Generated %d chunks", len(chunks))
+        return chunks
 
-        # 2. Processing Phase
-        if self.processing_service:
-            clean = request.processing_options.clean_text
-            summarize = request.processing_options.generate_summary
-
-            if clean or summarize:
-                logger.info(f"Processing chunks: Clean={clean}, Summarize={summarize}")
-                chunks = await self.processing_service.process_chunks(
-                    chunks, clean=clean, summarize=summarize
+    def _deduplicate(
+        self, chunks: List[ChunkSpan], options: ProcessingOptions
+    ) -> Tuple[List[ChunkSpan], List[ChunkSpan], Dict[int, List[ChunkSpan]], DedupReport]:
+        """
+        Collapse duplicate chunks so only one representative per group is sent to the LLM.
+        Returns the output chunks, the chunks to process, the duplicates of each
+        representative (keyed by id) and the report.
+
+        Only exact duplicates (same normalized text) reuse each other's
+        results; with fan_out, the first copy of each near duplicate is
+        processed on its own, as its text differs, and later copies of it
+        reuse that copy's results. A cleaned text is only reused by copies
+        whose raw text is identical: one differing in page framing, case or
+        spacing is cleaned on its own.
+        """
+        deduplicator = ChunkDeduplicator(max_distance=options.dedup_max_distance)
+        representatives, first_copies = deduplicator.group_chunks(chunks)
+        calls_per_chunk = int(options.clean_text) + int(options.generate_summary)
+
+        to_process: List[ChunkSpan] = []
+        duplicates: Dict[int, List[ChunkSpan]] = {}
+        output: List[ChunkSpan] = []
+        near_count = 0
+        for i, chunk in enumerate(chunks):
+            if representatives[i] == i:
+                to_process.append(chunk)
+                output.append(chunk)
+                continue
+            near_count += first_copies[i] != representatives[i]
+            if options.dedup_mode == "drop":
+                continue
+            first = chunks[first_copies[i]]
+            if first is chunk or (options.clean_text and chunk.content != first.content):
+                to_process.append(chunk)
+            else:
+                duplicates.setdefault(id(first), []).append(chunk)
+            output.append(chunk)
+
+        skipped = len(chunks) - len(to_process)
+        report = DedupReport(
+            duplicate_chunks=sum(i != rep_index for i, rep_index in enumerate(representatives)),
+            near_duplicate_chunks=near_count,
+            dropped_chunks=len(chunks) - len(output),
+            llm_calls_saved=skipped * calls_per_chunk,
+        )
+        logger.info(
+            "Deduplication: %d duplicates (%d near), %d LLM calls saved",
+            report.duplicate_chunks,
+            near_count,
+            report.llm_calls_saved,
+        )
+        metrics.inc(
+            "dedup_llm_calls_saved_total",
+            report.llm_calls_saved,
+            help_text="LLM calls skipped by chunk deduplication.",
+        )
+        return output, to_process, duplicates, report
+
+    @staticmethod
+    def _fan_out(rep: ChunkSpan, duplicates: List[ChunkSpan], clean: bool, summarize: bool):
+        """
+        Copy the representative's results to its duplicates; when cleaning,
+        `_deduplicate` only lists duplicates whose raw text is the representative's.
+        """
+        for duplicate in duplicates:
+            if clean:
+                duplicate.content = rep.content
+            if summarize:
+                duplicate.summary = rep.summary
+
+    @staticmethod
+    def _compact_chunk(chunk: ChunkSpan) -> dict:
+        compact = {"start": chunk.start, "end": chunk.end}
+        content = chunk.edited_content
+        if content is not None and not (
+            len(content) == chunk.end - chunk.start and chunk.source.startswith(content, chunk.start)
+        ):
+            compact["content"] = content
+        if chunk.summary is not None:
+            compact["summary"] = chunk.summary
+        if chunk.token_count is not None:
+            compact["token_count"] = chunk.token_count
+        if chunk.content_hash is not None:
+            compact["content_hash"] = chunk.content_hash
+        return compact
+
+    @staticmethod
+    def _precheck(plan: "_ProcessingPlan", options: ProcessingOptions):
+        """
+        Score the chunks waiting for cleaning locally, so only noisy ones are
+        sent to the LLM.
+        """
+        enabled = options.clean_precheck
+        if enabled is None:
+            enabled = os.getenv("CLEAN_PRECHECK", "false").lower() in ("1", "true", "yes")
+        if not (enabled and plan.clean and plan.pending):
+            return
+        threshold = options.clean_precheck_threshold
+        if threshold is None:
+            threshold = float(os.getenv("CLEAN_PRECHECK_THRESHOLD", DEFAULT_THRESHOLD))
+
+        with stage("quality_check"):
+            flags = QualityChecker(threshold).needs_cleaning(
+                [chunk.content for chunk in plan.pending],
+                context=[chunk.content for chunk in plan.chunks],
+            )
+        plan.skip_clean = {id(chunk) for chunk, noisy in zip(plan.pending, flags) if not noisy}
+        plan.quality_report = QualityReport(
+            checked_chunks=len(plan.pending), skipped_chunks=len(plan.skip_clean)
+        )
+        logger.info(
+            "Quality check: %d of %d chunks need no cleaning", len(plan.skip_clean), len(plan.pending)
+        )
+        metrics.inc(
+            "clean_llm_calls_skipped_total",
+            len(plan.skip_clean),
+            help_text="LLM cleaning calls skipped because the quality check found the chunk clean.",
+        )
+
+    def _reusable_hashes(self, request: ProcessRequest) -> Set[str]:
+        hashes = set(request.previous_chunk_hashes or [])
+        if request.previous_session_id:
+            session_hashes = result_store.session_hashes(request.previous_session_id)
+            if session_hashes is None:
+                logger.warning(
+                    "Unknown or expired session %s, processing from scratch", request.previous_session_id
                 )
+            else:
+                hashes |= session_hashes
+        return hashes
 
-        # 3. Token Counting
+    def _plan(self, request: ProcessRequest) -> "_ProcessingPlan":
+        """
+        Chunk the text, then narrow the chunks down to those that really need LLM calls:
+        duplicates are collapsed and unchanged chunks reuse stored results.
+        """
+        options = request.processing_options
+        if request.export:
+            ExportService.check_format(request.export.format)
+        with stage("chunking"):
+            plan = _ProcessingPlan(self._chunk_text(request))
+        plan.clean = options.clean_text
+        plan.summarize = options.generate_summary
+        plan.compact = request.response_format == "compact"
+
+        if options.deduplicate:
+            plan.chunks, plan.to_process, plan.duplicates, plan.dedup_report = (
+                self._deduplicate(plan.chunks, options)
+            )
+
+        if not (self.processing_service and (plan.clean or plan.summarize)):
+            plan.clean = plan.summarize = False
+            plan.pending = []
+            return plan
+
+        for chunk in plan.chunks:
+            chunk.content_hash = result_store.content_hash(chunk.content)
+
+        reusable = self._reusable_hashes(request)
+        plan.pending = []
+        for chunk in plan.to_process:
+            result = None
+            if chunk.content_hash in reusable:
+                result = result_store.get(self._result_key(plan, chunk))
+            if result is None:
+                plan.pending.append(chunk)
+                continue
+            if plan.clean:
+                chunk.content = result["content"]
+            if plan.summarize:
+                chunk.summary = result["summary"]
+            plan.reused.append(chunk)
+
+        if plan.reused:
+            logger.info("Reusing processed results for %d chunks", len(plan.reused))
+            metrics.inc(
+                "incremental_chunks_reused_total",
+                len(plan.reused),
+                help_text="Chunks whose processed result was reused from a previous request.",
+            )
+
+        self._precheck(plan, options)
+
+        # Admission control: reject before any LLM call if the backlog is too long
+        if plan.pending:
+            calls = len(plan.pending) * (int(plan.clean) + int(plan.summarize)) - len(plan.skip_clean)
+            plan.estimated_wait = self.processing_service.admit(calls)
+        return plan
+
+    async def _plan_off_loop(self, request: ProcessRequest) -> "_ProcessingPlan":
+        """
+        `_plan` in a thread for long texts, so chunking them doesn't block the
+        event loop (and the other requests on it).
+        """
+        if len(request.text) < PLAN_IN_THREAD_MIN_CHARS:
+            return self._plan(request)
+        loop = asyncio.get_event_loop()
+        # The context carries the request's profile into the thread
+        return await loop.run_in_executor(None, contextvars.copy_context().run, self._plan, request)
+
+    def _store_results(self, plan: "_ProcessingPlan", chunks: List[ChunkSpan]):
         for chunk in chunks:
-            chunk.token_count = self._count_tokens(chunk.content)
+            # A chunk the quality check let through uncleaned is no cleaned result
+            if plan.clean and id(chunk) in plan.skip_clean:
+                continue
+            result_store.put(
+                self._result_key(plan, chunk), {"content": chunk.content, "summary": chunk.summary}
+            )
 
-        logger.info("Processing complete")
-        return ProcessResponse(chunks=chunks, total_chunks=len(chunks))
+    def _result_key(self, plan: "_ProcessingPlan", chunk: ChunkSpan) -> str:
+        return result_store.result_key(
+            chunk.content_hash,
+            plan.clean,
+            plan.summarize,
+            self.processing_service.model_name,
+            self.processing_service.prompt_version,
+        )
 
-    async def process_stream(self, request: ProcessRequest):
-        logger.info(f"Starting streaming processing request. Text length: {len(request.text)}")
-        chunks: List[Chunk] = []
+    def _finish_session(self, plan: "_ProcessingPlan") -> Optional[str]:
+        if not (plan.clean or plan.summarize):
+            return None
+        return result_store.create_session(chunk.content_hash for chunk in plan.to_process)
+
+    async def process(
+        self, request: ProcessRequest
+    ) -> Union[ProcessResponse, CompactProcessResponse]:
+        # A profiled request does its own work rather than joining another one
+        if current_profile() is not None:
+            return await self._process(request)
+        # Identical requests in flight at the same time (same text and options)
+        # share one computation and all receive its response
+        key = flight_key(request.model_dump_json())
+        response, shared = await request_flights.join(key, lambda: self._process(request))
+        if shared and response.usage is not None:
+            response = response.model_copy(update={"usage": UsageReport(shared=True)})
+        return response
+
+    async def _process(
+        self, request: ProcessRequest
+    ) -> Union[ProcessResponse, CompactProcessResponse]:
+        logger.info("Starting processing request. Text length: %d", len(request.text))
 
         # 1. Chunking Phase
-        method = request.chunking_options.method
-        chunk_size = request.chunking_options.chunk_size
-        chunk_overlap = request.chunking_options.chunk_overlap
+        plan = await self._plan_off_loop(request)
+        chunks = plan.chunks
 
-        if method == "fixed_size":
-            chunks = RuleBasedChunker.chunk_by_fixed_size(
-                request.text, chunk_size, chunk_overlap
+        # 2. Processing Phase
+        if plan.pending:
+            logger.info(
+                "Processing chunks: Clean=%s, Summarize=%s", plan.clean, plan.summarize
             )
-        elif method == "semantic":
-            if self.semantic_chunker:
-                threshold = request.chunking_options.semantic_threshold or 0.5
-                chunks = self.semantic_chunker.chunk_by_semantics(
-                    request.text, threshold=threshold
-                )
-            else:
-                chunks = RuleBasedChunker.chunk_by_fixed_size(
-                    request.text, chunk_size, chunk_overlap
-                )
-        elif method == "recursive":
-            separators = request.chunking_options.separators
-            chunks = RuleBasedChunker.chunk_recursively(
-                request.text, chunk_size, chunk_overlap, separators=separators
+            # Chunks are updated in place, so duplicates can copy from their representative
+            await self.processing_service.process_chunks(
+                plan.pending, clean=plan.clean, summarize=plan.summarize, skip_clean=plan.skip_clean
             )
-        else:
-            chunks = RuleBasedChunker.chunk_by_fixed_size(
-                request.text, chunk_size, chunk_overlap
+            self._store_results(plan, plan.pending)
+        for rep in plan.to_process:
+            self._fan_out(
+                rep, plan.duplicates.get(id(rep), []), plan.clean, plan.summarize
             )
+        session_id = self._finish_session(plan)
 
-        logger.info(f"Generated {len(chunks)} chunks")
+        # 3. Token Counting
+        for chunk in chunks:
+            chunk.token_count = self._count_tokens(chunk.content)
+
+        # 4. Export Phase (optional)
+        export = None
+        if request.export:
+            export = await self.export_service.export(chunks, request.export)
+
+        logger.info("Processing complete")
+        if plan.compact:
+            return CompactProcessResponse(
+                chunks=[CompactChunk(**self._compact_chunk(chunk)) for chunk in chunks],
+                total_chunks=len(chunks),
+                usage=self.usage.report(),
+                dedup=plan.dedup_report,
+                quality=plan.quality_report,
+                session_id=session_id,
+                reused_chunks=len(plan.reused),
+                export=export,
+            )
+        return ProcessResponse(
+            chunks=[chunk.to_chunk() for chunk in chunks],
+            total_chunks=len(chunks),
+            usage=self.usage.report(),
+            dedup=plan.dedup_report,
+            quality=plan.quality_report,
+            session_id=session_id,
+            reused_chunks=len(plan.reused),
+            export=export,
+        )
+
+    def _progress_event(
+        self,
+        plan: "_ProcessingPlan",
+        processed: int,
+        session_id: Optional[str] = None,
+    ) -> dict:
+        event = {
+            "type": "progress",
+            "total_chunks": len(plan.chunks),
+            "processed_chunks": processed,
+            "usage": self.usage.report().model_dump(),
+            "reused_chunks": len(plan.reused),
+        }
+        if processed == 0 and plan.estimated_wait:
+            event["estimated_wait"] = round(plan.estimated_wait, 1)
+        if plan.dedup_report:
+            event["dedup"] = plan.dedup_report.model_dump()
+        if plan.quality_report:
+            event["quality"] = plan.quality_report.model_dump()
+        if session_id:
+            event["session_id"] = session_id
+        return event
+
+    async def process_stream(self, request: ProcessRequest):
+        logger.info("Starting streaming processing request. Text length: %d", len(request.text))
+
+        # 1. Chunking Phase
+        plan = await self._plan_off_loop(request)
+        chunks = plan.chunks
+
+        payload = self._compact_chunk if plan.compact else ChunkSpan.to_dict
 
         # Yield initial chunks info
-        yield {"type": "progress", "total_chunks": len(chunks), "processed_chunks": 0}
+        yield self._progress_event(plan, 0)
 
         # 2. Processing Phase
-        if self.processing_service:
-            clean = request.processing_options.clean_text
-            summarize = request.processing_options.generate_summary
-
-            if clean or summarize:
-                processed_count = 0
-                async for processed_chunk in self.processing_service.process_chunks_stream(
-                    chunks, clean=clean, summarize=summarize
-                ):
-                    processed_chunk.token_count = self._count_tokens(processed_chunk.content)
-                    processed_count += 1
+        if plan.clean or plan.summarize:
+            processed_count = 0
+
+            async def completed():
+                # Reused results are available immediately, the rest as the LLM finishes them
+                for chunk in plan.reused:
+                    yield "chunk", chunk, None, None
+                if not plan.pending:
+                    return
+                if request.processing_options.stream_tokens:
+                    events = self.processing_service.process_chunks_events(
+                        plan.pending, clean=plan.clean, summarize=plan.summarize, skip_clean=plan.skip_clean
+                    )
+                else:
+                    events = (
+                        ("chunk", chunk, None, None)
+                        async for chunk in self.processing_service.process_chunks_stream(
+                            plan.pending, clean=plan.clean, summarize=plan.summarize, skip_clean=plan.skip_clean
+                        )
+                    )
+                async for kind, chunk, field, text in events:
+                    if kind == "chunk":
+                        self._store_results(plan, [chunk])
+                    yield kind, chunk, field, text
+
+            async for kind, processed_chunk, field, text in completed():
+                if kind == "delta":
                     yield {
-                        "type": "chunk",
-                        "chunk": processed_chunk.model_dump(),
-                        "processed_chunks": processed_count,
-                        "total_chunks": len(chunks)
+                        "type": "delta",
+                        "original_index": processed_chunk.original_index,
+                        "field": field,
+                        "delta": text,
                     }
-            else:
-                # If no processing needed, just yield chunks
-                for i, chunk in enumerate(chunks):
+                    continue
+                group = plan.duplicates.get(id(processed_chunk), [])
+                self._fan_out(processed_chunk, group, plan.clean, plan.summarize)
+                for chunk in [processed_chunk, *group]:
                     chunk.token_count = self._count_tokens(chunk.content)
+                    processed_count += 1
                     yield {
                         "type": "chunk",
-                        "chunk": chunk.model_dump(),
-                        "processed_chunks": i + 1,
+                        "chunk": payload(chunk),
+                        "processed_chunks": processed_count,
                         "total_chunks": len(chunks)
                     }
         else:
-             for i, chunk in enumerate(chunks):
+            # If no processing needed, just yield chunks
+            for i, chunk in enumerate(chunks):
                 chunk.token_count = self._count_tokens(chunk.content)
                 yield {
                     "type": "chunk",
-                    "chunk": chunk.model_dump(),
+                    "chunk": payload(chunk),
                     "processed_chunks": i + 1,
                     "total_chunks": len(chunks)
                 }
 
+        session_id = self._finish_session(plan)
+        export = None
+        if request.export:
+            export = await self.export_service.export(chunks, request.export)
+
+        # Final progress event carries the accumulated usage for the request
+        event = self._progress_event(plan, len(chunks), session_id)
+        if export:
+            event["export"] = export.model_dump()
+        yield event
+
     async def process_single_chunk(self, chunk: Chunk, action: str) -> Chunk:
         if not self.processing_service:
             raise Exception("Processing service not available")
 
+        # Single chunk actions come from the UI and go ahead of bulk work
+        self.processing_service.admit(1, INTERACTIVE)
         if action == "clean":
-            chunk = await self.processing_service.clean_chunk(chunk)
+            chunk = await self.processing_service.clean_chunk(chunk, INTERACTIVE)
         elif action == "summarize":
-            chunk = await self.processing_service.generate_summary(chunk)
+            chunk = await self.processing_service.generate_summary(chunk, INTERACTIVE)
         else:
             raise ValueError(f"Invalid action: {action}")
 
@@ -0,0 +1,243 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.core.metrics import metrics
+from app.services.chunk_span import ChunkSpan
+from app.services.chunking_service import RuleBasedChunker, refine_splits
+
+if TYPE_CHECKING:
+    import numpy as np
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+# Texts shorter than this are chunked in the request's own process
+DEFAULT_MIN_CHARS = 5_000_000
+# Segments per worker, so a slow segment doesn't hold up the whole text
+SEGMENTS_PER_WORKER = 4
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def chunking_workers() -> int:
+    return int(os.getenv("CHUNKING_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def use_parallel_chunking(text: str) -> bool:
+    """
+    Whether a text is long enough to be chunked in the process pool
+    (PARALLEL_CHUNKING_MIN_CHARS, 0 to disable) and there are cores to do it.
+    """
+    min_chars = int(os.getenv("PARALLEL_CHUNKING_MIN_CHARS", DEFAULT_MIN_CHARS))
+    return bool(min_chars) and len(text) >= min_chars and chunking_workers() > 1
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked: the server process runs threads
+            _executor = ProcessPoolExecutor(
+                chunking_workers(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _top_separator(text: str, separators: List[str]) -> Tuple[str, List[str]]:
+    """
+    The separator the recursive chunker splits the whole text at, and the ones
+    left for its pieces (as in `split_recursively`).
+    """
+    for i, sep in enumerate(separators):
+        if sep == "":
+            return "", []
+        if sep in text:
+            return sep, separators[i + 1 :]
+    return separators[-1], []
+
+
+def _cut_points(text: str, separator: str, segments: int) -> List[int]:
+    """
+    Positions of separator occurrences dividing the text into about `segments`
+    equal parts. Only occurrences `str.split` is sure to cut at are used: in a
+    run like "\\n\\n\\n" split at "\\n\\n", the first one, which no earlier
+    occurrence overlaps.
+    """
+    cuts: List[int] = []
+    size = len(separator)
+    for k in range(1, segments):
+        position = max(len(text) * k // segments, cuts[-1] + size if cuts else 0)
+        while True:
+            found = text.find(separator, position)
+            if found == -1:
+                return cuts
+            if text.find(separator, max(0, found - size + 1)) == found:
+                break
+            position = found + 1
+        cuts.append(found)
+    return cuts
+
+
+def _segment_splits(
+    name: str, byte_start: int, byte_end: int, separator: str, separators: List[str], chunk_size: int
+) -> List[str]:
+    """
+    The recursive chunker's splits of the segment at [byte_start, byte_end)
+    of the UTF-8 text in shared memory block `name`.
+    """
+    # Workers share the parent's resource tracker, so attaching doesn't make
+    # the block theirs to remove; the parent unlinks it
+    shm = SharedMemory(name=name)
+    try:
+        with shm.buf[byte_start:byte_end] as view:
+            segment = str(view, "utf-8")
+    finally:
+        shm.close()
+    return refine_splits(segment.split(separator), separators, chunk_size)
+
+
+def _measure_segment(*segment) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Worker, first pass over a segment. Returns `offsets`, the joined length of
+    the splits before each split (and of all of them), and `following`, the
+    split after the last one of a chunk started at each split.
+    """
+    import numpy as np
+
+    splits = _segment_splits(*segment)
+    chunk_size = segment[-1]
+    # Each split takes a joiner ("split "), see `pack_splits`
+    widths = np.fromiter(map(len, splits), dtype=np.int64, count=len(splits)) + 1
+    offsets = np.zeros(len(splits) + 1, dtype=np.int64)
+    np.cumsum(widths, out=offsets[1:])
+    # A chunk takes the splits after its first one while it stays within chunk_size
+    following = np.searchsorted(offsets, offsets[:-1] + chunk_size, side="right") - 1
+    np.maximum(following, np.arange(1, len(splits) + 1), out=following)
+    return offsets, following
+
+
+def _build_segment(*segment_and_starts) -> Tuple[str, List[str]]:
+    """
+    Worker, second pass over a segment, given the splits its own chunks start
+    at: the content its splits before the first of them add to the chunk left
+    open by the previous segments, and the contents of its own chunks, the
+    last one unstripped as it may go on in the next segment.
+    """
+    *segment, starts = segment_and_starts
+    splits = _segment_splits(*segment)
+    bounds = starts + [len(splits)]
+    head = "".join(split + " " for split in splits[: bounds[0]])
+    contents = [" ".join(splits[a:b]).strip() for a, b in zip(bounds[:-2], bounds[1:-1])]
+    if starts:
+        contents.append(" ".join(splits[starts[-1] :]) + " ")
+    return head, contents
+
+
+def chunk_recursively_parallel(
+    text: str,
+    chunk_size: int,
+    separators: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> List[ChunkSpan]:
+    """
+    `RuleBasedChunker.chunk_recursively` on the worker process pool, with the
+    same output.
+
+    The text is cut into segments at occurrences of the separator it is split
+    at first (usually paragraph breaks) and copied once into a shared memory
+    block that the workers read their segment from. Greedy packing can't start
+    a segment before knowing how full the chunk left open by the previous one
+    is, so it takes two passes: the workers find, for every split, where a
+    chunk starting there ends; following those links here, segment by segment,
+    gives the splits each chunk starts at (one step per chunk rather than per
+    split); then the workers build the chunks' contents. Texts without such a
+    separator are chunked here.
+    """
+    separators = list(DEFAULT_SEPARATORS if separators is None else separators)
+    if "" not in separators:
+        separators.append("")
+    separator, rest = _top_separator(text, separators)
+
+    workers = workers or chunking_workers()
+    cuts = _cut_points(text, separator, workers * SEGMENTS_PER_WORKER) if separator else []
+    if not cuts:
+        return RuleBasedChunker.chunk_recursively(text, chunk_size, 0, separators=separators)
+
+    bounds = list(zip([0] + [cut + len(separator) for cut in cuts], cuts + [len(text)]))
+    encoded = [text[start:end].encode("utf-8") for start, end in bounds]
+    executor = executor or _get_executor()
+
+    shm = SharedMemory(create=True, size=max(1, sum(len(data) for data in encoded)))
+    try:
+        segments = []
+        position = 0
+        for data in encoded:
+            end = position + len(data)
+            shm.buf[position:end] = data
+            segments.append((shm.name, position, end, separator, rest, chunk_size))
+            position = end
+        del encoded
+        measures = [executor.submit(_measure_segment, *segment) for segment in segments]
+
+        builds = []
+        chunk_starts: List[List[int]] = []  # per segment, in the joined text
+        offset = 0
+        open_length: Optional[int] = None  # of the chunk left open by previous segments
+        for segment, measure in zip(segments, measures):
+            offsets, following = measure.result()
+            count = len(following)
+            entry = 0
+            if open_length is not None:
+                # The open chunk takes the segment's first splits while it fits
+                entry = max(0, int(offsets.searchsorted(chunk_size - open_length, side="right")) - 1)
+            starts: List[int] = []
+            if entry < count:
+                split = entry
+                while True:
+                    starts.append(split)
+                    next_split = int(following[split])
+                    if next_split >= count:
+                        break
+                    split = next_split
+                open_length = int(offsets[count] - offsets[split])
+            elif open_length is not None:
+                open_length += int(offsets[count])
+            chunk_starts.append([offset + int(offsets[split]) for split in starts])
+            builds.append(executor.submit(_build_segment, *segment, starts))
+            offset += int(offsets[count])
+
+        spans: List[ChunkSpan] = []
+        open_chunk: Optional[List] = None  # [start, content parts]
+        for starts, build in zip(chunk_starts, builds):
+            head, contents = build.result()
+            if open_chunk is not None:
+                open_chunk[1].append(head)
+            if not starts:
+                continue
+            if open_chunk is not None:
+                spans.append(ChunkSpan.of(text, open_chunk[0], "".join(open_chunk[1]).strip()))
+            for start, content in zip(starts, contents[:-1]):
+                spans.append(ChunkSpan.of(text, start, content))
+            open_chunk = [starts[-1], [contents[-1]]]
+        if open_chunk is not None:
+            spans.append(ChunkSpan.of(text, open_chunk[0], "".join(open_chunk[1]).strip()))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    metrics.inc(
+        "parallel_chunking_segments_total",
+        len(segments),
+        help_text="Text segments chunked in the worker process pool.",
+    )
+    logger.info("Chunked %d characters in %d segments on %d workers", len(text), len(segments), workers)
+    return spans
@@ -1,9 +1,18 @@
-import re
-import os
+import copy
 import asyncio
-from typing import List
-from app.schemas.process import Chunk
+from typing import AsyncIterator, Callable, Collection, List, Optional, Tuple, TypeVar
+from app.schemas.process import Chunk, TokenUsage
 from app.core.llm_client import LLMClient
+from app.services.chunk_span import ChunkSpan
+from app.core.log import log_context
+from app.core.profiling import stage
+from app.core.prompt_builder import PromptBuilder
+from app.core.scheduling import BULK, PriorityScheduler, llm_scheduler
+from app.core.usage import UsageTracker
+from app.core.work_queue import WorkQueue, work_queue
+from app.core.singleflight import SingleFlight, flight_key
+from app.core.streaming import iterate_in_thread, run_in_thread
+from app.core.tag_parser import TagContentStream, extract_tag
 from app.core.prompts import (
     CLEAN_TEXT_SYSTEM_PROMPT,
     CLEAN_TEXT_USER_PROMPT_TEMPLATE,
@@ -11,76 +20,307 @@ from app.core.prompts import (
     SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE,
 )
 
+# Joins the results of a text that was split over several calls
+PIECE_SEPARATOR = "\n"
+
+# (kind, chunk, field, text): kind is "delta" or "chunk"
+ChunkEvent = Tuple[str, ChunkSpan, Optional[str], Optional[str]]
+
+# Documents are processed as spans, single chunk actions as the request's Chunk
+AnyChunk = TypeVar("AnyChunk", Chunk, ChunkSpan)
+
+# Identical LLM calls in flight are shared across requests
+llm_calls = SingleFlight("llm")
+
+# LLM client used for tasks run on behalf of other replicas (distributed mode)
+_worker_client: Optional[LLMClient] = None
+
+
+async def run_llm_task(payload: dict) -> dict:
+    """
+    Work queue handler: one completion submitted by any replica, run under
+    this replica's LLM scheduler. Returns the text and the usage it cost.
+    """
+    global _worker_client
+    if _worker_client is None:
+        _worker_client = LLMClient()
+    # A shallow copy shares the HTTP client but records into its own tracker
+    client = copy.copy(_worker_client)
+    client.usage = UsageTracker()
+    async with llm_scheduler.slot(payload.get("client_key"), BULK):
+        text = await run_in_thread(client.get_completion, payload["prompt"], payload["system_prompt"])
+    return {"text": text, "usage": client.usage.report().llm.model_dump()}
+
+
+if work_queue is not None:
+    work_queue.register("llm", run_llm_task)
+
 
 class ProcessingService:
-    def __init__(self, llm_client: LLMClient):
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        scheduler: Optional[PriorityScheduler] = None,
+        client_key: Optional[str] = None,
+        queue: Optional[WorkQueue] = None,
+    ):
         self.llm_client = llm_client
-        self.concurrency_limit = int(os.getenv("LLM_CONCURRENCY_LIMIT", 5))
-        self.semaphore = asyncio.Semaphore(self.concurrency_limit)
+        # LLM slots are shared process-wide, by priority and fairly between clients
+        self.scheduler = scheduler or llm_scheduler
+        self.client_key = client_key
+        # In distributed mode bulk completions are spread over all replicas
+        self.work_queue = queue or work_queue
+        self.clean_prompts = PromptBuilder(
+            CLEAN_TEXT_SYSTEM_PROMPT, CLEAN_TEXT_USER_PROMPT_TEMPLATE, echoes_input=True
+        )
+        self.summary_prompts = PromptBuilder(
+            SUMMARIZE_TEXT_SYSTEM_PROMPT, SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE
+        )
+        # Digest of the prompts, so stored results aren't reused after they change
+        self.prompt_version = flight_key(
+            *(
+                part
+                for prompts in (self.clean_prompts, self.summary_prompts)
+                for part in (prompts.system_prompt, prompts.user_template)
+            )
+        )
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm_client, "model_name", "")
+
+    @property
+    def usage(self):
+        """
+        Usage tracker of the underlying LLM client.
+        """
+        return self.llm_client.usage
 
     def _extract_content(self, text: str, tag: str) -> str:
         """
         Extract content from XML-like tags.
         """
-        pattern = f"<{tag}>(.*?)</{tag}>"
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return text.strip()
-
-    async def clean_chunk(self, chunk: Chunk) -> Chunk:
-        async with self.semaphore:
-            prompt = CLEAN_TEXT_USER_PROMPT_TEMPLATE.format(text=chunk.content)
-            # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            cleaned_text_raw = await loop.run_in_executor(
-                None, self.llm_client.get_completion, prompt, CLEAN_TEXT_SYSTEM_PROMPT
-            )
-            chunk.content = self._extract_content(cleaned_text_raw, "cleaned_text")
-            return chunk
-
-    async def generate_summary(self, chunk: Chunk) -> Chunk:
-        async with self.semaphore:
-            prompt = SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE.format(text=chunk.content)
-            # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            summary_raw = await loop.run_in_executor(
-                None,
-                self.llm_client.get_completion,
-                prompt,
-                SUMMARIZE_TEXT_SYSTEM_PROMPT,
-            )
-            chunk.summary = self._extract_content(summary_raw, "summary")
-            return chunk
+        return extract_tag(text, tag)
+
+    async def _complete(
+        self, prompt: str, system_prompt: str, priority: str = BULK
+    ) -> str:
+        """
+        One LLM completion. Identical completions in flight at the same time
+        (the same chunk submitted twice, repeated chunks...) at the same
+        priority share one call, so an interactive call never waits in the
+        bulk queue behind a call it joined.
+        """
+
+        async def run() -> Tuple[str, object]:
+            # The result carries the client whose tracker recorded the call's usage
+            if self.work_queue is not None and priority == BULK:
+                with self.scheduler.offloaded(priority), stage("llm_call"):
+                    result = await self.work_queue.submit(
+                        "llm",
+                        {"prompt": prompt, "system_prompt": system_prompt, "client_key": self.client_key},
+                    )
+                self.usage.add("llm", TokenUsage(**result["usage"]))
+                return result["text"], self.llm_client
+            async with self.scheduler.slot(self.client_key, priority):
+                # Note: LLMClient is synchronous, so we run it in a thread executor to avoid blocking
+                with stage("llm_call"):
+                    text = await run_in_thread(self.llm_client.get_completion, prompt, system_prompt)
+                    return text, self.llm_client
+
+        (text, caller), shared = await llm_calls.join(
+            flight_key(self.model_name, priority, system_prompt, prompt), run
+        )
+        # Usage recorded by another request's client isn't reported by this one
+        usage = getattr(self.llm_client, "usage", None)
+        if shared and caller is not self.llm_client and usage is not None:
+            usage.mark_shared()
+        return text
+
+    async def _complete_text(
+        self, prompts: PromptBuilder, text: str, tag: str, priority: str = BULK
+    ) -> str:
+        """
+        Run a prompt over `text`, one call per piece if it is over the token budget.
+        """
+        pieces = prompts.fit(text)
+        replies = await asyncio.gather(
+            *(self._complete(prompts.user_prompt(piece), prompts.system_prompt, priority) for piece in pieces)
+        )
+        result = PIECE_SEPARATOR.join(self._extract_content(reply, tag) for reply in replies)
+        if len(pieces) > 1 and not prompts.echoes_input and len(result) < len(text):
+            # The replies only summarize their piece: summarize them together
+            return await self._complete_text(prompts, result, tag, priority)
+        return result
+
+    async def clean_chunk(self, chunk: AnyChunk, priority: str = BULK) -> AnyChunk:
+        chunk.content = await self._complete_text(
+            self.clean_prompts, chunk.content, "cleaned_text", priority
+        )
+        return chunk
+
+    async def generate_summary(self, chunk: AnyChunk, priority: str = BULK) -> AnyChunk:
+        chunk.summary = await self._complete_text(
+            self.summary_prompts, chunk.content, "summary", priority
+        )
+        return chunk
+
+    def admit(self, calls: int, priority: str = BULK) -> float:
+        """
+        Admission check for `calls` LLM calls; raises AdmissionRejected when the
+        backlog is over its limits, else returns the estimated wait in seconds.
+        """
+        return self.scheduler.admit(priority, calls)
 
     async def process_chunks(
-        self, chunks: List[Chunk], clean: bool = False, summarize: bool = False
-    ) -> List[Chunk]:
+        self,
+        chunks: List[ChunkSpan],
+        clean: bool = False,
+        summarize: bool = False,
+        skip_clean: Collection[int] = (),
+    ) -> List[ChunkSpan]:
+        """
+        Clean and / or summarize the chunks; chunks whose id is in `skip_clean`
+        (found clean by the quality check) are not cleaned.
+        """
         tasks = []
         for chunk in chunks:
-            task = self._process_single_chunk_async(chunk, clean, summarize)
+            task = self._process_single_chunk_async(
+                chunk, clean and id(chunk) not in skip_clean, summarize
+            )
             tasks.append(task)
 
         return await asyncio.gather(*tasks)
 
     async def process_chunks_stream(
-        self, chunks: List[Chunk], clean: bool = False, summarize: bool = False
-    ):
+        self,
+        chunks: List[ChunkSpan],
+        clean: bool = False,
+        summarize: bool = False,
+        skip_clean: Collection[int] = (),
+    ) -> AsyncIterator[ChunkSpan]:
         tasks = []
         for chunk in chunks:
-            task = self._process_single_chunk_async(chunk, clean, summarize)
+            task = self._process_single_chunk_async(
+                chunk, clean and id(chunk) not in skip_clean, summarize
+            )
             tasks.append(task)
 
         for completed_task in asyncio.as_completed(tasks):
             yield await completed_task
 
+    async def process_chunks_events(
+        self,
+        chunks: List[ChunkSpan],
+        clean: bool = False,
+        summarize: bool = False,
+        skip_clean: Collection[int] = (),
+    ) -> AsyncIterator[ChunkEvent]:
+        """
+        Like process_chunks_stream, but with streamed completions: yields
+        ("delta", chunk, field, text) as cleaned text / summary is generated and
+        ("chunk", chunk, None, None) once a chunk is finished.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run(chunk: ChunkSpan):
+            try:
+                with log_context(chunk=chunk.original_index):
+                    if clean and id(chunk) not in skip_clean:
+                        chunk.content = await self._stream_text(
+                            chunk, self.clean_prompts, "cleaned_text", "content", queue.put_nowait
+                        )
+                    if summarize:
+                        chunk.summary = await self._stream_text(
+                            chunk, self.summary_prompts, "summary", "summary", queue.put_nowait
+                        )
+                queue.put_nowait(("chunk", chunk, None, None))
+            except Exception as e:
+                queue.put_nowait(("error", chunk, None, e))
+
+        tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                event = await queue.get()
+                if event[0] == "error":
+                    raise event[3]
+                if event[0] == "chunk":
+                    remaining -= 1
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_text(
+        self,
+        chunk: ChunkSpan,
+        prompts: PromptBuilder,
+        tag: str,
+        field: str,
+        emit: Callable[[ChunkEvent], None],
+        text: Optional[str] = None,
+    ) -> str:
+        """
+        Stream a prompt over the chunk's content (or `text`); the pieces of an
+        oversize text are streamed one after the other, except for summaries,
+        where only the summary of the piece summaries is streamed.
+        """
+        text = chunk.content if text is None else text
+        pieces = prompts.fit(text)
+        if len(pieces) > 1 and not prompts.echoes_input:
+            replies = await asyncio.gather(
+                *(self._complete(prompts.user_prompt(piece), prompts.system_prompt) for piece in pieces)
+            )
+            partial = PIECE_SEPARATOR.join(self._extract_content(reply, tag) for reply in replies)
+            if len(partial) < len(text):
+                return await self._stream_text(chunk, prompts, tag, field, emit, partial)
+            emit(("delta", chunk, field, partial))
+            return partial
+        results = []
+        for i, piece in enumerate(pieces):
+            if i:
+                emit(("delta", chunk, field, PIECE_SEPARATOR))
+            results.append(
+                await self._stream_field(
+                    chunk, prompts.user_prompt(piece), prompts.system_prompt, tag, field, emit
+                )
+            )
+        return PIECE_SEPARATOR.join(results)
+
+    async def _stream_field(
+        self,
+        chunk: ChunkSpan,
+        prompt: str,
+        system_prompt: str,
+        tag: str,
+        field: str,
+        emit: Callable[[ChunkEvent], None],
+    ) -> str:
+        async with self.scheduler.slot(self.client_key):
+            extractor = TagContentStream(tag)
+            pieces = []
+            with stage("llm_call"):
+                async for piece in iterate_in_thread(
+                    self.llm_client.stream_completion, prompt, system_prompt
+                ):
+                    pieces.append(piece)
+                    delta = extractor.feed(piece)
+                    if delta:
+                        emit(("delta", chunk, field, delta))
+            delta = extractor.close()
+            if delta:
+                emit(("delta", chunk, field, delta))
+        return self._extract_content("".join(pieces), tag)
+
     async def _process_single_chunk_async(
-        self, chunk: Chunk, clean: bool, summarize: bool
-    ) -> Chunk:
-        if clean:
-            chunk = await self.clean_chunk(chunk)
+        self, chunk: ChunkSpan, clean: bool, summarize: bool
+    ) -> ChunkSpan:
+        with log_context(chunk=chunk.original_index):
+            if clean:
+                chunk = await self.clean_chunk(chunk)
 
-        if summarize:
-            chunk = await self.generate_summary(chunk)
+            if summarize:
+                chunk = await self.generate_summary(chunk)
 
         return chunk
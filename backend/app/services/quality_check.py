@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Sequence
+
+DEFAULT_THRESHOLD = 0.5
+
+# Page framing inserted by FileProcessingService: structure, not noise
+PAGE_FRAME_RE = re.compile(r"^---\s*page\s+#(?:\s*\(error\))?\s*---$")
+# Lines that are only a page number: "12", "- 12 -", "Page 3 of 10", "3/10"
+PAGE_NUMBER_LINE_RE = re.compile(r"^\W*(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?\W*$", re.I)
+# A word split over two lines by hyphenation: "exam-\nple"
+BROKEN_HYPHEN_RE = re.compile(r"[^\W\d_]-[ \t]*\r?\n[ \t]*[a-zß-ÿ]")
+# UTF-8 decoded as Latin-1 / cp1252 ("Ã©", "â€™", "Â "), and replacement characters
+MOJIBAKE_RE = re.compile("\ufffd|\u00c3[\u0080-\u00bf]|\u00e2\u20ac|\u00c2[\u0080-\u00bf]")
+CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+LATIN_WORD_RE = re.compile(r"[A-Za-zÀ-ÿ0-9]+")
+DIGITS_RE = re.compile(r"\d+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Unicode categories counted as noise: symbols (box drawing, dingbats), format
+# characters (soft hyphens, zero-width), private use, surrogates, unassigned
+NOISE_CATEGORIES = frozenset(("So", "Cf", "Co", "Cs", "Cn"))
+# Signal values reaching 1.0: 2% noise characters, 2 broken words per 1000
+# characters, 15% odd-looking words
+NOISE_CHAR_SCALE = 0.02
+HYPHENATION_SCALE = 2 / 1000
+ODD_WORD_SCALE = 0.15
+# Header/footer candidates: short lines repeated in this many chunks
+MAX_HEADER_LENGTH = 80
+MIN_REPEATS = 3
+
+VOWELS = frozenset("aeiouyàáâãäåèéêëìíîïòóôõöùúûüý")
+
+
+@lru_cache(maxsize=4096)
+def _is_noise_char(char: str) -> bool:
+    return unicodedata.category(char) in NOISE_CATEGORIES
+
+
+def _normalize_line(line: str) -> str:
+    return WHITESPACE_RE.sub(" ", DIGITS_RE.sub("#", line.strip().lower()))
+
+
+def _is_odd_word(word: str) -> bool:
+    """
+    Whether a word looks like OCR / extraction damage rather than a word.
+    """
+    letters = sum(c.isalpha() for c in word)
+    if letters and letters < len(word):
+        # Letters around digits ("l0ve", "rn1ddle"); codes like "mp3" or "H2O" are short
+        return len(word) > 4 and word[0].isalpha() and word[-1].isalpha()
+    if len(word) > 30:
+        return True  # Words glued together by missing spaces
+    if len(word) >= 5 and word.islower() and not VOWELS.intersection(word):
+        return True
+    # Case flipping inside a word ("tHe", "wOrD"), but not camelCase / acronyms
+    return len(word) >= 3 and word[0].islower() and word[1].isupper() and word[2].islower()
+
+
+class QualityChecker:
+    """
+    Cheap, local estimate of whether a chunk needs LLM cleaning.
+
+    Each signal is scaled to [0, 1], 1 meaning clearly noisy:
+      - noise_chars: symbols, control / format / private-use characters
+      - hyphenation: words broken over two lines ("exam-\\nple")
+      - header_footer: page-number lines and short lines repeated across the
+        document's chunks (running headers and footers)
+      - odd_words: words that look damaged (OOV-ish: letters mixed with digits,
+        no vowels, flipped case, glued words, spaced-out letters)
+      - encoding: mojibake and replacement characters
+
+    A chunk's score is its highest signal; chunks scoring below `threshold`
+    are left as they are. Spelling mistakes in otherwise clean prose are not
+    detected, so the check is opt-in.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, min_repeats: int = MIN_REPEATS):
+        self.threshold = threshold
+        self.min_repeats = min_repeats
+
+    def repeated_lines(self, texts: Sequence[str]) -> FrozenSet[str]:
+        """
+        Normalized short lines found in at least `min_repeats` of the texts.
+        """
+        counts: Counter = Counter()
+        for text in texts:
+            lines = set()
+            for line in text.splitlines():
+                if 0 < len(line.strip()) <= MAX_HEADER_LENGTH:
+                    normalized = _normalize_line(line)
+                    if not PAGE_FRAME_RE.match(normalized):
+                        lines.add(normalized)
+            counts.update(lines)
+        return frozenset(line for line, count in counts.items() if count >= self.min_repeats)
+
+    def signals(self, text: str, repeated: FrozenSet[str] = frozenset()) -> Dict[str, float]:
+        length = len(text)
+        if not length:
+            return dict.fromkeys(("noise_chars", "hyphenation", "header_footer", "odd_words", "encoding"), 0.0)
+
+        noise = len(CONTROL_RE.findall(text))
+        if not text.isascii():
+            # Categorize each distinct character once (CJK text is all non-ASCII)
+            noise += sum(n for c, n in Counter(NON_ASCII_RE.findall(text)).items() if _is_noise_char(c))
+
+        header_lines = 0
+        for line in text.splitlines():
+            stripped = line.strip()
+            if not stripped or len(stripped) > MAX_HEADER_LENGTH:
+                continue
+            normalized = _normalize_line(stripped)
+            if PAGE_FRAME_RE.match(normalized):
+                continue
+            if normalized in repeated or PAGE_NUMBER_LINE_RE.match(stripped):
+                header_lines += 1
+
+        words = LATIN_WORD_RE.findall(text)
+        odd = sum(_is_odd_word(word) for word in words)
+        # Spaced-out letters ("e x a m p l e") make many single-letter words
+        singles = sum(1 for word in words if len(word) == 1 and word.isalpha() and word not in "aAI")
+        odd_rate = (odd + max(0, singles - 2)) / len(words) if words else 0.0
+
+        return {
+            "noise_chars": min(1.0, noise / length / NOISE_CHAR_SCALE),
+            "hyphenation": min(1.0, len(BROKEN_HYPHEN_RE.findall(text)) / length / HYPHENATION_SCALE),
+            "header_footer": min(1.0, float(header_lines)),
+            "odd_words": min(1.0, odd_rate / ODD_WORD_SCALE),
+            "encoding": min(1.0, float(len(MOJIBAKE_RE.findall(text)))),
+        }
+
+    def score(self, text: str, repeated: FrozenSet[str] = frozenset()) -> float:
+        return max(self.signals(text, repeated).values())
+
+    def needs_cleaning(self, texts: Sequence[str], context: Sequence[str] = ()) -> List[bool]:
+        """
+        Classify `texts`; running headers are looked for in `context` (all the
+        document's chunks), or in `texts` themselves.
+        """
+        repeated = self.repeated_lines(context or texts)
+        return [self.score(text, repeated) >= self.threshold for text in texts]
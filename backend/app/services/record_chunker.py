@@ -0,0 +1,270 @@
+import re
+import json
+import codecs
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from app.schemas.process import RecordChunk
+from app.core.tokenizer import count_tokens
+
+# Bytes read from an upload at a time
+BLOCK_SIZE = 1 << 16
+BOM = b"\xef\xbb\xbf"
+
+# (byte start, byte end, char start, text) of one record
+Record = Tuple[int, int, int, str]
+
+_NON_SPACE = re.compile(rb"\S")
+_NON_SPACE_TEXT = re.compile(r"\S")
+
+
+def _utf8_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def iter_csv_records(
+    blocks: Iterable[bytes], offset: int = 0, char_offset: int = 0
+) -> Iterator[Record]:
+    """
+    CSV rows, each with its line terminator. A newline inside a quoted field
+    doesn't end the row: a row is complete once it has an even number of quotes
+    (escaped quotes come in pairs, so they don't change the parity).
+    """
+    pending = bytearray()
+    quotes = 0
+
+    def take() -> Record:
+        nonlocal offset, char_offset
+        text = pending.decode("utf-8")
+        record = (offset, offset + len(pending), char_offset, text)
+        offset += len(pending)
+        char_offset += len(text)
+        pending.clear()
+        return record
+
+    for block in blocks:
+        pos = 0
+        while True:
+            newline = block.find(b"\n", pos)
+            end = len(block) if newline < 0 else newline + 1
+            piece = block[pos:end]
+            pending += piece
+            quotes += piece.count(b'"')
+            if newline < 0:
+                break
+            pos = end
+            if quotes % 2 == 0:
+                yield take()
+                quotes = 0
+    if pending:
+        yield take()
+
+
+class JsonRecordSplitter:
+    """
+    Incremental splitter for the top-level values of a JSON array, or of a
+    stream of JSON values (JSONL or concatenated JSON). Each value is scanned
+    by the C JSON decoder, and only the current record is buffered.
+    """
+
+    def __init__(self, offset: int = 0, char_offset: int = 0):
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0  # Start of the unconsumed part of the buffer
+        self.offset = offset  # Byte offset of buffer[pos]
+        self.char_offset = char_offset  # Character offset of buffer[pos]
+        self.mode: Optional[str] = None  # "array" or "stream"
+        self.expect_value = True  # Array: a value (rather than a separator) comes next
+        self.closed = False  # The top-level array has ended
+        # An incomplete record is only parsed again once the buffer has doubled,
+        # so records spanning many blocks are parsed a bounded number of times
+        self.retry_at = 0
+
+    def feed(self, block: bytes, final: bool = False) -> List[Record]:
+        self.buffer = self.buffer[self.pos :] + self.text_decoder.decode(block, final)
+        self.pos = 0
+        records: List[Record] = []
+        while True:
+            match = _NON_SPACE_TEXT.search(self.buffer, self.pos)
+            if match is None:
+                self._advance(len(self.buffer))
+                break
+            index = match.start()
+            self._advance(index)
+            char = self.buffer[index]
+            if self.closed:
+                raise ValueError(f"Unexpected data after the JSON array at byte {self.offset}")
+            if self.mode is None:
+                self.mode = "array" if char == "[" else "stream"
+                if self.mode == "array":
+                    self._advance(index + 1)
+                    continue
+            if self.mode == "array" and (char == "]" or not self.expect_value):
+                if char not in ",]":
+                    raise ValueError(f"Expected ',' or ']' in the JSON array at byte {self.offset}")
+                self.closed = char == "]"
+                self.expect_value = True
+                self._advance(index + 1)
+                continue
+
+            if len(self.buffer) < self.retry_at and not final:
+                break
+            try:
+                _, end = self.decoder.raw_decode(self.buffer, index)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise ValueError(f"Invalid JSON record at byte {self.offset}: {e.msg}")
+                self.retry_at = 2 * (len(self.buffer) - index)
+                break
+            if end == len(self.buffer) and not final:
+                # A number at the end of the block may continue in the next one
+                self.retry_at = 0
+                break
+            text = self.buffer[index:end]
+            byte_end = self.offset + _utf8_len(text)
+            records.append((self.offset, byte_end, self.char_offset, text))
+            self.pos, self.offset, self.char_offset = end, byte_end, self.char_offset + len(text)
+            self.expect_value = False
+            self.retry_at = 0
+        return records
+
+    def close(self) -> List[Record]:
+        records = self.feed(b"", final=True)
+        if self.mode == "array" and not self.closed:
+            raise ValueError("Unexpected end of JSON data: the array is not closed")
+        return records
+
+    def _advance(self, index: int):
+        skipped = self.buffer[self.pos : index]
+        self.offset += _utf8_len(skipped)
+        self.char_offset += len(skipped)
+        self.pos = index
+
+
+def iter_json_records(
+    blocks: Iterable[bytes], offset: int = 0, char_offset: int = 0
+) -> Iterator[Record]:
+    splitter = JsonRecordSplitter(offset, char_offset)
+    for block in blocks:
+        yield from splitter.feed(block)
+    yield from splitter.close()
+
+
+class RecordChunker:
+    """
+    Chunks structured files (CSV, JSON arrays, JSONL) into groups of whole
+    records, reading them incrementally: memory is bounded by one block, one
+    record and one chunk, whatever the size of the file.
+    """
+
+    @staticmethod
+    def detect_format(filename: Optional[str] = None, head: bytes = b"") -> str:
+        if filename:
+            extension = filename.lower().rsplit(".", 1)[-1]
+            if extension == "csv":
+                return "csv"
+            if extension in ("json", "jsonl", "ndjson"):
+                return "json"
+        match = _NON_SPACE.search(head.removeprefix(BOM))
+        return "json" if match and match.group() in (b"[", b"{") else "csv"
+
+    @classmethod
+    def chunk_stream(
+        cls,
+        blocks: Iterable[bytes],
+        chunk_size: int,
+        record_format: str = "auto",
+        repeat_header: bool = False,
+        size_unit: str = "chars",
+        filename: Optional[str] = None,
+    ) -> Iterator[RecordChunk]:
+        """
+        Chunks of whole records from a stream of byte blocks. A chunk holds as
+        many records as fit in chunk_size; a larger record gets a chunk of its
+        own. Offsets refer to the file: byte offsets, record indices and
+        original_index, the character offset in the UTF-8 decoded text.
+        """
+        blocks = iter(blocks)
+        first = next(blocks, b"")
+        offset = len(BOM) if first.startswith(BOM) else 0
+        if record_format == "auto":
+            record_format = cls.detect_format(filename, first)
+        stream = _chain(first[offset:], blocks)
+
+        # The BOM decodes to one character
+        if record_format == "csv":
+            records = iter_csv_records(stream, offset, min(offset, 1))
+            joiner = ""
+        else:
+            records = iter_json_records(stream, offset, min(offset, 1))
+            joiner = "\n"
+        size: Callable[[str], int] = count_tokens if size_unit == "tokens" else len
+        yield from cls._group(records, chunk_size, joiner, size, repeat_header and record_format == "csv")
+
+    @classmethod
+    def chunk_text(cls, text: str, chunk_size: int, **kwargs) -> List[RecordChunk]:
+        data = text.encode("utf-8")
+        blocks = (data[i : i + BLOCK_SIZE] for i in range(0, len(data), BLOCK_SIZE))
+        return list(cls.chunk_stream(blocks, chunk_size, **kwargs))
+
+    @staticmethod
+    def _group(
+        records: Iterator[Record],
+        chunk_size: int,
+        joiner: str,
+        size: Callable[[str], int],
+        repeat_header: bool,
+    ) -> Iterator[RecordChunk]:
+        header, header_size = "", 0
+        texts: List[str] = []
+        chunk_size_so_far = 0
+        first = (0, 0, 0)  # (record index, byte offset, char offset) of the chunk
+        last_end = 0  # Byte offset after the last record
+        index = 0
+
+        def flush() -> RecordChunk:
+            content = header + joiner.join(texts)
+            if not joiner:
+                content = content.rstrip("\r\n")
+            return RecordChunk(
+                content=content,
+                original_index=first[2],
+                record_start=first[0],
+                record_end=index,
+                byte_start=first[1],
+                byte_end=last_end,
+            )
+
+        for byte_start, byte_end, char_start, text in records:
+            if not text.strip():
+                # Blank lines stay inside the chunk, so CSV chunks remain exact slices
+                if texts:
+                    texts[-1] += text
+                    chunk_size_so_far += size(text)
+                    last_end = byte_end
+                continue
+            if repeat_header and index == 0 and not header:
+                header = text if text.endswith("\n") else text + "\n"
+                header_size = size(header)
+                index += 1
+                continue
+
+            record_size = size(text) + (len(joiner) if texts else 0)
+            if texts and chunk_size_so_far + record_size > chunk_size:
+                yield flush()
+                texts, chunk_size_so_far = [], 0
+            if not texts:
+                first = (index, byte_start, char_start)
+                chunk_size_so_far = header_size
+            texts.append(text)
+            chunk_size_so_far += record_size
+            index += 1
+            last_end = byte_end
+
+        if texts:
+            yield flush()
+
+
+def _chain(first: bytes, rest: Iterator[bytes]) -> Iterator[bytes]:
+    if first:
+        yield first
+    yield from rest
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+from app.core.shared_store import SharedStore, SharedStoreError, shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """
+    Process-wide LRU store of processed chunk results, used for incremental re-processing.
+
+    Results are keyed by the hash of the chunk's original content plus the
+    processing options, model and prompts that produced them. A session records the content hashes
+    of one request so a later request can reuse exactly those results.
+
+    With a `shared` store (distributed mode), results and sessions are also
+    written through to it and read from it on a local miss, so any replica
+    can reuse what another one produced.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_sessions: int = 1_000,
+        shared: Optional[SharedStore] = None,
+        shared_ttl: float = 7 * 24 * 3600,
+    ):
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, dict]" = OrderedDict()
+        self._sessions: "OrderedDict[str, Set[str]]" = OrderedDict()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def result_key(
+        content_hash: str, clean: bool, summarize: bool, model: str, prompt_version: str
+    ) -> str:
+        return f"{content_hash}:{int(clean)}{int(summarize)}:{model}:{prompt_version}"
+
+    def _shared_get(self, key: str):
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.get(key)
+        except SharedStoreError as e:
+            logger.warning("Shared store unavailable, using the local cache only: %s", e)
+            return None
+        return json.loads(value) if value is not None else None
+
+    def _shared_set(self, key: str, value):
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(key, json.dumps(value).encode("utf-8"), self.shared_ttl)
+        except SharedStoreError as e:
+            logger.warning("Shared store unavailable, using the local cache only: %s", e)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+        result = self._shared_get(f"result:{key}")
+        if result is not None:
+            self._put_local(key, result)
+        return result
+
+    def put(self, key: str, result: dict):
+        self._put_local(key, result)
+        self._shared_set(f"result:{key}", result)
+
+    def _put_local(self, key: str, result: dict):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def create_session(self, content_hashes: Iterable[str]) -> str:
+        session_id = uuid.uuid4().hex
+        hashes = set(content_hashes)
+        self._put_session(session_id, hashes)
+        self._shared_set(f"session:{session_id}", sorted(hashes))
+        return session_id
+
+    def _put_session(self, session_id: str, hashes: Set[str]):
+        with self._lock:
+            self._sessions[session_id] = hashes
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def session_hashes(self, session_id: str) -> Optional[Set[str]]:
+        with self._lock:
+            hashes = self._sessions.get(session_id)
+            if hashes is not None:
+                self._sessions.move_to_end(session_id)
+                return hashes
+        shared = self._shared_get(f"session:{session_id}")
+        if shared is None:
+            return None
+        hashes = set(shared)
+        self._put_session(session_id, hashes)
+        return hashes
+
+
+result_store = ResultStore(
+    max_entries=int(os.getenv("RESULT_STORE_MAX_ENTRIES", 100_000)),
+    max_sessions=int(os.getenv("RESULT_STORE_MAX_SESSIONS", 1_000)),
+    shared=shared_store,
+    shared_ttl=float(os.getenv("SHARED_CACHE_TTL", 7 * 24 * 3600)),
+)
@@ -0,0 +1,176 @@
+"""
+Deterministic benchmark corpora: long English / Chinese documents with the
+structure of real converted files (headings, paragraphs, page framing, repeated
+headers and footers), multi-page PDFs and DOCX files.
+"""
+
+import io
+import random
+import struct
+import zlib
+from typing import List, Tuple
+
+EN_WORDS = (
+    "the system data model retrieval document knowledge base chunk vector index "
+    "query embedding semantic search result context window token language large "
+    "process pipeline service latency throughput request response quality text "
+    "report analysis market revenue growth quarter customer product design team"
+).split()
+
+ZH_PHRASES = (
+    "知识库 检索 增强 生成 文档 切分 语义 向量 索引 查询 模型 上下文 "
+    "数据 处理 流程 服务 延迟 吞吐 请求 响应 质量 文本 报告 分析 市场 "
+    "收入 增长 季度 客户 产品 设计 团队 系统"
+).split()
+
+
+def _en_sentence(rng: random.Random) -> str:
+    words = [rng.choice(EN_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _zh_sentence(rng: random.Random) -> str:
+    return "".join(rng.choice(ZH_PHRASES) for _ in range(rng.randint(6, 14))) + "。"
+
+
+def generate_text(num_chars: int, language: str = "en", seed: int = 0) -> str:
+    """
+    Generate a document of roughly `num_chars` characters with page framing,
+    headings and paragraphs.
+    """
+    rng = random.Random(seed)
+    sentence = _zh_sentence if language == "zh" else _en_sentence
+    joiner = "" if language == "zh" else " "
+    header = "公司年度报告 - 内部资料" if language == "zh" else "Annual Report - Confidential"
+
+    parts = []
+    size = 0
+    page = 1
+    while size < num_chars:
+        block = [f"--- Page {page} ---", header]
+        for section in range(rng.randint(2, 4)):
+            block.append(f"{page}.{section + 1} " + sentence(rng).rstrip(".。"))
+            for _ in range(rng.randint(2, 5)):
+                block.append(joiner.join(sentence(rng) for _ in range(rng.randint(3, 8))))
+        block.append(f"Page {page}")
+        text = "\n\n".join(block) + "\n\n"
+        parts.append(text)
+        size += len(text)
+        page += 1
+    return "".join(parts)[:num_chars]
+
+
+def generate_pdf(num_pages: int, seed: int = 0) -> bytes:
+    """
+    Generate a text PDF with `num_pages` pages.
+    """
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(num_pages):
+        page = doc.new_page()
+        body = "\n".join(_en_sentence(rng) for _ in range(30))
+        page.insert_textbox(
+            fitz.Rect(50, 50, 550, 800), f"Page {page_num + 1}\n\n{body}", fontsize=9
+        )
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def generate_png(shade: int, size: int = 8) -> bytes:
+    """
+    A small solid grey PNG; different shades give different images.
+    """
+
+    def png_chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    rows = b"".join(b"\x00" + bytes([shade % 256]) * size for _ in range(size))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0))
+        + png_chunk(b"IDAT", zlib.compress(rows))
+        + png_chunk(b"IEND", b"")
+    )
+
+
+def generate_docx(num_paragraphs: int, num_images: int = 0, num_tables: int = 0, seed: int = 0) -> bytes:
+    """
+    Generate a DOCX file with paragraphs, with the images and tables spread
+    evenly between them.
+    """
+    import docx  # python-docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    images = {round((i + 1) * num_paragraphs / (num_images + 1)) for i in range(num_images)}
+    tables = {round((i + 1) * num_paragraphs / (num_tables + 1)) for i in range(num_tables)}
+    image_count = 0
+    for i in range(num_paragraphs):
+        document.add_paragraph(" ".join(_en_sentence(rng) for _ in range(rng.randint(2, 6))))
+        if i in images:
+            document.add_picture(io.BytesIO(generate_png(image_count * 40 + 10)))
+            image_count += 1
+        if i in tables:
+            table = document.add_table(rows=3, cols=3)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"R{r}C{c}"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+# Vocabularies for documents with known topic boundaries
+TOPICS = {
+    "finance": "market revenue growth quarter profit investor share price dividend earnings "
+    "capital budget forecast margin cost",
+    "biology": "cell protein gene enzyme membrane tissue organism species mutation "
+    "dna nucleus bacteria evolution metabolism",
+    "sports": "team player match goal season coach league score tournament "
+    "stadium referee championship training victory",
+    "cooking": "recipe flour butter oven sauce garlic onion simmer bake "
+    "kitchen spice dough pepper salt",
+    "space": "planet orbit star galaxy telescope rocket astronaut satellite "
+    "gravity moon comet launch mission nebula",
+}
+FILLER_WORDS = "the a of and in with for on this that is was".split()
+
+
+def generate_topic_document(num_segments: int = 40, seed: int = 0) -> Tuple[str, List[int]]:
+    """
+    Generate an English document of single-topic segments (adjacent segments
+    differ in topic). Returns the text and the character offsets where
+    segments 2..n start, the ground truth for semantic boundary quality.
+    """
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    parts: List[str] = []
+    boundaries: List[int] = []
+    size = 0
+    topic = None
+    for _ in range(num_segments):
+        topic = rng.choice([t for t in topics if t != topic])
+        words = TOPICS[topic].split()
+        sentences = []
+        for _ in range(rng.randint(4, 8)):
+            sentence = [
+                rng.choice(words) if rng.random() < 0.6 else rng.choice(FILLER_WORDS)
+                for _ in range(rng.randint(8, 16))
+            ]
+            sentences.append(" ".join(sentence).capitalize() + ".")
+        if parts:
+            boundaries.append(size)
+        segment = " ".join(sentences) + " "
+        parts.append(segment)
+        size += len(segment)
+    return "".join(parts), boundaries
+
+
+CORPORA = {
+    "en_1mb": lambda: generate_text(1_000_000, "en", seed=1),
+    "zh_1mb": lambda: generate_text(1_000_000, "zh", seed=2),
+}
@@ -0,0 +1,263 @@
+"""
+A local stand-in for the OpenAI-compatible chat/embeddings endpoints.
+
+Responses follow the tag conventions of app/core/prompts.py so the real pipeline
+can parse them, and the server can inject latency, jitter, stalls and 429 responses.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockServerConfig:
+    latency: float = 0.05  # Base latency per call, in seconds
+    jitter: float = 0.02  # Uniform random jitter added to the latency, in seconds
+    error_rate: float = 0.0  # Probability of answering with 429 Too Many Requests
+    stall_rate: float = 0.0  # Probability of a call taking stall_latency instead
+    stall_latency: float = 1.0
+    embedding_dim: int = 64
+    stream_piece_size: int = 8  # Characters per streamed delta (stream=True)
+    seed: int = 0
+
+
+def _embed(text: str, dim: int) -> List[float]:
+    """
+    Deterministic pseudo-embedding: texts sharing words get similar vectors.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split() or [text]:
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest[:4], "little") % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _count_tokens(text: str) -> int:
+    # Rough approximation; good enough for usage accounting in benchmarks
+    return max(1, len(text) // 4)
+
+
+def _chat_reply(messages: List[dict]) -> str:
+    system = ""
+    user_text = ""
+    has_image = False
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    has_image = True
+                elif part.get("type") == "text":
+                    user_text += part.get("text", "")
+        elif message.get("role") == "system":
+            system += content or ""
+        else:
+            user_text += content or ""
+
+    if has_image:
+        return (
+            "<processed_content>\n<text>Mock transcription of the page.</text>\n"
+            "<figure_caption>A mock figure.</figure_caption>\n</processed_content>"
+        )
+
+    # The chunk is the tail of the user prompt, after the last "Text:" marker
+    chunk = user_text.rsplit("Text:", 1)[-1].strip()
+    if "summar" in system.lower():
+        return f"<summary>\n{chunk[:80]}\n</summary>"
+    return f"<cleaned_text>\n{chunk}\n</cleaned_text>"
+
+
+def create_app(config: MockServerConfig) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    app.state.calls = 0
+    app.state.rejected = 0
+    # System prompts seen so far: a repeated one counts as cached, like a prefix cache
+    app.state.prefixes = set()
+
+    async def _delay_or_reject() -> Optional[JSONResponse]:
+        app.state.calls += 1
+        if config.stall_rate and rng.random() < config.stall_rate:
+            await asyncio.sleep(config.stall_latency)
+        else:
+            await asyncio.sleep(config.latency + rng.uniform(0, config.jitter))
+        if config.error_rate and rng.random() < config.error_rate:
+            app.state.rejected += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                headers={"retry-after-ms": "10"},
+            )
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        rejected = await _delay_or_reject()
+        if rejected:
+            return rejected
+        reply = _chat_reply(body.get("messages", []))
+        prompt_tokens = sum(
+            _count_tokens(str(m.get("content", ""))) for m in body.get("messages", [])
+        )
+        completion_tokens = _count_tokens(reply)
+        messages = body.get("messages", [])
+        system = messages[0].get("content") if messages and messages[0].get("role") == "system" else None
+        cached_tokens = 0
+        if isinstance(system, str):
+            if system in app.state.prefixes:
+                cached_tokens = _count_tokens(system)
+            app.state.prefixes.add(system)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        if body.get("stream"):
+            return StreamingResponse(
+                _stream_reply(reply, body.get("model", "mock"), usage, app.state.calls),
+                media_type="text/event-stream",
+            )
+        return {
+            "id": f"chatcmpl-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    async def _stream_reply(reply: str, model: str, usage: dict, call: int):
+        base = {
+            "id": f"chatcmpl-{call}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+        }
+        size = max(1, config.stream_piece_size)
+        for i in range(0, len(reply), size):
+            delta = {"content": reply[i : i + size]}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0)
+        done = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        # Final usage-only chunk, as sent for stream_options.include_usage
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        rejected = await _delay_or_reject()
+        if rejected:
+            return rejected
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        prompt_tokens = sum(_count_tokens(text) for text in inputs)
+        return {
+            "object": "list",
+            "model": body.get("model", "mock"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _embed(text, config.embedding_dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    return app
+
+
+class MockOpenAIServer:
+    """
+    Runs the mock app with uvicorn in a background thread.
+
+        with MockOpenAIServer(MockServerConfig(latency=0.1)) as server:
+            os.environ["LLM_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, config: Optional[MockServerConfig] = None, port: int = 0):
+        self.config = config or MockServerConfig()
+        self.app = create_app(self.config)
+        self.port = port or _free_port()
+        self._server = uvicorn.Server(
+            uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning")
+        )
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def calls(self) -> int:
+        return self.app.state.calls
+
+    @property
+    def rejected(self) -> int:
+        return self.app.state.rejected
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.time() + 10
+        while not self._server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Mock OpenAI server failed to start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock OpenAI-compatible server.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = MockServerConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate
+    )
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port)
@@ -0,0 +1,540 @@
+"""
+Benchmark runner.
+
+    uv run python -m benchmarks.run                      # run and print results
+    uv run python -m benchmarks.run --compare            # fail on regressions vs baseline.json
+    uv run python -m benchmarks.run --save-baseline      # store results as the new baseline
+    uv run python -m benchmarks.run --filter startup     # only benchmarks whose name matches
+
+Metric direction is inferred from the name: `*_per_sec` is higher-is-better,
+`*_ms` / `*_mb` are lower-is-better. Each benchmark runs in a fresh process, so
+its peak_rss_mb is its own rather than the peak of those run before it.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+import numpy as np
+
+from benchmarks.corpora import CORPORA, generate_docx, generate_pdf, generate_text, generate_topic_document
+from benchmarks.mock_server import MockOpenAIServer, MockServerConfig, _embed
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], Dict[str, float]]] = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def _time_chunker(func: Callable[[], list], repeat: int) -> Dict[str, float]:
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = func()
+        best = min(best, time.perf_counter() - start)
+    return {"chunks_per_sec": len(chunks) / best, "best_ms": best * 1000}
+
+
+class _LocalEmbeddingClient:
+    """
+    In-process embedder so semantic benchmarks measure the chunker, not the network.
+    """
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [_embed(text, 64) for text in texts]
+
+
+def _configure_clients(base_url: str):
+    for prefix in ("LLM", "VLM", "EMBEDDING"):
+        os.environ[f"{prefix}_API_KEY"] = "benchmark"
+        os.environ[f"{prefix}_BASE_URL"] = base_url
+
+
+for _corpus in CORPORA:
+
+    @benchmark(f"chunking.fixed_size.{_corpus}")
+    def _bench_fixed(args, corpus=_corpus):
+        from app.services.chunking_service import RuleBasedChunker
+
+        text = CORPORA[corpus]()
+        return _time_chunker(
+            lambda: RuleBasedChunker.chunk_by_fixed_size(text, 500, 50), args.repeat
+        )
+
+    @benchmark(f"chunking.recursive.{_corpus}")
+    def _bench_recursive(args, corpus=_corpus):
+        from app.services.chunking_service import RuleBasedChunker
+
+        text = CORPORA[corpus]()
+        return _time_chunker(
+            lambda: RuleBasedChunker.chunk_recursively(text, 500, 50), args.repeat
+        )
+
+    @benchmark(f"chunking.semantic.{_corpus}")
+    def _bench_semantic(args, corpus=_corpus):
+        from app.services.chunking_service import SemanticChunker
+
+        text = CORPORA[corpus]()
+        chunker = SemanticChunker(_LocalEmbeddingClient())
+        return _time_chunker(
+            lambda: chunker.chunk_by_semantics(
+                text, breakpoint_type="percentile", max_chunk_size=500, min_chunk_size=100
+            ),
+            args.repeat,
+        )
+
+    @benchmark(f"chunking.semantic_local.{_corpus}")
+    def _bench_semantic_local(args, corpus=_corpus):
+        from app.core.local_embedding import LocalEmbeddingClient
+        from app.services.chunking_service import SemanticChunker
+
+        text = CORPORA[corpus]()
+        chunker = SemanticChunker(LocalEmbeddingClient())
+        return _time_chunker(
+            lambda: chunker.chunk_by_semantics(
+                text, breakpoint_type="percentile", max_chunk_size=500, min_chunk_size=100
+            ),
+            args.repeat,
+        )
+
+
+@benchmark("chunking.recursive_parallel")
+def _bench_recursive_parallel(args):
+    """
+    Recursive chunking of one large text in the request's process vs on the
+    chunking process pool (CHUNKING_WORKERS, default: all cores). The pool is
+    started before timing, as it is once per server process.
+    """
+    from app.services.chunking_service import RuleBasedChunker
+    from app.services.parallel_chunking import chunk_recursively_parallel, chunking_workers
+
+    text = generate_text(args.parallel_chars, "en", seed=5)
+    chunk_recursively_parallel(text[:100_000], 500)
+    sequential = _time_chunker(lambda: RuleBasedChunker.chunk_recursively(text, 500, 50), args.repeat)
+    parallel = _time_chunker(lambda: chunk_recursively_parallel(text, 500), args.repeat)
+    return {
+        "sequential_ms": sequential["best_ms"],
+        "parallel_ms": parallel["best_ms"],
+        "chunks_per_sec": parallel["chunks_per_sec"],
+        "speedup": sequential["best_ms"] / parallel["best_ms"],
+        "workers": float(chunking_workers()),
+    }
+
+
+def boundary_scores(predicted: List[int], expected: List[int]) -> Dict[str, float]:
+    """
+    Precision / recall / F1 of predicted chunk boundaries against the true ones.
+    """
+    hits = len(set(predicted) & set(expected))
+    precision = hits / len(predicted) if predicted else 0.0
+    recall = hits / len(expected) if expected else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if hits else 0.0
+    return {"boundary_precision": precision, "boundary_recall": recall, "boundary_f1": f1}
+
+
+for _backend in ("local", "remote"):
+
+    @benchmark(f"quality.semantic_boundaries.{_backend}")
+    def _bench_boundaries(args, backend=_backend):
+        """
+        Boundary quality on a document with known topic changes. "remote" uses
+        whatever EMBEDDING_BASE_URL points to (the mock server by default; set
+        --embedding-base-url to compare against a real model).
+        """
+        from app.core.embedding_client import create_embedding_backend
+        from app.services.chunking_service import SemanticChunker
+
+        if backend == "remote" and args.embedding_base_url:
+            os.environ["EMBEDDING_BASE_URL"] = args.embedding_base_url
+            os.environ["EMBEDDING_API_KEY"] = os.getenv("REAL_EMBEDDING_API_KEY", "benchmark")
+        text, expected = generate_topic_document(seed=5)
+        chunker = SemanticChunker(create_embedding_backend(backend))
+        start = time.perf_counter()
+        chunks = chunker.chunk_by_semantics(
+            text, breakpoint_type="percentile", breakpoint_amount=85, max_chunk_size=2000
+        )
+        elapsed = time.perf_counter() - start
+        predicted = [chunk.original_index for chunk in chunks[1:]]
+        return {**boundary_scores(predicted, expected), "best_ms": elapsed * 1000}
+
+
+@benchmark("chunks.representation")
+def _bench_chunk_representation(args):
+    """
+    Fixed-size chunks with heavy overlap, built and serialized one by one as
+    the streaming endpoints do: slot-based spans vs a Pydantic Chunk with a
+    copied content string per chunk.
+    """
+    import tracemalloc
+    from app.schemas.process import Chunk
+    from app.services.chunk_span import ChunkSpan
+
+    text = generate_text(args.span_chars, "en", seed=3)
+    size, step = 200, 50
+
+    def spans():
+        chunks = [ChunkSpan(text, i, min(i + size, len(text))) for i in range(0, len(text), step)]
+        for chunk in chunks:
+            chunk.to_dict()
+        return chunks
+
+    def models():
+        chunks = [
+            Chunk(content=text[i : i + size], original_index=i) for i in range(0, len(text), step)
+        ]
+        for chunk in chunks:
+            chunk.model_dump()
+        return chunks
+
+    metrics = {}
+    for name, func in (("span", spans), ("model", models)):
+        metrics[f"{name}_ms"] = min(_timed(func) for _ in range(args.repeat)) * 1000
+        tracemalloc.start()
+        chunks = func()
+        metrics[f"{name}_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        del chunks
+    metrics["chunks_per_sec"] = len(range(0, len(text), step)) / (metrics["span_ms"] / 1000)
+    return metrics
+
+
+def _timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+@benchmark("parsing.vlm_output")
+def _bench_parse_vlm_output(args):
+    from app.core.tag_parser import render_vlm_output
+
+    page = "<processed_content>\n" + "".join(
+        f"<text>Paragraph {i} with some transcribed text.</text>\n"
+        f"<figure_caption>Figure {i}.</figure_caption>\n"
+        for i in range(40)
+    ) + "</processed_content>"
+    pages = [page] * 2000
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for text in pages:
+            render_vlm_output(text)
+        best = min(best, time.perf_counter() - start)
+    return {"pages_per_sec": len(pages) / best, "best_ms": best * 1000}
+
+
+@benchmark("startup.import_app")
+def _bench_import_app(args):
+    # Fresh interpreters, so nothing is cached in sys.modules
+    backend_dir = Path(__file__).resolve().parents[1]
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import app.main"], cwd=backend_dir, check=True)
+        timings.append(time.perf_counter() - start)
+    return {"best_ms": min(timings) * 1000}
+
+
+@benchmark("startup.warm_up")
+def _bench_warm_up(args):
+    backend_dir = Path(__file__).resolve().parents[1]
+    output = subprocess.run(
+        [sys.executable, "-c", "from app.core.startup import warm_up; print(warm_up())"],
+        cwd=backend_dir,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return {"total_ms": float(output.strip().splitlines()[-1]) * 1000}
+
+
+@benchmark("e2e.process")
+def _bench_e2e_process(args):
+    from app.schemas.process import ProcessRequest
+    from app.services.orchestrator import Orchestrator
+
+    # A different text per request: identical requests (or chunks) in flight
+    # at the same time would share one computation (or LLM call)
+    payloads = [
+        {
+            "text": generate_text(args.e2e_chars, "en", seed=3 + i),
+            "chunking_options": {"method": "fixed_size", "chunk_size": 500, "chunk_overlap": 50},
+            "processing_options": {"clean_text": True, "generate_summary": True},
+        }
+        for i in range(args.requests)
+    ]
+
+    async def one_request(payload: dict):
+        start = time.perf_counter()
+        await Orchestrator().process(ProcessRequest(**payload))
+        return time.perf_counter() - start
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(payload: dict):
+            async with semaphore:
+                return await one_request(payload)
+
+        return await asyncio.gather(*(bounded(payload) for payload in payloads))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+    return {**percentiles(latencies), "requests_per_sec": len(latencies) / elapsed}
+
+
+@benchmark("e2e.upload_pdf")
+def _bench_e2e_pdf(args):
+    from fastapi import UploadFile
+    from app.services.file_processing_service import FileProcessingService
+
+    data = generate_pdf(args.pdf_pages, seed=4)
+
+    async def run():
+        service = FileProcessingService()
+        upload = UploadFile(file=io.BytesIO(data), filename="benchmark.pdf")
+        start = time.perf_counter()
+        await service.process_file(upload)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    return {"total_ms": elapsed * 1000, "pages_per_sec": args.pdf_pages / elapsed}
+
+
+@benchmark("e2e.upload_docx")
+def _bench_e2e_docx(args):
+    from fastapi import UploadFile
+    from app.services.file_processing_service import FileProcessingService
+
+    data = generate_docx(args.docx_paragraphs, num_images=20, num_tables=20, seed=5)
+
+    async def run():
+        service = FileProcessingService()
+        upload = UploadFile(file=io.BytesIO(data), filename="benchmark.docx")
+        start = time.perf_counter()
+        await service.process_file(upload)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+    return {"total_ms": elapsed * 1000, "paragraphs_per_sec": args.docx_paragraphs / elapsed}
+
+
+@benchmark("endpoints.hedging")
+def _bench_endpoint_hedging(args):
+    """
+    Per-document latency when each call has a small chance of stalling: one
+    endpoint vs two replicas balanced, then also hedged at their p95 latency.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.core.llm_client import LLMClient
+
+    def documents(base_url: str) -> List[float]:
+        client = LLMClient(api_key="benchmark", base_url=base_url, model_name="mock")
+        latencies = []
+        with ThreadPoolExecutor(args.hedge_chunks) as executor:
+            # Two warm-up documents, so the pool has latencies to hedge on
+            for _ in range(args.hedge_documents + 2):
+                start = time.perf_counter()
+                # Like a document's chunks cleaned in parallel: done when the slowest is
+                list(executor.map(lambda i: client.get_completion(f"Text: chunk {i}"), range(args.hedge_chunks)))
+                latencies.append(time.perf_counter() - start)
+        return latencies[2:]
+
+    def config(seed: int) -> MockServerConfig:
+        return MockServerConfig(latency=0.02, jitter=0.01, stall_rate=0.02, stall_latency=0.5, seed=seed)
+
+    previous = os.environ.get("LLM_HEDGE_QUANTILE")
+    results = {}
+    try:
+        with MockOpenAIServer(config(1)) as a, MockOpenAIServer(config(2)) as b:
+            os.environ["LLM_HEDGE_QUANTILE"] = "0"
+            single = percentiles(documents(a.base_url))
+            balanced = percentiles(documents(f"{a.base_url},{b.base_url}"))
+            os.environ["LLM_HEDGE_QUANTILE"] = "0.95"
+            hedged = percentiles(documents(f"{a.base_url},{b.base_url}"))
+    finally:
+        if previous is None:
+            os.environ.pop("LLM_HEDGE_QUANTILE", None)
+        else:
+            os.environ["LLM_HEDGE_QUANTILE"] = previous
+    for name, values in (("single", single), ("balanced", balanced), ("hedged", hedged)):
+        results.update({f"{name}_doc_{key}": value for key, value in values.items()})
+    return results
+
+
+def comparable(metrics: Dict) -> bool:
+    """
+    Whether a result can serve as or be checked against a baseline: a parallel
+    benchmark run with a single worker only measures the pool's overhead.
+    """
+    return metrics.get("workers", 2.0) > 1
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Return a description of every metric that regressed by more than `tolerance`.
+    Parallel benchmarks are only compared with a baseline recorded with the
+    same number of workers.
+    """
+    regressions = []
+    for name, metrics in results.get("benchmarks", {}).items():
+        base_metrics = baseline.get("benchmarks", {}).get(name, {})
+        if not comparable(metrics) or base_metrics.get("workers") != metrics.get("workers"):
+            continue
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if not base:
+                continue
+            if metric.endswith("_per_sec") or metric == "speedup":
+                change = (base - value) / base
+            elif metric.endswith("_ms") or metric.endswith("_mb"):
+                change = (value - base) / base
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(
+                    f"{name}.{metric}: {value:.2f} vs baseline {base:.2f} ({change:+.0%} worse)"
+                )
+    return regressions
+
+
+def _run_isolated(name: str, args: argparse.Namespace):
+    """
+    Run one benchmark in a fresh process: ru_maxrss is the peak of the whole
+    process, so in a shared one every benchmark would report the peak of the
+    heaviest one run before it.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--worker", name],
+        cwd=Path(__file__).resolve().parents[1],
+        input=json.dumps(vars(args)),
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["metrics"], result["mock_server"]
+
+
+def _run_worker(name: str) -> int:
+    args = argparse.Namespace(**json.loads(sys.stdin.read()))
+
+    from app.core.log import configure_logging
+
+    # The app's logging setup, as in production, at the benchmark's level
+    configure_logging(level=args.log_level)
+
+    config = MockServerConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    with MockOpenAIServer(config) as server:
+        _configure_clients(server.base_url)
+        metrics = BENCHMARKS[name](args)
+        mock_server = {"calls": server.calls, "rejected": server.rejected}
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps({"metrics": metrics, "mock_server": mock_server}), flush=True)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per chunking benchmark.")
+    parser.add_argument("--requests", type=int, default=8, help="Requests for e2e.process.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent e2e requests.")
+    parser.add_argument("--e2e-chars", type=int, default=20_000, help="Text size for e2e.process.")
+    parser.add_argument("--pdf-pages", type=int, default=200, help="Pages for e2e.upload_pdf.")
+    parser.add_argument("--span-chars", type=int, default=4_000_000, help="Text size for chunks.representation.")
+    parser.add_argument(
+        "--parallel-chars", type=int, default=20_000_000, help="Text size for chunking.recursive_parallel."
+    )
+    parser.add_argument("--docx-paragraphs", type=int, default=20_000, help="Paragraphs for e2e.upload_docx.")
+    parser.add_argument("--hedge-documents", type=int, default=100, help="Documents for endpoints.hedging.")
+    parser.add_argument("--hedge-chunks", type=int, default=16, help="Chunks per document for endpoints.hedging.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency (s).")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Mock server jitter (s).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock server 429 rate.")
+    parser.add_argument(
+        "--embedding-base-url",
+        help="Real embedding API for quality.semantic_boundaries.remote (key from REAL_EMBEDDING_API_KEY).",
+    )
+    parser.add_argument("--output", help="Write results JSON to this path.")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline.")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression ratio.")
+    parser.add_argument("--log-level", default="WARNING")
+    # Internal: run one benchmark with the options read from stdin
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return _run_worker(args.worker)
+
+    results = {"benchmarks": {}, "mock_server": {"calls": 0, "rejected": 0}}
+    for name in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        metrics, mock_server = _run_isolated(name, args)
+        results["benchmarks"][name] = metrics
+        for key, value in mock_server.items():
+            results["mock_server"][key] += value
+        summary = ", ".join(f"{k}={v:.2f}" for k, v in metrics.items())
+        print(f"{name}: {summary}", flush=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        # Merge, so a filtered run only updates its own benchmarks
+        baseline_path = Path(args.baseline)
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        for name, metrics in results["benchmarks"].items():
+            if comparable(metrics):
+                baseline.setdefault("benchmarks", {})[name] = metrics
+            else:
+                print(f"Not saving {name}: run with a single worker, record it on a multi-core machine")
+        baseline_path.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
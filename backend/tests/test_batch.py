@@ -0,0 +1,125 @@
+import asyncio
+import io
+import json
+import os
+import unittest
+import zipfile
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.scheduling import FairScheduler
+from app.services.file_processing_service import FileProcessingService
+
+
+class TestFairScheduler(unittest.TestCase):
+    def test_contended_slots_are_served_round_robin(self):
+        order = []
+
+        async def run():
+            scheduler = FairScheduler(1)
+
+            async def job(key, i):
+                async with scheduler.slot(key):
+                    order.append(f"{key}{i}")
+                    await asyncio.sleep(0)
+
+            # Document "a" queues all its pages before "b" queues any
+            jobs = [job("a", i) for i in range(3)] + [job("b", i) for i in range(3)]
+            await asyncio.gather(*jobs)
+
+        asyncio.run(run())
+        self.assertEqual(order, ["a0", "a1", "b0", "a2", "b1", "b2"])
+
+    def test_limit_is_respected(self):
+        peak = 0
+
+        async def run():
+            nonlocal peak
+            scheduler = FairScheduler(2)
+
+            async def job(key):
+                nonlocal peak
+                async with scheduler.slot(key):
+                    peak = max(peak, scheduler.active)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(*(job(i % 3) for i in range(9)))
+            self.assertEqual(scheduler.active, 0)
+
+        asyncio.run(run())
+        self.assertEqual(peak, 2)
+
+
+@patch.dict(os.environ, {"VLM_API_KEY": "test"})
+class TestBatchEndpoint(unittest.TestCase):
+    def test_upload_batch_with_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("docs/b.md", "bbbbbbbbbb")
+            zf.writestr("docs/c.csv", "a,b\n1,2")
+
+        response = TestClient(app).post(
+            "/api/v1/process/upload_batch",
+            files=[
+                ("files", ("a.txt", b"aaaaaaaaaaaaaaa", "text/plain")),
+                ("files", ("bundle.zip", archive.getvalue(), "application/zip")),
+            ],
+            data={"options": json.dumps({"chunking_options": {"chunk_size": 10, "chunk_overlap": 0}})},
+        )
+        self.assertEqual(response.status_code, 200)
+        events = [json.loads(line) for line in response.text.splitlines()]
+
+        self.assertEqual(events[0], {"type": "batch", "total_files": 3})
+        documents = {e["filename"]: e for e in events if e["type"] == "document"}
+        self.assertEqual(set(documents), {"a.txt", "docs/b.md", "docs/c.csv"})
+        self.assertEqual(documents["a.txt"]["result"]["total_chunks"], 2)
+        self.assertEqual(events[-1]["type"], "batch_done")
+        self.assertEqual(events[-1]["failed_files"], 0)
+
+    def test_unsupported_file_is_reported(self):
+        response = TestClient(app).post(
+            "/api/v1/process/upload_batch",
+            files=[("files", ("image.bmp", b"xx", "image/bmp"))],
+        )
+        events = [json.loads(line) for line in response.text.splitlines()]
+        self.assertIn("Unsupported file type", events[1]["error"])
+        self.assertEqual(events[-1]["failed_files"], 1)
+
+    def upload_archive(self, members: dict):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        return TestClient(app).post(
+            "/api/v1/process/upload_batch",
+            files=[("files", ("bundle.zip", archive.getvalue(), "application/zip"))],
+        )
+
+    @patch.dict(os.environ, {"BATCH_MAX_UNCOMPRESSED_BYTES": "1000000"})
+    def test_archive_unpacking_too_large_is_rejected(self):
+        # Compresses to about 2 kB
+        response = self.upload_archive({"bomb.txt": b"0" * 2_000_000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("BATCH_MAX_UNCOMPRESSED_BYTES", response.json()["detail"])
+
+    @patch.dict(os.environ, {"BATCH_MAX_FILES": "2"})
+    def test_archive_with_too_many_files_is_rejected(self):
+        response = self.upload_archive({f"{i}.txt": "text" for i in range(3)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("BATCH_MAX_FILES", response.json()["detail"])
+
+    def test_documents_of_each_batch_have_their_own_vlm_queue(self):
+        keys = []
+
+        async def extract_file(file, document_key=None, on_delta=None):
+            keys.append(document_key)
+            raise ValueError("stop")
+
+        with patch.object(FileProcessingService, "extract_file", side_effect=extract_file):
+            for _ in range(2):
+                self.upload_archive({"a.txt": "aaaa", "b.txt": "bbbb"})
+        self.assertEqual(len(set(keys)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from fastapi.testclient import TestClient
+from benchmarks.mock_server import MockServerConfig, create_app
+from benchmarks.run import compare
+
+
+class TestMockServer(unittest.TestCase):
+    def test_chat_completion_uses_prompt_tags(self):
+        client = TestClient(create_app(MockServerConfig(latency=0, jitter=0)))
+        response = client.post(
+            "/v1/chat/completions",
+            json={
+                "model": "mock",
+                "messages": [
+                    {"role": "system", "content": "You are a helpful summarizer."},
+                    {"role": "user", "content": "Text:\nSome content"},
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("<summary>", data["choices"][0]["message"]["content"])
+        self.assertGreater(data["usage"]["total_tokens"], 0)
+
+    def test_rate_limit_injection(self):
+        client = TestClient(create_app(MockServerConfig(latency=0, jitter=0, error_rate=1.0)))
+        response = client.post("/v1/embeddings", json={"model": "mock", "input": ["a"]})
+        self.assertEqual(response.status_code, 429)
+
+
+class TestBaselineComparison(unittest.TestCase):
+    def test_compare_detects_regressions(self):
+        baseline = {"benchmarks": {"chunking": {"chunks_per_sec": 100.0, "p95_ms": 10.0}}}
+        results = {"benchmarks": {"chunking": {"chunks_per_sec": 70.0, "p95_ms": 10.5}}}
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("chunks_per_sec", regressions[0])
+
+    def test_parallel_results_need_the_same_workers(self):
+        baseline = {"benchmarks": {"parallel": {"speedup": 3.0, "parallel_ms": 10.0, "workers": 4.0}}}
+        slower = {"benchmarks": {"parallel": {"speedup": 2.0, "parallel_ms": 10.0, "workers": 4.0}}}
+        self.assertEqual(len(compare(slower, baseline, tolerance=0.2)), 1)
+        for workers in (1.0, 2.0):
+            results = {"benchmarks": {"parallel": {"speedup": 0.8, "parallel_ms": 50.0, "workers": workers}}}
+            self.assertEqual(compare(results, baseline, tolerance=0.2), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
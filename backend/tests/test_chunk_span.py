@@ -0,0 +1,38 @@
+import unittest
+from app.schemas.process import Chunk
+from app.services.chunk_span import ChunkSpan
+from app.services.chunking_service import RuleBasedChunker
+
+
+class TestChunkSpan(unittest.TestCase):
+    def test_fixed_size_chunks_share_the_source(self):
+        text = "abcdefghij" * 3
+        chunks = RuleBasedChunker.chunk_by_fixed_size(text, 10, 4)
+        for chunk in chunks:
+            self.assertIs(chunk.source, text)
+            self.assertIsNone(chunk.edited_content)
+            self.assertEqual(chunk.content, text[chunk.start : chunk.end])
+            self.assertEqual(chunk.original_index, chunk.start)
+
+    def test_edited_content_keeps_the_span(self):
+        chunk = ChunkSpan("hello world", 6, 11)
+        chunk.content = "World"
+        self.assertEqual(chunk.content, "World")
+        self.assertEqual((chunk.start, chunk.end), (6, 11))
+
+    def test_of_only_stores_content_that_differs(self):
+        text = "one two three"
+        self.assertIsNone(ChunkSpan.of(text, 4, "two").edited_content)
+        self.assertEqual(ChunkSpan.of(text, 4, "two three!").edited_content, "two three!")
+
+    def test_serialization_matches_the_model(self):
+        chunk = ChunkSpan("some text here", 5, 9)
+        chunk.summary = "s"
+        chunk.token_count = 1
+        expected = Chunk(content="text", original_index=5, summary="s", token_count=1).model_dump()
+        self.assertEqual(chunk.to_dict(), expected)
+        self.assertEqual(chunk.to_chunk().model_dump(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
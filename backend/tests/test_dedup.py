@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from app.core.llm_client import LLMClient
+from app.schemas.process import ProcessRequest
+from app.services.dedup_service import ChunkDeduplicator
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+
+FOOTER = "This document is confidential and intended solely for the use of the addressee."
+BODY = "Revenue grew strongly in the third quarter, driven by new customers in Europe."
+
+
+class TestChunkDeduplicator(unittest.TestCase):
+    def test_exact_and_page_framed_duplicates(self):
+        texts = [
+            f"--- Page 1 ---\n{FOOTER}",
+            BODY,
+            f"--- Page 2 ---\n{FOOTER}",
+            f"--- Page 13 ---\n  {FOOTER}",
+        ]
+        self.assertEqual(ChunkDeduplicator().group(texts), [0, 1, 0, 0])
+
+    def test_near_duplicate_within_distance(self):
+        texts = [FOOTER * 3, FOOTER * 3 + " Thanks.", BODY * 3]
+        groups = ChunkDeduplicator(max_distance=6).group(texts)
+        self.assertEqual(groups[1], 0)
+        self.assertEqual(groups[2], 2)
+
+    def test_exact_only(self):
+        texts = [FOOTER * 3, FOOTER * 3 + " Thanks."]
+        self.assertEqual(ChunkDeduplicator(max_distance=0).group(texts), [0, 1])
+
+    def test_copies_of_a_near_duplicate_keep_their_first_copy(self):
+        texts = [FOOTER * 3, FOOTER * 3 + " Thanks.", FOOTER * 3 + " Thanks."]
+        representatives, first_copies = ChunkDeduplicator(max_distance=6).group_with_copies(texts)
+        self.assertEqual(representatives, [0, 0, 0])
+        self.assertEqual(first_copies, [0, 1, 1])
+
+    def test_page_references_are_kept(self):
+        texts = [
+            "Refer to Page 12 for the maximum dose of 5 mg.",
+            "Refer to page 3 for the maximum dose of 5 mg.",
+            "REFER to page 3 for the maximum dose of 5 mg.",
+        ]
+        self.assertEqual(ChunkDeduplicator(max_distance=0).group_with_copies(texts), ([0, 1, 1], [0, 1, 1]))
+
+    def test_numbers_are_not_normalized_away(self):
+        texts = ["Dose: take 5 mg twice daily.", "Dose: take 50 mg twice daily."]
+        self.assertEqual(ChunkDeduplicator(max_distance=0).group(texts), [0, 1])
+        self.assertEqual(ChunkDeduplicator().group(texts), [0, 1])
+
+
+class TestOrchestratorDedup(unittest.TestCase):
+    def setUp(self):
+        self.llm_client = MagicMock(spec=LLMClient)
+        self.llm_client.get_completion.return_value = "<summary>Footer</summary>"
+        self.orchestrator = Orchestrator()
+        self.orchestrator.processing_service = ProcessingService(self.llm_client)
+        self.text = (FOOTER + "\n") * 4 + BODY
+
+    def _request(self, mode: str) -> ProcessRequest:
+        return ProcessRequest(
+            text=self.text,
+            chunking_options={"method": "recursive", "chunk_size": 100, "separators": ["\n"]},
+            processing_options={
+                "generate_summary": True,
+                "deduplicate": True,
+                "dedup_mode": mode,
+            },
+        )
+
+    def test_fan_out_skips_duplicate_calls(self):
+        response = asyncio.run(self.orchestrator.process(self._request("fan_out")))
+
+        self.assertEqual(response.total_chunks, 5)
+        self.assertEqual(self.llm_client.get_completion.call_count, 2)
+        self.assertEqual(response.dedup.duplicate_chunks, 3)
+        self.assertEqual(response.dedup.llm_calls_saved, 3)
+        self.assertTrue(all(chunk.summary == "Footer" for chunk in response.chunks))
+
+    def test_drop_removes_duplicates(self):
+        response = asyncio.run(self.orchestrator.process(self._request("drop")))
+
+        self.assertEqual(response.total_chunks, 2)
+        self.assertEqual(response.dedup.dropped_chunks, 3)
+
+    def _dose_request(self, mode: str, max_distance: int) -> ProcessRequest:
+        return ProcessRequest(
+            text=f"{FOOTER * 3} Take 5 mg.\n{FOOTER * 3} Take 50 mg.",
+            chunking_options={"method": "recursive", "chunk_size": 300, "separators": ["\n"]},
+            processing_options={
+                "clean_text": True,
+                "generate_summary": True,
+                "deduplicate": True,
+                "dedup_mode": mode,
+                "dedup_max_distance": max_distance,
+            },
+        )
+
+    def test_chunks_differing_in_numbers_are_kept_exact_only(self):
+        self.llm_client.get_completion.return_value = "<cleaned_text>Cleaned</cleaned_text><summary>Dose</summary>"
+        for mode in ("fan_out", "drop"):
+            with self.subTest(mode=mode):
+                response = asyncio.run(self.orchestrator.process(self._dose_request(mode, 0)))
+                self.assertEqual(response.total_chunks, 2)
+                self.assertEqual(response.dedup.duplicate_chunks, 0)
+
+    def test_near_duplicates_are_processed_on_their_own(self):
+        def complete(prompt, system_prompt):
+            dose = "50 mg" if "50 mg" in prompt else "5 mg"
+            return f"<cleaned_text>Take {dose}.</cleaned_text><summary>Dose {dose}</summary>"
+
+        self.llm_client.get_completion.side_effect = complete
+        response = asyncio.run(self.orchestrator.process(self._dose_request("fan_out", 6)))
+
+        self.assertEqual(response.dedup.duplicate_chunks, 1)
+        self.assertEqual(response.dedup.near_duplicate_chunks, 1)
+        self.assertEqual(response.dedup.llm_calls_saved, 0)
+        self.assertEqual(
+            [(chunk.content, chunk.summary) for chunk in response.chunks],
+            [("Take 5 mg.", "Dose 5 mg"), ("Take 50 mg.", "Dose 50 mg")],
+        )
+
+    def test_copies_of_a_near_duplicate_share_one_call(self):
+        def complete(prompt, system_prompt):
+            dose = "50 mg" if "50 mg" in prompt else "5 mg"
+            return f"<cleaned_text>Take {dose}.</cleaned_text><summary>Dose {dose}</summary>"
+
+        self.llm_client.get_completion.side_effect = complete
+        request = self._dose_request("fan_out", 6)
+        request.text = "\n".join([f"{FOOTER * 3} Take 5 mg."] + [f"{FOOTER * 3} Take 50 mg."] * 4)
+        response = asyncio.run(self.orchestrator.process(request))
+
+        self.assertEqual(response.total_chunks, 5)
+        self.assertEqual(response.dedup.duplicate_chunks, 4)
+        self.assertEqual(response.dedup.near_duplicate_chunks, 4)
+        self.assertEqual(response.dedup.llm_calls_saved, 6)
+        self.assertEqual(self.llm_client.get_completion.call_count, 4)
+
+    def test_copies_differing_in_case_are_cleaned_on_their_own(self):
+        self.llm_client.get_completion.side_effect = (
+            lambda prompt, system_prompt: f"<cleaned_text>{prompt.split(chr(10))[1]}</cleaned_text>"
+        )
+        request = self._dose_request("fan_out", 0)
+        request.processing_options.generate_summary = False
+        request.chunking_options.chunk_size = 40
+        request.text = "Refer to page 3 for the dose.\nREFER to page 3 for the dose.\nRefer to page 3 for the dose."
+        response = asyncio.run(self.orchestrator.process(request))
+
+        self.assertEqual(response.dedup.duplicate_chunks, 2)
+        self.assertEqual(self.llm_client.get_completion.call_count, 2)
+        self.assertEqual(
+            [chunk.content for chunk in response.chunks],
+            ["Refer to page 3 for the dose.", "REFER to page 3 for the dose.", "Refer to page 3 for the dose."],
+        )
+
+    def test_dropped_near_duplicates_are_reported(self):
+        self.llm_client.get_completion.return_value = "<cleaned_text>Take 5 mg.</cleaned_text><summary>Dose</summary>"
+        response = asyncio.run(self.orchestrator.process(self._dose_request("drop", 6)))
+
+        self.assertEqual(response.total_chunks, 1)
+        self.assertEqual(response.dedup.near_duplicate_chunks, 1)
+        self.assertEqual(response.dedup.dropped_chunks, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import io
+import os
+import unittest
+import zipfile
+from unittest.mock import MagicMock, patch
+from fastapi import UploadFile
+from app.services.docx_extractor import iter_docx_blocks
+from app.services.file_processing_service import FileProcessingService
+from benchmarks.corpora import generate_docx
+
+
+class TestDocxExtractor(unittest.TestCase):
+    def test_blocks_in_document_order(self):
+        blocks = list(iter_docx_blocks(generate_docx(6, num_images=2, num_tables=1)))
+        kinds = [kind for kind, _ in blocks]
+        self.assertEqual(kinds.count("image"), 2)
+        self.assertEqual(kinds.count("text"), 7)
+        # Images and the table sit between the paragraphs they were inserted after
+        self.assertEqual(kinds[3], "image")
+        self.assertEqual(blocks[5][1], "R0C0 | R0C1 | R0C2\nR1C0 | R1C1 | R1C2\nR2C0 | R2C1 | R2C2")
+        self.assertTrue(blocks[3][1][1].startswith(b"\x89PNG"))
+
+    def test_images_missing_from_the_archive_are_skipped(self):
+        source = zipfile.ZipFile(io.BytesIO(generate_docx(6, num_images=2)))
+        media = sorted(name for name in source.namelist() if name.startswith("word/media/"))
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w") as archive:
+            for name in source.namelist():
+                if name != media[0]:
+                    archive.writestr(name, source.read(name))
+
+        kinds = [kind for kind, _ in iter_docx_blocks(data.getvalue())]
+        self.assertEqual(kinds.count("image"), 1)
+        self.assertEqual(kinds.count("text"), 6)
+
+    def test_matches_python_docx_paragraphs(self):
+        import docx
+
+        data = generate_docx(50, seed=3)
+        expected = [p.text for p in docx.Document(io.BytesIO(data)).paragraphs if p.text.strip()]
+        self.assertEqual([value for _, value in iter_docx_blocks(data)], expected)
+
+
+class TestDocxProcessing(unittest.TestCase):
+    @patch.dict(os.environ, {"VLM_API_KEY": "test"})
+    def test_captions_replace_images_in_place(self):
+        service = FileProcessingService()
+        captions = iter(["<text>first</text>", "<figure_caption>second</figure_caption>"])
+        service.vlm_client.get_image_caption = MagicMock(side_effect=lambda image, prompt: next(captions))
+        upload = UploadFile(file=io.BytesIO(generate_docx(6, num_images=2)), filename="doc.docx")
+
+        text = asyncio.run(service.process_file(upload))
+        lines = text.split("\n")
+        self.assertEqual(lines[3], "first")
+        self.assertEqual(lines[6], "[Image: second]")
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(service.vlm_client.get_image_caption.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from app.core.endpoint_pool import EndpointPool, MIN_HEDGE_SAMPLES, parse_base_urls
+
+
+class FakeError(Exception):
+    def __init__(self, status_code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def make_pool(**kwargs) -> EndpointPool:
+    return EndpointPool(
+        "test", ["http://a", "http://b"], "key", client_factory=lambda url: url, **kwargs
+    )
+
+
+class TestEndpointPool(unittest.TestCase):
+    def test_parse_base_urls(self):
+        self.assertEqual(parse_base_urls(" http://a/v1, http://b/v1 ,"), ["http://a/v1", "http://b/v1"])
+        self.assertEqual(parse_base_urls(None), [None])
+
+    def test_least_outstanding_requests(self):
+        pool = make_pool()
+        release = threading.Event()
+        started = threading.Event()
+        seen = []
+
+        def slow(url):
+            seen.append(url)
+            started.set()
+            release.wait()
+            return url
+
+        thread = threading.Thread(target=pool.call, args=(slow,))
+        thread.start()
+        started.wait()
+        # The first endpoint is busy, so the next calls go to the idle one
+        busy = seen[0]
+        for _ in range(3):
+            self.assertNotEqual(pool.call(lambda url: url), busy)
+        release.set()
+        thread.join()
+
+    def test_failover_and_ejection(self):
+        pool = make_pool(eject_after=2)
+        calls = []
+
+        def flaky(url):
+            calls.append(url)
+            if url == "http://a":
+                raise FakeError(503)
+            return url
+
+        # Ties between idle endpoints go to the first one, so "a" is tried until ejected
+        with patch("app.core.endpoint_pool.random.choice", side_effect=lambda endpoints: endpoints[0]):
+            for _ in range(6):
+                self.assertEqual(pool.call(flaky), "http://b")
+        # Ejected after two failures, "a" isn't tried again during the cooldown
+        self.assertEqual(calls.count("http://a"), 2)
+
+    def test_request_errors_are_not_retried(self):
+        pool = make_pool()
+        calls = []
+
+        def bad_request(url):
+            calls.append(url)
+            raise FakeError(400)
+
+        with self.assertRaises(FakeError):
+            pool.call(bad_request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([e.failures for e in pool.endpoints], [0, 0])
+
+    def test_hedging_takes_the_first_reply(self):
+        pool = make_pool(hedge_quantile=0.9)
+        for _ in range(MIN_HEDGE_SAMPLES):
+            pool.call(lambda url: url)
+        self.assertIsNotNone(pool.hedge_delay())
+
+        discarded = []
+        done = threading.Event()
+
+        def stuck_on_a(url):
+            if url == "http://a":
+                time.sleep(0.3)
+            return SimpleNamespace(url=url)
+
+        # Make "a" the endpoint the call goes to first
+        pool.endpoints[1].outstanding = 1
+        start = time.perf_counter()
+        reply = pool.call(stuck_on_a, on_discarded=lambda r: (discarded.append(r), done.set()))
+        self.assertEqual(reply.url, "http://b")
+        self.assertLess(time.perf_counter() - start, 0.25)
+        # The slow reply is still handed over, so its usage can be counted
+        self.assertTrue(done.wait(2))
+        self.assertEqual(discarded[0].url, "http://a")
+
+    def test_hedges_are_budgeted(self):
+        pool = make_pool(hedge_quantile=0.5, hedge_budget=0.1)
+        for _ in range(MIN_HEDGE_SAMPLES):
+            pool.call(lambda url: url)
+        hedged = []
+
+        def slow_first(url):
+            hedged.append(url)
+            if len(hedged) % 2:
+                time.sleep(0.05)
+            return url
+
+        for _ in range(10):
+            hedged.clear()
+            pool.call(slow_first)
+        # 30 calls in the window allow 3 hedges
+        self.assertEqual(pool._recent_hedges, 3)
+
+    def test_no_hedging_with_a_single_endpoint(self):
+        pool = EndpointPool("test", ["http://a"], "key", client_factory=lambda url: url, hedge_quantile=0.5)
+        for _ in range(MIN_HEDGE_SAMPLES):
+            pool.call(lambda url: url)
+        self.assertIsNone(pool.hedge_delay())
+
+    def test_failed_hedge_is_not_tried_again(self):
+        pool = EndpointPool(
+            "test", ["http://a", "http://b", "http://c"], "key", client_factory=lambda url: url, hedge_quantile=0.5
+        )
+        for _ in range(MIN_HEDGE_SAMPLES):
+            pool.call(lambda url: url)
+        calls = []
+
+        def failing(url):
+            calls.append(url)
+            if len(calls) == 1:
+                time.sleep(0.05)
+            if url == "http://c":
+                return url
+            raise FakeError(503)
+
+        pool.endpoints[2].outstanding = 5
+        self.assertEqual(pool.call(failing), "http://c")
+        self.assertEqual(sorted(calls), ["http://a", "http://b", "http://c"])
+
+    def test_stream_releases_the_endpoint(self):
+        pool = make_pool()
+        chunks = list(pool.stream(lambda url: iter([url, "done"])))
+        self.assertEqual(chunks[1], "done")
+        self.assertEqual([e.outstanding for e in pool.endpoints], [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
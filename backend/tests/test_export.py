@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app.schemas.process import ProcessRequest
+from app.services.export_service import ExportService
+from app.services.orchestrator import Orchestrator
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+TEXT = "Alpha beta gamma. " * 10
+
+
+def export_request(**export):
+    return ProcessRequest(
+        text=TEXT,
+        chunking_options={"method": "fixed_size", "chunk_size": 50, "chunk_overlap": 10},
+        export={"embedding_backend": "local", **export},
+    )
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        patcher = patch.dict(os.environ, {"EXPORT_ROOT": self.root.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.root.cleanup)
+
+    def test_npy_export_is_row_aligned(self):
+        response = asyncio.run(Orchestrator().process(export_request(batch_size=2)))
+        export = response.export
+        self.assertEqual(export.rows, response.total_chunks)
+        self.assertEqual(export.files, ["chunks.jsonl", "embeddings.npy"])
+
+        directory = os.path.join(self.root.name, export.export_id)
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"))
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings.shape, (export.rows, export.embedding_dim))
+        with open(os.path.join(directory, "chunks.jsonl"), encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        for record, chunk in zip(records, response.chunks):
+            self.assertEqual(record["content"], chunk.content)
+            self.assertEqual(TEXT[record["start"] : record["end"]], chunk.content)
+            self.assertEqual(record["token_count"], chunk.token_count)
+
+    def test_download_and_compact_response(self):
+        client = TestClient(app)
+        body = export_request(directory="my-export").model_dump()
+        body["response_format"] = "compact"
+        result = client.post("/api/v1/process/", json=body).json()
+        self.assertEqual(result["export"]["export_id"], "my-export")
+        self.assertEqual((result["chunks"][0]["start"], result["chunks"][0]["end"]), (0, 50))
+
+        download = client.get("/api/v1/process/exports/my-export/chunks.jsonl")
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(len(download.content.splitlines()), result["total_chunks"])
+        self.assertEqual(client.get("/api/v1/process/exports/my-export/other.txt").status_code, 404)
+        self.assertEqual(client.get("/api/v1/process/exports/..%2F..%2Fetc/passwd").status_code, 404)
+
+    def test_invalid_directory_is_rejected(self):
+        with self.assertRaises(ValueError):
+            export_request(directory="../outside")
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_parquet_export(self):
+        import pyarrow.parquet as pq
+
+        response = asyncio.run(Orchestrator().process(export_request(format="parquet")))
+        table = pq.read_table(os.path.join(self.root.name, response.export.export_id, "chunks.parquet"))
+        self.assertEqual(table.num_rows, response.total_chunks)
+        self.assertEqual(len(table.column("embedding")[0]), response.export.embedding_dim)
+
+    @unittest.skipIf(pyarrow, "pyarrow is installed")
+    def test_parquet_without_pyarrow(self):
+        with patch.object(ExportService, "_embed") as embed:
+            with self.assertRaisesRegex(ValueError, "pyarrow"):
+                asyncio.run(Orchestrator().process(export_request(format="parquet")))
+            response = TestClient(app).post(
+                "/api/v1/process/", json=export_request(format="arrow").model_dump()
+            )
+            stream = TestClient(app).post(
+                "/api/v1/process/ndjson", json=export_request(format="arrow").model_dump()
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(stream.status_code, 400)
+        embed.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.v1.endpoints.process import get_file_processing_service
+from app.core.shared_store import SQLiteStore
+from app.services.extraction_store import Extraction, ExtractedUnit, ExtractionStore
+from app.services.file_processing_service import FileProcessingService
+from benchmarks.corpora import generate_docx, generate_pdf
+
+
+class FakeError(Exception):
+    def __init__(self, status_code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FlakyCaption:
+    """
+    VLM stand-in failing for the images in `failing`, or for the next
+    `transient` calls.
+    """
+
+    def __init__(self):
+        self.failing = set()
+        self.transient = 0
+        self.error = FakeError(503)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, image, prompt):
+        with self._lock:
+            self.calls += 1
+            if image in self.failing or self.transient:
+                self.transient = max(0, self.transient - 1)
+                raise self.error
+        return "<text>Transcribed</text>"
+
+
+@patch.dict(os.environ, {"VLM_API_KEY": "test", "VLM_UNIT_MAX_ATTEMPTS": "2", "VLM_UNIT_RETRY_BACKOFF": "0"})
+class TestExtractionRetry(unittest.TestCase):
+    def setUp(self):
+        self.caption = FlakyCaption()
+
+        def service():
+            file_service = FileProcessingService()
+            file_service.vlm_client.get_image_caption = self.caption
+            return file_service
+
+        app.dependency_overrides[get_file_processing_service] = service
+        self.addCleanup(app.dependency_overrides.clear)
+        self.client = TestClient(app)
+
+    def upload(self, data: bytes, filename: str) -> dict:
+        response = self.client.post("/api/v1/process/upload_file", files={"file": (filename, data)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_only_failed_pages_are_retried(self):
+        import fitz
+
+        pdf = generate_pdf(3, seed=11)
+        with fitz.open(stream=pdf, filetype="pdf") as doc:
+            self.caption.failing.add(FileProcessingService._render_pdf_page(doc, 1))
+
+        result = self.upload(pdf, "doc.pdf")
+        self.assertEqual(result["failed_units"], 1)
+        self.assertEqual([unit["status"] for unit in result["units"]], ["ok", "failed", "ok"])
+        self.assertEqual(result["units"][1]["attempts"], 2)
+        self.assertIn("--- Page 2 (Error) ---", result["content"])
+        self.assertEqual(self.caption.calls, 4)
+
+        self.caption.failing.clear()
+        response = self.client.post(f"/api/v1/process/extractions/{result['extraction_id']}/retry")
+        retried = response.json()
+        self.assertEqual(retried["failed_units"], 0)
+        self.assertEqual(self.caption.calls, 5)
+        self.assertEqual(retried["content"].count("Transcribed"), 3)
+        self.assertEqual(retried["content"].split("--- Page 3 ---")[1], result["content"].split("--- Page 3 ---")[1])
+
+    def test_failed_docx_images_are_retried(self):
+        self.caption.transient = 2
+        result = self.upload(generate_docx(4, num_images=1), "doc.docx")
+        self.assertEqual(result["failed_units"], 1)
+
+        response = self.client.post(f"/api/v1/process/extractions/{result['extraction_id']}/retry")
+        self.assertEqual(response.json()["failed_units"], 0)
+        self.assertIn("Transcribed", response.json()["content"])
+
+    def test_too_large_files_are_not_kept_for_retries(self):
+        with patch("app.services.extraction_store.extraction_store.max_source_bytes", 100):
+            self.caption.transient = 2
+            result = self.upload(generate_docx(4, num_images=1), "doc.docx")
+        response = self.client.post(f"/api/v1/process/extractions/{result['extraction_id']}/retry")
+        self.assertEqual(response.status_code, 400)
+
+    def test_transient_errors_are_retried_in_the_pipeline(self):
+        self.caption.transient = 1
+        result = self.upload(generate_docx(4, num_images=1), "doc.docx")
+        self.assertEqual(result["failed_units"], 0)
+        self.assertEqual(result["units"], [{"unit": "image", "index": 1, "status": "ok", "attempts": 2, "error": None}])
+
+    def test_request_errors_fail_at_once(self):
+        self.caption.transient = 5
+        self.caption.error = FakeError(400)
+        result = self.upload(generate_docx(4, num_images=1), "doc.docx")
+        self.assertEqual(result["units"][0]["attempts"], 1)
+        self.assertIn("[Error processing image 1: status 400]", result["content"])
+
+    def test_unknown_extraction(self):
+        response = self.client.post("/api/v1/process/extractions/missing/retry")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestExtractionStore(unittest.TestCase):
+    def test_extractions_are_shared_between_replicas(self):
+        unit = ExtractedUnit("image", 0)
+        unit.error, unit.attempts = "timeout", 3
+        # The same image twice in the document is one unit
+        extraction = Extraction("doc.docx", ["intro", unit, "middle", unit], source=b"PK\x03\x04")
+
+        with tempfile.TemporaryDirectory() as root:
+            shared = SQLiteStore(os.path.join(root, "shared.db"))
+            ExtractionStore(shared=shared).put(extraction)
+            restored = ExtractionStore(shared=shared).get(extraction.id)
+
+        self.assertEqual(restored.content, extraction.content)
+        self.assertEqual(len(restored.units), 1)
+        self.assertEqual(restored.source, b"PK\x03\x04")
+        restored.units[0].error = None
+        restored.units[0].text = "caption"
+        self.assertEqual(restored.content, "intro\ncaption\nmiddle\ncaption")
+
+    def test_kept_files_are_bounded(self):
+        store = ExtractionStore(max_source_bytes=10, max_bytes=15)
+        large = Extraction("large.pdf", [], source=b"x" * 11)
+        store.put(large)
+        self.assertIsNone(store.get(large.id).source)
+
+        first, second = (Extraction("doc.pdf", [], source=b"x" * 8) for _ in range(2))
+        store.put(first)
+        store.put(second)
+        self.assertIsNone(store.get(first.id))
+        self.assertIsNotNone(store.get(second.id))
+
+
+if __name__ == "__main__":
+    unittest.main()
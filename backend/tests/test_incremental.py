@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from app.core.llm_client import LLMClient
+from app.schemas.process import ProcessRequest
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+from app.services.result_store import ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+    def test_lru_eviction(self):
+        store = ResultStore(max_entries=2)
+        store.put("a", {"content": "a"})
+        store.put("b", {"content": "b"})
+        store.get("a")
+        store.put("c", {"content": "c"})
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("a"))
+
+
+class TestIncrementalProcessing(unittest.TestCase):
+    def setUp(self):
+        self.llm_client = MagicMock(spec=LLMClient)
+        self.llm_client.get_completion.side_effect = (
+            lambda prompt, system_prompt: "<summary>S</summary>"
+        )
+
+    def _process(self, text: str, **kwargs):
+        orchestrator = Orchestrator()
+        orchestrator.processing_service = ProcessingService(self.llm_client)
+        request = ProcessRequest(
+            text=text,
+            chunking_options={"method": "fixed_size", "chunk_size": 10, "chunk_overlap": 0},
+            processing_options={"generate_summary": True},
+            **kwargs,
+        )
+        return asyncio.run(orchestrator.process(request))
+
+    def test_only_changed_chunks_are_reprocessed(self):
+        first = self._process("aaaaaaaaaabbbbbbbbbbcccccccccc")
+        self.assertEqual(self.llm_client.get_completion.call_count, 3)
+        self.assertIsNotNone(first.session_id)
+
+        second = self._process(
+            "aaaaaaaaaaBBBBBBBBBBcccccccccc", previous_session_id=first.session_id
+        )
+        self.assertEqual(self.llm_client.get_completion.call_count, 4)
+        self.assertEqual(second.reused_chunks, 2)
+        self.assertTrue(all(chunk.summary == "S" for chunk in second.chunks))
+
+    def test_previous_chunk_hashes(self):
+        first = self._process("dddddddddd")
+        second = self._process(
+            "dddddddddd", previous_chunk_hashes=[first.chunks[0].content_hash]
+        )
+        self.assertEqual(second.reused_chunks, 1)
+        self.assertEqual(self.llm_client.get_completion.call_count, 1)
+
+    def test_results_of_another_model_are_not_reused(self):
+        self.llm_client.model_name = "model-a"
+        first = self._process("ffffffffff")
+        self.llm_client.model_name = "model-b"
+        second = self._process(
+            "ffffffffff", previous_chunk_hashes=[first.chunks[0].content_hash]
+        )
+        self.assertEqual(second.reused_chunks, 0)
+        self.assertEqual(self.llm_client.get_completion.call_count, 2)
+
+    def test_unknown_session_processes_everything(self):
+        response = self._process("eeeeeeeeee", previous_session_id="missing")
+        self.assertEqual(response.reused_chunks, 0)
+        self.assertEqual(self.llm_client.get_completion.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
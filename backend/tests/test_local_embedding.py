@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+from app.core import local_embedding
+from app.core.local_embedding import LocalEmbeddingClient
+from app.schemas.process import ProcessRequest
+from app.services.chunking_service import SemanticChunker
+from app.services.orchestrator import Orchestrator
+
+SENTENCES = [
+    "The market revenue grew strongly this quarter.",
+    "Quarterly revenue in the market grew strongly.",
+    "Cells divide by mitosis in most organisms.",
+    "知识库检索增强生成需要文档切分。",
+    "文档切分是知识库检索的第一步。",
+]
+
+
+class TestLocalEmbeddingClient(unittest.TestCase):
+    def test_similar_texts_are_closer(self):
+        vectors = LocalEmbeddingClient(dim=128).get_embeddings(SENTENCES)
+        self.assertEqual(vectors.shape, (5, 128))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        sims = vectors @ vectors.T
+        self.assertGreater(sims[0, 1], sims[0, 2])
+        self.assertGreater(sims[3, 4], sims[3, 0])
+
+    def test_batching_does_not_change_the_result(self):
+        client = LocalEmbeddingClient()
+        expected = client.get_embeddings(SENTENCES * 3)
+        with patch.object(local_embedding, "BATCH_CHARS", 60):
+            np.testing.assert_allclose(client.get_embeddings(SENTENCES * 3), expected, rtol=1e-6)
+
+    def test_empty_input(self):
+        self.assertEqual(LocalEmbeddingClient(dim=8).get_embeddings([]).shape, (0, 8))
+
+    def test_texts_whose_length_changes_when_lowered(self):
+        # "İ" lowers to two code points
+        texts = ["İstanbul is big.", "Next one here.", "istanbul is big!", "Straße ΣΊΣΥΦΟΣ İİ."]
+        vectors = LocalEmbeddingClient(dim=64).get_embeddings(texts)
+        self.assertEqual(vectors.shape, (4, 64))
+        sims = vectors @ vectors.T
+        self.assertGreater(sims[0, 2], sims[0, 1])
+
+
+class TestEmbeddingBackendSelection(unittest.TestCase):
+    def _request(self, **chunking):
+        return ProcessRequest(
+            text=" ".join(SENTENCES[:3]),
+            chunking_options={"method": "semantic", "chunk_size": 60, **chunking},
+        )
+
+    def test_local_backend_per_request(self):
+        orchestrator = Orchestrator()
+        orchestrator.semantic_chunker = MagicMock()
+        response = asyncio.run(orchestrator.process(self._request(embedding_backend="local")))
+        orchestrator.semantic_chunker.chunk_by_semantics.assert_not_called()
+        self.assertEqual(
+            [chunk.content for chunk in response.chunks][-1], "Cells divide by mitosis in most organisms."
+        )
+
+    def test_remote_failure_falls_back_to_local(self):
+        client = MagicMock()
+        client.get_embeddings.side_effect = ConnectionError("unreachable")
+        orchestrator = Orchestrator()
+        orchestrator.semantic_chunker = SemanticChunker(client)
+        response = asyncio.run(
+            orchestrator.process(self._request(embedding_backend="remote", semantic_threshold=0.9))
+        )
+        client.get_embeddings.assert_called_once()
+        self.assertEqual(response.total_chunks, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
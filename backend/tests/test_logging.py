@@ -0,0 +1,147 @@
+import io
+import os
+import json
+import queue
+import asyncio
+import logging
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core import log
+from app.core.log import SAMPLED, ContextQueueHandler, JsonFormatter, current_log_context, log_context
+from app.core.streaming import run_in_thread
+
+
+class TestStructuredLogging(unittest.TestCase):
+    def setUp(self):
+        self.records: queue.SimpleQueue = queue.SimpleQueue()
+        self.logger = logging.getLogger("tests.structured")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = ContextQueueHandler(self.records, sample_rate=0.0)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def queued(self) -> list:
+        records = []
+        while not self.records.empty():
+            records.append(self.records.get())
+        return records
+
+    def test_records_carry_the_context_and_are_formatted_later(self):
+        with log_context(request_id="r1"):
+            with log_context(page=3):
+                self.logger.info("Calling %s", "VLM", extra={"attempt": 2})
+            self.logger.warning("Done")
+
+        calling, done = self.queued()
+        # Queued unformatted, the formatting happens on the listener thread
+        self.assertEqual((calling.msg, calling.args), ("Calling %s", ("VLM",)))
+        entry = json.loads(JsonFormatter().format(calling))
+        self.assertEqual(entry["message"], "Calling VLM")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "tests.structured")
+        self.assertEqual((entry["request_id"], entry["page"], entry["attempt"]), ("r1", 3, 2))
+        self.assertNotIn("page", json.loads(JsonFormatter().format(done)))
+
+    def test_exceptions_are_included(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("Failed")
+        entry = json.loads(JsonFormatter().format(self.queued()[0]))
+        self.assertIn("ValueError: boom", entry["exception"])
+
+    def test_per_call_lines_are_sampled(self):
+        self.logger.debug("Sending request", extra=SAMPLED)
+        self.logger.debug("Not sampled")
+        self.assertEqual([record.msg for record in self.queued()], ["Not sampled"])
+
+        self.handler.sample_rate = 1.0
+        self.logger.debug("Sending request", extra=SAMPLED)
+        entry = json.loads(JsonFormatter().format(self.queued()[0]))
+        self.assertEqual(entry["sample_rate"], 1.0)
+        self.assertNotIn("sampled", entry)
+
+    def test_context_follows_calls_into_threads(self):
+        async def run():
+            with log_context(request_id="r2", chunk=4):
+                return await run_in_thread(current_log_context)
+
+        self.assertEqual(asyncio.run(run()), {"request_id": "r2", "chunk": 4})
+
+
+class TestConfigureLogging(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        saved = root.handlers[:], root.level
+        self.addCleanup(self.restore, *saved)
+        # Out of the way of configure_logging(force=True), which closes them
+        for handler in saved[0]:
+            root.removeHandler(handler)
+
+    def restore(self, handlers, level):
+        log.stop_logging()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+        for name in ("tests.quiet", "tests.verbose"):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    @patch.dict(os.environ, {"LOG_LEVELS": "tests.quiet=ERROR, tests.verbose=debug"})
+    def test_levels_per_subsystem(self):
+        stderr = io.StringIO()
+        with patch("sys.stderr", stderr):
+            log.configure_logging(level="WARNING", fmt="json", force=True)
+        logging.getLogger("tests.quiet").warning("dropped")
+        logging.getLogger("tests.quiet.child").error("kept %d", 1)
+        logging.getLogger("tests.verbose").debug("kept %d", 2)
+        logging.getLogger("tests.other").info("dropped")
+        log.stop_logging()
+
+        lines = [json.loads(line) for line in stderr.getvalue().splitlines()]
+        self.assertEqual([line["message"] for line in lines], ["kept 1", "kept 2"])
+
+    def test_configured_root_logger_is_left_alone(self):
+        root = logging.getLogger()
+        handler = logging.NullHandler()
+        root.addHandler(handler)
+        log.configure_logging()
+        self.assertIn(handler, root.handlers)
+
+
+class TestRequestId(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_request_id_is_returned(self):
+        response = self.client.get("/", headers={"X-Request-Id": "job-42"})
+        self.assertEqual(response.headers["X-Request-Id"], "job-42")
+
+    def test_request_id_is_generated_when_missing_or_invalid(self):
+        generated = self.client.get("/").headers["X-Request-Id"]
+        self.assertRegex(generated, r"^[0-9a-f]{32}$")
+        replaced = self.client.get("/", headers={"X-Request-Id": "bad id!"}).headers["X-Request-Id"]
+        self.assertRegex(replaced, r"^[0-9a-f]{32}$")
+
+    def test_non_ascii_request_id_is_replaced(self):
+        async def inner(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "headers": [(b"x-request-id", "café".encode("latin-1"))]}
+        asyncio.run(log.RequestContextMiddleware(inner)(scope, None, send))
+        request_id = dict(sent[0]["headers"])[b"x-request-id"].decode("ascii")
+        self.assertRegex(request_id, r"^[0-9a-f]{32}$")
+
+
+if __name__ == "__main__":
+    unittest.main()
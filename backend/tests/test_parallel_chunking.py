@@ -0,0 +1,84 @@
+import os
+import random
+import unittest
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+from app.services import parallel_chunking
+from app.services.chunking_service import RuleBasedChunker, pack_splits, split_recursively
+from app.services.parallel_chunking import chunk_recursively_parallel
+
+WORDS = ["alpha", "beta", "数据", "gamma", "\n", "\n\n", "\n\n\n", "  ", "x" * 300, "句子。"]
+
+
+def spans(chunks):
+    return [(c.start, c.end, c.content, c.edited_content) for c in chunks]
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(WORDS) + rng.choice(["", " "]) for _ in range(words))
+
+
+class TestParallelChunking(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def assertSameChunks(self, text, chunk_size, separators=None, workers=4):
+        expected = RuleBasedChunker.chunk_recursively(
+            text, chunk_size, 0, separators=list(separators) if separators else None
+        )
+        actual = chunk_recursively_parallel(
+            text, chunk_size, separators=separators, workers=workers, executor=self.executor
+        )
+        self.assertEqual(spans(actual), spans(expected))
+
+    def test_matches_sequential_output(self):
+        rng = random.Random(7)
+        for _ in range(40):
+            text = random_text(rng, rng.randint(0, 3000))
+            chunk_size = rng.choice([5, 20, 100, 500, 2000])
+            separators = rng.choice([None, ["\n"], ["\n\n", "。", " "], ["\n\n\n", "\n"]])
+            with self.subTest(length=len(text), chunk_size=chunk_size, separators=separators):
+                self.assertSameChunks(text, chunk_size, separators, workers=rng.choice([2, 5, 30]))
+
+    def test_cuts_where_split_does_in_separator_runs(self):
+        text = ("para one\n\n\n\n\nnext\n\n\npara " * 200).strip()
+        self.assertSameChunks(text, 30)
+        for cut in parallel_chunking._cut_points(text, "\n\n", 16):
+            self.assertNotEqual(text[cut - 1], "\n")
+
+    def test_text_without_separator_is_chunked_in_process(self):
+        text = "abcdefghij" * 50
+        with patch.object(parallel_chunking, "_get_executor") as get_executor:
+            self.assertSameChunks(text, 40, separators=["\n\n"])
+            get_executor.assert_not_called()
+
+    def test_chunks_spanning_several_segments(self):
+        text = "\n\n".join(f"short paragraph {i}" for i in range(400))
+        self.assertSameChunks(text, 3000, workers=30)
+        self.assertSameChunks(text, 10, workers=30)
+
+    def test_measured_links_match_the_packing(self):
+        text = random_text(random.Random(5), 1500)
+        chunk_size = 120
+        with patch.object(parallel_chunking, "_segment_splits") as segment_splits:
+            segment_splits.return_value = splits = split_recursively(text, ["\n\n", "\n", " ", ""], chunk_size)
+            _, following = parallel_chunking._measure_segment(chunk_size)
+        firsts = [first for first, _, _ in pack_splits(splits, chunk_size)]
+        self.assertEqual([int(following[first]) for first in firsts], firsts[1:] + [len(splits)])
+
+    def test_enabled_for_long_texts_with_several_workers(self):
+        with patch.dict(os.environ, {"PARALLEL_CHUNKING_MIN_CHARS": "100", "CHUNKING_WORKERS": "4"}):
+            self.assertTrue(parallel_chunking.use_parallel_chunking("a" * 100))
+            self.assertFalse(parallel_chunking.use_parallel_chunking("a" * 99))
+        with patch.dict(os.environ, {"PARALLEL_CHUNKING_MIN_CHARS": "100", "CHUNKING_WORKERS": "1"}):
+            self.assertFalse(parallel_chunking.use_parallel_chunking("a" * 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
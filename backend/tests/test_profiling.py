@@ -0,0 +1,83 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.profiling import Profile, profiling, stage
+
+BODY = {
+    "text": "Alpha beta gamma. " * 50,
+    "chunking_options": {"method": "fixed_size", "chunk_size": 100, "chunk_overlap": 0},
+}
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        patcher = patch.dict(
+            os.environ,
+            {"PROFILE_ROOT": self.root.name, "PROFILING_ENABLED": "true", "PROFILING_TOKEN": "secret"},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.root.cleanup)
+        self.client = TestClient(app)
+
+    def test_stage_is_a_no_op_without_a_profile(self):
+        self.assertIs(stage("chunking"), stage("embedding"))
+
+    def test_stages_overlap_in_lanes(self):
+        profile = Profile("test")
+        with profiling(profile):
+            profile.record("llm_call", 0.0, 2.0)
+            profile.record("llm_call", 1.0, 3.0)
+            profile.record("token_counting", 2.5, 4.0)
+        lanes = [p for p in profile.speedscope()["profiles"] if p["type"] == "evented"]
+        self.assertEqual(len(lanes), 2)
+        self.assertEqual(profile.summary()["stages"]["llm_call"]["count"], 2)
+
+    @patch("app.core.profiling.MAX_SAMPLES", 5)
+    def test_stack_samples_are_bounded(self):
+        profile = Profile("test", interval=0.001)
+        with profiling(profile):
+            time.sleep(0.05)
+        self.assertEqual(sum(len(samples) for samples in profile._sampler.samples.values()), 5)
+        self.assertTrue(profile.summary()["truncated_samples"])
+
+    def test_requires_config_and_token(self):
+        response = self.client.post("/api/v1/process/", json=BODY, headers={"X-Profile": "wrong"})
+        self.assertEqual(response.status_code, 403)
+        with patch.dict(os.environ, {"PROFILING_ENABLED": "false"}):
+            response = self.client.post("/api/v1/process/?profile=secret", json=BODY)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post("/api/v1/process/", json=BODY)
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(os.listdir(self.root.name), [])
+
+    def test_profiled_request_can_be_downloaded(self):
+        response = self.client.post("/api/v1/process/", json=BODY, headers={"X-Profile": "secret"})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers["X-Profile-Id"]
+
+        speedscope = self.client.get(f"/api/v1/process/profiles/{profile_id}").json()
+        names = {frame["name"] for frame in speedscope["shared"]["frames"]}
+        self.assertIn("stage:chunking", names)
+        self.assertIn("stage:token_counting", names)
+
+        summary = self.client.get(f"/api/v1/process/profiles/{profile_id}?view=summary").json()
+        self.assertEqual(summary["stages"]["token_counting"]["count"], 9)
+        self.assertEqual(self.client.get("/api/v1/process/profiles/not-an-id").status_code, 404)
+
+    def test_profiled_stream(self):
+        response = self.client.post("/api/v1/process/ndjson?profile=secret", json=BODY)
+        self.assertEqual(response.status_code, 200)
+        summary = self.client.get(
+            f"/api/v1/process/profiles/{response.headers['X-Profile-Id']}?view=summary"
+        ).json()
+        self.assertIn("chunking", summary["stages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from app.core.llm_client import LLMClient
+from app.core.prompt_builder import PromptBuilder, split_to_budget
+from app.core.prompts import (
+    CLEAN_TEXT_SYSTEM_PROMPT,
+    CLEAN_TEXT_USER_PROMPT_TEMPLATE,
+    SUMMARIZE_TEXT_SYSTEM_PROMPT,
+    SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE,
+)
+from app.core.tokenizer import count_tokens
+from app.core.usage import UsageTracker
+from app.schemas.process import Chunk
+from app.services.chunk_span import ChunkSpan
+from app.services.processing_service import ProcessingService
+
+PARAGRAPH = "Knowledge bases are built from documents. Each one is split into chunks before indexing.\n\n"
+DOCUMENT = "".join(f"Section {i}: {PARAGRAPH}" for i in range(10))
+
+
+class TestPromptBuilder(unittest.TestCase):
+    def test_split_keeps_the_text_and_the_budget(self):
+        text = PARAGRAPH * 20 + "x" * 500
+        pieces = split_to_budget(text, 40)
+        self.assertEqual("".join(pieces), text)
+        self.assertTrue(all(count_tokens(piece) <= 40 for piece in pieces))
+        # Paragraphs are kept whole when they fit
+        self.assertEqual(pieces[0], PARAGRAPH * (40 // count_tokens(PARAGRAPH)))
+
+    def test_fit(self):
+        builder = PromptBuilder(
+            CLEAN_TEXT_SYSTEM_PROMPT, CLEAN_TEXT_USER_PROMPT_TEMPLATE, context_window=100_000, output_tokens=50, echoes_input=True
+        )
+        self.assertEqual(builder.fit("short"), ["short"])
+        self.assertGreater(len(builder.fit(DOCUMENT)), 1)
+        truncating = PromptBuilder(
+            CLEAN_TEXT_SYSTEM_PROMPT,
+            CLEAN_TEXT_USER_PROMPT_TEMPLATE,
+            context_window=100_000,
+            output_tokens=50,
+            echoes_input=True,
+            oversize="truncate",
+        )
+        self.assertEqual(len(truncating.fit(DOCUMENT)), 1)
+
+    @patch.dict(os.environ, {"LLM_MAX_OUTPUT_TOKENS": "50"})
+    def test_oversize_chunk_is_cleaned_in_pieces(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.side_effect = lambda prompt, system_prompt: (
+            f"<cleaned_text>{len(prompt)}</cleaned_text>"
+        )
+        service = ProcessingService(llm_client)
+        chunk = asyncio.run(service.clean_chunk(Chunk(content=DOCUMENT, original_index=0)))
+
+        calls = llm_client.get_completion.call_args_list
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(len(chunk.content.split("\n")), len(calls))
+        # The static prompt is the same prefix of every call; the user message is only the text
+        self.assertEqual({call.args[1] for call in calls}, {CLEAN_TEXT_SYSTEM_PROMPT})
+        self.assertTrue(all(call.args[0].startswith("Text:\n") for call in calls))
+
+    def summarizing_service(self) -> ProcessingService:
+        """
+        Service summarizing DOCUMENT in pieces of 60 tokens: each piece's summary
+        is "Part.", the summary of those summaries "About the whole text.".
+        """
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.side_effect = lambda prompt, system_prompt: (
+            f"<summary>{'About the whole text.' if 'Section' not in prompt else 'Part.'}</summary>"
+        )
+        llm_client.stream_completion.side_effect = lambda prompt, system_prompt: iter(
+            ["<summary>About the ", "whole text.</summary>"] if "Section" not in prompt else ["<summary>Part.</summary>"]
+        )
+        service = ProcessingService(llm_client)
+        window = PromptBuilder(SUMMARIZE_TEXT_SYSTEM_PROMPT, SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE, output_tokens=50)
+        service.summary_prompts = PromptBuilder(
+            SUMMARIZE_TEXT_SYSTEM_PROMPT,
+            SUMMARIZE_TEXT_USER_PROMPT_TEMPLATE,
+            context_window=window.context_window - window.max_text_tokens + 60,
+            output_tokens=50,
+        )
+        return service
+
+    def test_oversize_chunk_summaries_are_reduced(self):
+        service = self.summarizing_service()
+        llm_client = service.llm_client
+        chunk = asyncio.run(service.generate_summary(Chunk(content=DOCUMENT, original_index=0)))
+
+        pieces = len(service.summary_prompts.fit(DOCUMENT))
+        self.assertGreater(pieces, 1)
+        # One call per piece, then one over the pieces' summaries
+        self.assertEqual(llm_client.get_completion.call_count, pieces + 1)
+        self.assertEqual(chunk.summary, "About the whole text.")
+
+    def test_only_the_reduced_summary_is_streamed(self):
+        service = self.summarizing_service()
+
+        async def collect():
+            events = service.process_chunks_events([ChunkSpan(DOCUMENT, 0, len(DOCUMENT))], summarize=True)
+            return [event async for event in events]
+
+        events = asyncio.run(collect())
+        streamed = "".join(text for kind, _, _, text in events if kind == "delta")
+        self.assertEqual(streamed, "About the whole text.")
+        self.assertEqual(events[-1][1].summary, "About the whole text.")
+
+
+class TestCachedPromptTokens(unittest.TestCase):
+    @patch.dict(os.environ, {"LLM_PROMPT_PRICE_PER_1K": "1", "LLM_CACHED_PROMPT_PRICE_PER_1K": "0.5"})
+    def test_cached_tokens_are_reported_and_discounted(self):
+        tracker = UsageTracker()
+        usage = SimpleNamespace(
+            prompt_tokens=1000,
+            completion_tokens=0,
+            total_tokens=1000,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=800),
+        )
+        tracker.record("llm", "gpt-4o", usage)
+        report = tracker.report()
+        self.assertEqual(report.llm.cached_prompt_tokens, 800)
+        self.assertAlmostEqual(report.estimated_cost, 0.2 + 0.4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from app.core.llm_client import LLMClient
+from app.schemas.process import ProcessRequest
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+from app.services.quality_check import QualityChecker
+
+CLEAN = "Knowledge bases are built from documents that are split into chunks before indexing."
+
+
+class TestQualityChecker(unittest.TestCase):
+    def test_clean_prose_scores_zero(self):
+        checker = QualityChecker()
+        self.assertEqual(checker.score(CLEAN), 0.0)
+        self.assertEqual(checker.score("知识库由文档切分而成，每个片段都会被向量化并建立索引。"), 0.0)
+
+    def test_noise_signals(self):
+        checker = QualityChecker()
+        noisy = {
+            "hyphenation": "The experi-\nment was a success.",
+            "encoding": "Itâ€™s a cafÃ© with great coffee.",
+            "odd_words": "Tbe qu1ck brwn f0x jumpz ovEr tHe lazy d0g.",
+            "noise_chars": "■■ Item one ■■ Item two ▲",
+            "header_footer": f"{CLEAN}\n\n- 12 -",
+        }
+        for signal, text in noisy.items():
+            self.assertEqual(checker.signals(text)[signal], 1.0, signal)
+
+    def test_repeated_lines_are_headers(self):
+        bodies = [f"{CLEAN} It covers {topic}." for topic in ("sales", "hiring", "outlook", "risks")]
+        texts = [f"ACME Corp Annual Report 202{i}\n{body}" for i, body in enumerate(bodies[:3])]
+        self.assertEqual(QualityChecker().needs_cleaning(texts + bodies[3:]), [True, True, True, False])
+        # Page framing added to parsed files is not a header
+        framed = [f"--- Page {i} ---\n{body}" for i, body in enumerate(bodies)]
+        self.assertEqual(QualityChecker().needs_cleaning(framed), [False] * 4)
+
+
+class TestOrchestratorPrecheck(unittest.TestCase):
+    def test_only_noisy_chunks_are_cleaned(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.return_value = "<cleaned_text>Fixed.</cleaned_text>"
+        orchestrator = Orchestrator()
+        orchestrator.processing_service = ProcessingService(llm_client)
+        request = ProcessRequest(
+            text="\n".join([CLEAN, "Tbe qu1ck brwn f0x jumpz ovEr tHe lazy d0g.", CLEAN + " Indeed."]),
+            chunking_options={"method": "recursive", "chunk_size": 100, "separators": ["\n"]},
+            processing_options={"clean_text": True, "clean_precheck": True},
+        )
+
+        response = asyncio.run(orchestrator.process(request))
+
+        self.assertEqual(llm_client.get_completion.call_count, 1)
+        self.assertEqual([chunk.content for chunk in response.chunks][1], "Fixed.")
+        self.assertEqual(response.quality.checked_chunks, 3)
+        self.assertEqual(response.quality.skipped_chunks, 2)
+
+    def test_skipped_chunks_are_not_reused_as_cleaned(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.return_value = "<cleaned_text>Fixed.</cleaned_text>"
+        orchestrator = Orchestrator()
+        orchestrator.processing_service = ProcessingService(llm_client)
+        text = "\n".join([CLEAN + " Once more.", CLEAN + " Twice more."])
+
+        def request(precheck: bool, **kwargs) -> ProcessRequest:
+            return ProcessRequest(
+                text=text,
+                chunking_options={"method": "recursive", "chunk_size": 100, "separators": ["\n"]},
+                processing_options={"clean_text": True, "clean_precheck": precheck},
+                **kwargs,
+            )
+
+        first = asyncio.run(orchestrator.process(request(True)))
+        self.assertEqual(llm_client.get_completion.call_count, 0)
+
+        second = asyncio.run(orchestrator.process(
+            request(False, previous_chunk_hashes=[first.chunks[0].content_hash])
+        ))
+        self.assertEqual(second.reused_chunks, 0)
+        self.assertEqual([chunk.content for chunk in second.chunks], ["Fixed.", "Fixed."])
+
+
+if __name__ == "__main__":
+    unittest.main()
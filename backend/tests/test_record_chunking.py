@@ -0,0 +1,84 @@
+import json
+import unittest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.record_chunker import RecordChunker, iter_json_records
+
+CSV = 'id,name\n1,"multi\nline"\n2,"say ""hi"""\n\n3,ü\n'
+
+
+def blocks_of(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestRecordChunker(unittest.TestCase):
+    def test_csv_rows_are_never_split(self):
+        chunks = RecordChunker.chunk_text(CSV, 20, record_format="csv")
+        self.assertEqual(
+            [c.content for c in chunks], ["id,name", '1,"multi\nline"', '2,"say ""hi"""\n\n3,ü']
+        )
+        data = CSV.encode("utf-8")
+        for chunk in chunks:
+            self.assertEqual(CSV[chunk.original_index : chunk.original_index + len(chunk.content)], chunk.content)
+            self.assertEqual(data[chunk.byte_start : chunk.byte_end].decode("utf-8").rstrip("\n"), chunk.content)
+        self.assertEqual([(c.record_start, c.record_end) for c in chunks], [(0, 1), (1, 2), (2, 4)])
+
+    def test_repeated_header(self):
+        chunks = RecordChunker.chunk_text(CSV, 30, record_format="csv", repeat_header=True)
+        self.assertTrue(all(c.content.startswith("id,name\n") for c in chunks))
+        self.assertEqual(chunks[0].record_start, 1)
+        self.assertEqual(sum(c.record_end - c.record_start for c in chunks), 3)
+
+    def test_json_array_records_across_blocks(self):
+        text = '﻿[{"a": "x,]\\"}"}, [1, 2] ,3, "é"]'
+        data = text.encode("utf-8")
+        expected = list(iter_json_records([data[3:]], 3, 1))
+        for size in (1, 2, 7):
+            self.assertEqual(list(iter_json_records(blocks_of(data[3:], size), 3, 1)), expected)
+        self.assertEqual([r[3] for r in expected], ['{"a": "x,]\\"}"}', "[1, 2]", "3", '"é"'])
+        for byte_start, byte_end, char_start, record in expected:
+            self.assertEqual(data[byte_start:byte_end].decode("utf-8"), record)
+            self.assertEqual(text[char_start : char_start + len(record)], record)
+
+        chunks = list(RecordChunker.chunk_stream(blocks_of(data, 5), 14, filename="data.json"))
+        self.assertEqual([c.content for c in chunks], ['{"a": "x,]\\"}"}', '[1, 2]\n3\n"é"'])
+        self.assertEqual([(c.record_start, c.record_end) for c in chunks], [(0, 1), (1, 4)])
+
+    def test_jsonl_records(self):
+        lines = ['{"id": %d, "text": "line %d"}' % (i, i) for i in range(5)]
+        chunks = RecordChunker.chunk_text("\n".join(lines) + "\n", 60)
+        self.assertEqual([c.content for c in chunks], ["\n".join(lines[:2]), "\n".join(lines[2:4]), lines[4]])
+
+    def test_multi_line_values_and_numbers_across_blocks(self):
+        data = b'{\n  "a": [1,\n 2]\n}\n12345\n'
+        records = list(iter_json_records(blocks_of(data, 3)))
+        self.assertEqual([r[3] for r in records], ['{\n  "a": [1,\n 2]\n}', "12345"])
+
+    def test_invalid_json_is_an_error(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_records([b'[{"a": 1}, {"b": ']))
+        with self.assertRaises(ValueError):
+            list(iter_json_records([b'[1 2]']))
+
+
+class TestRecordChunkingEndpoints(unittest.TestCase):
+    def test_upload_records(self):
+        response = TestClient(app).post(
+            "/api/v1/process/upload_records",
+            files={"file": ("rows.csv", CSV.encode("utf-8"), "text/csv")},
+            data={"options": json.dumps({"chunk_size": 30, "repeat_header": True})},
+        )
+        events = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(events[-1], {"type": "done", "total_chunks": len(events) - 1})
+        self.assertEqual(events[0]["chunk"]["byte_start"], len("id,name\n"))
+
+    def test_records_method(self):
+        response = TestClient(app).post(
+            "/api/v1/process/",
+            json={"text": CSV, "chunking_options": {"method": "records", "chunk_size": 20}},
+        )
+        self.assertEqual(response.json()["chunks"][1]["content"], '1,"multi\nline"')
+
+
+if __name__ == "__main__":
+    unittest.main()
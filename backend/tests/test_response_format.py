@@ -0,0 +1,67 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.llm_client import LLMClient
+from app.core.serialization import dumps, sse_event
+from app.schemas.process import ProcessRequest
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+
+
+class TestCompactResponse(unittest.TestCase):
+    def test_unchanged_chunks_are_spans_only(self):
+        request = ProcessRequest(
+            text="1234567890",
+            chunking_options={"method": "fixed_size", "chunk_size": 5, "chunk_overlap": 2},
+            response_format="compact",
+        )
+        response = asyncio.run(Orchestrator().process(request))
+
+        self.assertEqual(response.total_chunks, 4)
+        self.assertEqual((response.chunks[1].start, response.chunks[1].end), (3, 8))
+        self.assertTrue(all(chunk.content is None for chunk in response.chunks))
+
+    def test_cleaned_chunks_carry_content(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.return_value = "<cleaned_text>Clean</cleaned_text>"
+        orchestrator = Orchestrator()
+        orchestrator.processing_service = ProcessingService(llm_client)
+        request = ProcessRequest(
+            text="Dirty text",
+            chunking_options={"method": "fixed_size", "chunk_size": 100, "chunk_overlap": 0},
+            processing_options={"clean_text": True},
+            response_format="compact",
+        )
+        response = asyncio.run(orchestrator.process(request))
+
+        self.assertEqual(response.chunks[0].end, 10)
+        self.assertEqual(response.chunks[0].content, "Clean")
+
+
+class TestStreamingFormats(unittest.TestCase):
+    def test_ndjson_endpoint(self):
+        client = TestClient(app)
+        response = client.post(
+            "/api/v1/process/ndjson",
+            json={
+                "text": "1234567890",
+                "chunking_options": {"method": "fixed_size", "chunk_size": 5, "chunk_overlap": 0},
+                "response_format": "compact",
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        events = [json.loads(line) for line in response.text.splitlines()]
+        chunk_events = [event for event in events if event["type"] == "chunk"]
+        self.assertEqual([event["chunk"]["start"] for event in chunk_events], [0, 5])
+        self.assertEqual(events[-1]["type"], "progress")
+
+    def test_encoder_keeps_unicode(self):
+        self.assertEqual(json.loads(dumps({"text": "中文"})), {"text": "中文"})
+        self.assertTrue(sse_event({"a": 1}).startswith(b"data: "))
+
+
+if __name__ == "__main__":
+    unittest.main()
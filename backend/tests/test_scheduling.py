@@ -0,0 +1,111 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.scheduling import (
+    BULK,
+    INTERACTIVE,
+    AdmissionRejected,
+    PriorityScheduler,
+    llm_scheduler,
+)
+
+
+class TestPriorityScheduler(unittest.TestCase):
+    def test_interactive_waiters_go_first(self):
+        order = []
+
+        async def run():
+            scheduler = PriorityScheduler(1, reserved=0)
+            blocker = asyncio.Event()
+
+            async def job(name, priority):
+                async with scheduler.slot(name[0], priority):
+                    order.append(name)
+                    if name == "b0":
+                        await blocker.wait()
+
+            jobs = [asyncio.ensure_future(job(f"b{i}", BULK)) for i in range(3)]
+            await asyncio.sleep(0)
+            jobs.append(asyncio.ensure_future(job("i0", INTERACTIVE)))
+            await asyncio.sleep(0)
+            blocker.set()
+            await asyncio.gather(*jobs)
+
+        asyncio.run(run())
+        self.assertEqual(order, ["b0", "i0", "b1", "b2"])
+
+    def test_reserved_slot_is_kept_for_interactive_work(self):
+        async def run():
+            scheduler = PriorityScheduler(2, reserved=1)
+            release = asyncio.Event()
+            peak_bulk = 0
+
+            async def bulk_job():
+                nonlocal peak_bulk
+                async with scheduler.slot("bulk-client", BULK):
+                    peak_bulk = max(peak_bulk, scheduler.active_by_priority[BULK])
+                    await release.wait()
+
+            bulk = [asyncio.ensure_future(bulk_job()) for _ in range(4)]
+            await asyncio.sleep(0)
+            # The interactive call starts right away, although bulk work is queued
+            await asyncio.wait_for(scheduler.acquire("ui", INTERACTIVE), timeout=1)
+            scheduler.release(INTERACTIVE)
+            release.set()
+            await asyncio.gather(*bulk)
+            return peak_bulk, scheduler.active
+
+        peak_bulk, active = asyncio.run(run())
+        self.assertEqual(peak_bulk, 1)
+        self.assertEqual(active, 0)
+
+    def test_admission_control(self):
+        async def run():
+            scheduler = PriorityScheduler(1, reserved=0, max_queued={BULK: 2}, max_wait=5)
+            scheduler._observe(2.0)
+            blocker = asyncio.Event()
+
+            async def job():
+                async with scheduler.slot("c", BULK):
+                    await blocker.wait()
+
+            jobs = [asyncio.ensure_future(job()) for _ in range(3)]
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.waiting_for(BULK), 2)
+            with self.assertRaises(AdmissionRejected):
+                scheduler.admit(BULK, 1)
+            # Interactive work is counted separately, and waits less
+            self.assertEqual(scheduler.admit(INTERACTIVE, 1), 2.0)
+            blocker.set()
+            await asyncio.gather(*jobs)
+
+        asyncio.run(run())
+
+    def test_offloaded_calls_count_for_admission(self):
+        scheduler = PriorityScheduler(1, reserved=0, max_queued={BULK: 2})
+        with scheduler.offloaded(BULK), scheduler.offloaded(BULK):
+            self.assertEqual(scheduler.waiting_for(BULK), 2)
+            with self.assertRaises(AdmissionRejected):
+                scheduler.admit(BULK, 1)
+        self.assertEqual(scheduler.waiting_for(BULK), 0)
+        scheduler.admit(BULK, 1)
+
+
+@patch.dict(os.environ, {"LLM_API_KEY": "test"})
+class TestAdmissionEndpoint(unittest.TestCase):
+    def test_rejected_work_returns_429(self):
+        rejected = AdmissionRejected("Too many queued interactive calls", 12.3)
+        with patch.object(llm_scheduler, "admit", side_effect=rejected):
+            response = TestClient(app).post(
+                "/api/v1/process/chunk",
+                json={"chunk": {"content": "x", "original_index": 0}, "action": "clean"},
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["retry-after"], "13")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock
+from app.services.chunking_service import SemanticChunker
+
+# Five sentences of 9 characters, separated by single spaces
+TEXT = "Alpha aa. Bravo bb. Charl cc. Delta dd. Echoo ee."
+
+
+def chunker_with(embeddings):
+    client = MagicMock()
+    client.get_embeddings.return_value = embeddings
+    return SemanticChunker(client)
+
+
+def angles(*degrees):
+    import math
+
+    return [[math.cos(math.radians(d)), math.sin(math.radians(d))] for d in degrees]
+
+
+class TestBoundedSemanticChunking(unittest.TestCase):
+    def test_chunks_are_exact_spans(self):
+        chunks = chunker_with(angles(0, 0, 0, 90, 90)).chunk_by_semantics(TEXT)
+        self.assertEqual([c.content for c in chunks], ["Alpha aa. Bravo bb. Charl cc.", "Delta dd. Echoo ee."])
+        for chunk in chunks:
+            self.assertEqual(TEXT[chunk.original_index : chunk.original_index + len(chunk.content)], chunk.content)
+
+    def test_oversized_group_splits_at_weakest_similarity(self):
+        # All similar (no breakpoint), but the 2nd/3rd boundary is the weakest
+        chunks = chunker_with(angles(0, 5, 40, 45, 50)).chunk_by_semantics(TEXT, max_chunk_size=30)
+        self.assertEqual([c.content for c in chunks], ["Alpha aa. Bravo bb.", "Charl cc. Delta dd. Echoo ee."])
+        self.assertTrue(all(len(c.content) <= 30 for c in chunks))
+
+    def test_percentile_breakpoints(self):
+        # Similarities: ~1, ~0.77, ~1, ~0.5: the weakest 25% of boundaries break
+        chunks = chunker_with(angles(0, 1, 41, 42, 102)).chunk_by_semantics(
+            TEXT, breakpoint_type="percentile", breakpoint_amount=75
+        )
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[1].content, "Echoo ee.")
+
+    def test_std_dev_breakpoints(self):
+        chunks = chunker_with(angles(0, 1, 2, 3, 90)).chunk_by_semantics(
+            TEXT, breakpoint_type="std_dev", breakpoint_amount=1
+        )
+        self.assertEqual([c.content for c in chunks][-1], "Echoo ee.")
+
+    def test_small_chunks_merge_into_more_similar_neighbour(self):
+        chunks = chunker_with(angles(0, 90, 100, 180, 270)).chunk_by_semantics(
+            TEXT, threshold=0.5, min_chunk_size=15, max_chunk_size=30
+        )
+        self.assertTrue(all(len(c.content) >= 15 for c in chunks))
+        self.assertEqual([c.content for c in chunks], ["Alpha aa. Bravo bb. Charl cc.", "Delta dd. Echoo ee."])
+
+    def test_oversized_sentence_is_cut(self):
+        text = "x" * 25 + ". Short one."
+        chunker = chunker_with(angles(0, 0, 0, 0))
+        chunks = chunker.chunk_by_semantics(text, max_chunk_size=10)
+        self.assertTrue(all(len(c.content) <= 10 for c in chunks))
+        self.assertEqual("".join(c.content for c in chunks[:3]), "x" * 25 + ".")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from app.core.llm_client import LLMClient
+from app.core.resp_server import RespServer
+from app.core.scheduling import PriorityScheduler
+from app.core.shared_store import ClusterSemaphore, RedisStore, SQLiteStore
+from app.core.usage import UsageTracker
+from app.core.work_queue import RemoteTaskError, WorkQueue
+from app.schemas.process import Chunk
+from app.services.processing_service import ProcessingService
+from app.services.result_store import ResultStore
+
+
+class SharedStoreTests:
+    """
+    Behaviour common to every SharedStore implementation.
+    """
+
+    def test_get_set_delete(self):
+        self.store.set("a", b"1")
+        self.assertEqual(self.store.get("a"), b"1")
+        self.store.delete("a")
+        self.assertIsNone(self.store.get("a"))
+
+    def test_ttl(self):
+        self.store.set("a", b"1", ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.store.get("a"))
+
+    def test_queues_are_fifo_and_checked_in_order(self):
+        self.store.push("low", b"1")
+        self.store.push("high", b"2")
+        self.store.push("high", b"3")
+        popped = [self.store.pop(["high", "low"], 0.1) for _ in range(3)]
+        self.assertEqual(popped, [("high", b"2"), ("high", b"3"), ("low", b"1")])
+        self.assertIsNone(self.store.pop(["high", "low"], 0.05))
+
+    def test_pop_waits_for_push(self):
+        threading.Timer(0.05, self.store.push, ("q", b"x")).start()
+        self.assertEqual(self.store.pop(["q"], 5), ("q", b"x"))
+
+    def test_locks(self):
+        self.assertTrue(self.store.try_lock("l", "a", 10))
+        self.assertFalse(self.store.try_lock("l", "b", 10))
+        self.store.unlock("l", "b")  # Not the holder: no effect
+        self.assertFalse(self.store.try_lock("l", "b", 10))
+        self.store.unlock("l", "a")
+        self.assertTrue(self.store.try_lock("l", "b", 0.05))
+        time.sleep(0.1)
+        self.assertTrue(self.store.try_lock("l", "c", 10))
+
+
+class TestSQLiteStore(SharedStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SQLiteStore(os.path.join(self.directory.name, "shared.db"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+class TestRedisStore(SharedStoreTests, unittest.TestCase):
+    def setUp(self):
+        self.server = RespServer()
+        self.server.start()
+        self.store = RedisStore(self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+
+
+class TestClusterSemaphore(unittest.TestCase):
+    def test_limit_holds_across_replicas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shared.db")
+            # Two "replicas", each with its own store connection and local scheduler
+            schedulers = [
+                PriorityScheduler(5, reserved=0, cluster=ClusterSemaphore(SQLiteStore(path), "llm", 2))
+                for _ in range(2)
+            ]
+            active, peak = 0, 0
+
+            async def call(scheduler):
+                nonlocal active, peak
+                async with scheduler.slot():
+                    active += 1
+                    peak = max(peak, active)
+                    await asyncio.sleep(0.02)
+                    active -= 1
+
+            async def main():
+                await asyncio.gather(*(call(schedulers[i % 2]) for i in range(10)))
+
+            asyncio.run(main())
+            self.assertEqual(peak, 2)
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.server = RespServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_tasks_are_shared_between_replicas(self):
+        nodes = [WorkQueue(RedisStore(self.server.url), concurrency=2) for _ in range(2)]
+        ran_on = []
+        for node in nodes:
+
+            async def handler(payload, node=node):
+                ran_on.append(node.node_id)
+                await asyncio.sleep(0.05)
+                return {"double": payload["n"] * 2}
+
+            node.register("double", handler)
+
+        async def main():
+            for node in nodes:
+                node.start()
+            try:
+                return await asyncio.gather(
+                    *(nodes[0].submit("double", {"n": n}) for n in range(8))
+                )
+            finally:
+                for node in nodes:
+                    await node.stop()
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [{"double": n * 2} for n in range(8)])
+        self.assertEqual(set(ran_on), {node.node_id for node in nodes})
+
+    def test_errors_are_raised_on_the_submitter(self):
+        queue = WorkQueue(RedisStore(self.server.url))
+
+        async def fail(payload):
+            raise ValueError("bad page")
+
+        queue.register("fail", fail)
+
+        async def main():
+            try:
+                await queue.submit("fail", {})
+            finally:
+                await queue.stop()
+
+        with self.assertRaisesRegex(RemoteTaskError, "bad page"):
+            asyncio.run(main())
+
+    def test_processing_service_submits_bulk_completions(self):
+        queue = WorkQueue(RedisStore(self.server.url))
+
+        async def llm(payload):
+            usage = {"requests": 1, "prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+            return {"text": "<summary>remote</summary>", "usage": usage}
+
+        queue.register("llm", llm)
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.model_name = "test-model"
+        llm_client.usage = UsageTracker()
+        service = ProcessingService(llm_client, queue=queue)
+
+        async def main():
+            try:
+                return await service.generate_summary(Chunk(content="text", original_index=0))
+            finally:
+                await queue.stop()
+
+        chunk = asyncio.run(main())
+        self.assertEqual(chunk.summary, "remote")
+        llm_client.get_completion.assert_not_called()
+        self.assertEqual(service.usage.report().llm.total_tokens, 12)
+
+
+class TestSharedResultStore(unittest.TestCase):
+    def test_results_and_sessions_are_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shared.db")
+            first = ResultStore(shared=SQLiteStore(path))
+            second = ResultStore(shared=SQLiteStore(path))
+            first.put("key", {"content": "c", "summary": "s"})
+            session_id = first.create_session(["h1", "h2"])
+            self.assertEqual(second.get("key"), {"content": "c", "summary": "s"})
+            self.assertEqual(second.session_hashes(session_id), {"h1", "h2"})
+            self.assertIsNone(second.get("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
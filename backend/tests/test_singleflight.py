@@ -0,0 +1,175 @@
+import asyncio
+import io
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from fastapi import UploadFile
+from app.core.llm_client import LLMClient
+from app.core.scheduling import BULK, INTERACTIVE
+from app.core.singleflight import SingleFlight, flight_key
+from app.core.usage import UsageTracker
+from app.schemas.process import ProcessRequest
+from app.services.file_processing_service import FileProcessingService
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+from benchmarks.corpora import generate_pdf
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_computation(self):
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def run():
+            flight = SingleFlight("test")
+            results = await asyncio.gather(
+                flight.do("a", lambda: compute(1)),
+                flight.do("a", lambda: compute(1)),
+                flight.do("b", lambda: compute(2)),
+            )
+            self.assertEqual(flight.in_flight, 0)
+            return results
+
+        self.assertEqual(asyncio.run(run()), [2, 2, 4])
+        self.assertEqual(calls, [1, 2])
+
+    def test_errors_reach_every_caller(self):
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            flight = SingleFlight("test")
+            return await asyncio.gather(
+                flight.do("a", fail), flight.do("a", fail), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_leaving_caller_does_not_cancel_the_others(self):
+        async def run():
+            flight = SingleFlight("test")
+
+            async def compute():
+                await asyncio.sleep(0.02)
+                return "done"
+
+            first = asyncio.ensure_future(flight.do("a", compute))
+            second = asyncio.ensure_future(flight.do("a", compute))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "done")
+
+    def test_flight_key_separates_parts(self):
+        self.assertNotEqual(flight_key("ab", "c"), flight_key("a", "bc"))
+        self.assertEqual(flight_key(b"x", "y"), flight_key(b"x", "y"))
+
+
+def slow_completion(prompt, system_prompt):
+    time.sleep(0.02)
+    return "<summary>S</summary>"
+
+
+class TestCoalescedProcessing(unittest.TestCase):
+    def test_identical_requests_share_llm_calls(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.get_completion.side_effect = slow_completion
+        request = ProcessRequest(
+            text="abcdefghij" * 3,
+            chunking_options={"method": "fixed_size", "chunk_size": 10, "chunk_overlap": 0},
+            processing_options={"generate_summary": True},
+        )
+
+        async def run():
+            orchestrators = [Orchestrator() for _ in range(2)]
+            for orchestrator in orchestrators:
+                orchestrator.processing_service = ProcessingService(llm_client)
+            return await asyncio.gather(*(o.process(request) for o in orchestrators))
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first.model_dump(exclude={"usage"}), second.model_dump(exclude={"usage"}))
+        # The three chunks are identical too, so one call serves all of them
+        self.assertEqual(llm_client.get_completion.call_count, 1)
+        # The usage is reported once, by the request that made the calls
+        self.assertFalse(first.usage.shared)
+        self.assertTrue(second.usage.shared)
+        self.assertEqual(second.usage.llm.requests, 0)
+
+    def test_llm_calls_are_shared_only_at_the_same_priority(self):
+        services = []
+        for _ in range(3):
+            llm_client = MagicMock(spec=LLMClient)
+            llm_client.get_completion.side_effect = slow_completion
+            llm_client.usage = UsageTracker()
+            services.append(ProcessingService(llm_client))
+
+        async def run():
+            return await asyncio.gather(
+                services[0]._complete("Text", "System", BULK),
+                services[1]._complete("Text", "System", BULK),
+                services[2]._complete("Text", "System", INTERACTIVE),
+            )
+
+        asyncio.run(run())
+        calls = [service.llm_client.get_completion.call_count for service in services]
+        self.assertEqual(calls, [1, 0, 1])
+        self.assertEqual(
+            [service.usage.report().shared for service in services], [False, True, False]
+        )
+
+    @patch.dict(os.environ, {"VLM_API_KEY": "test"})
+    def test_identical_uploads_share_vlm_calls(self):
+        pdf = generate_pdf(2)
+
+        async def run():
+            services = [FileProcessingService() for _ in range(2)]
+            caption = MagicMock(side_effect=lambda image, prompt: time.sleep(0.02) or "<text>Page</text>")
+            for service in services:
+                service.vlm_client.get_image_caption = caption
+            results = await asyncio.gather(
+                *(
+                    service.process_file(UploadFile(file=io.BytesIO(pdf), filename=f"copy{i}.pdf"))
+                    for i, service in enumerate(services)
+                )
+            )
+            return results, caption.call_count
+
+        (first, second), calls = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(calls, 2)
+
+    @patch.dict(os.environ, {"VLM_API_KEY": "test"})
+    def test_identical_uploads_get_their_own_extraction(self):
+        pdf = generate_pdf(1)
+        services = [FileProcessingService() for _ in range(2)]
+        caption = MagicMock(side_effect=lambda image, prompt: time.sleep(0.02) or "<text>Page</text>")
+        for service in services:
+            service.vlm_client.get_image_caption = caption
+
+        async def run():
+            return await asyncio.gather(
+                *(
+                    service.extract_file(UploadFile(file=io.BytesIO(pdf), filename=f"copy{i}.pdf"))
+                    for i, service in enumerate(services)
+                )
+            )
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first.content, second.content)
+        self.assertNotEqual(first.id, second.id)
+        self.assertIsNot(first.units[0], second.units[0])
+        self.assertEqual(second.filename, "copy1.pdf")
+        self.assertFalse(services[0].usage.report().shared)
+        self.assertTrue(services[1].usage.report().shared)
+
+
+if __name__ == "__main__":
+    unittest.main()
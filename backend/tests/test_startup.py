@@ -0,0 +1,46 @@
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+from app.core.tokenizer import ENCODING_URLS, estimate_tokens, seed_cache
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+class TestStartup(unittest.TestCase):
+    def test_importing_app_defers_heavy_modules(self):
+        code = (
+            "import sys, app.main; "
+            "print(','.join(m for m in ('fitz', 'docx', 'numpy', 'tiktoken', 'openai') "
+            "if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output.strip(), "")
+
+
+class TestTokenizer(unittest.TestCase):
+    def test_seed_cache_uses_tiktoken_cache_key(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            bpe_file = os.path.join(cache_dir, "cl100k_base.tiktoken")
+            Path(bpe_file).write_bytes(b"dGVzdA== 0\n")
+            with patch.dict(os.environ, {"TIKTOKEN_CACHE_DIR": cache_dir}):
+                target = seed_cache(bpe_file, "cl100k_base")
+
+            expected = hashlib.sha1(ENCODING_URLS["cl100k_base"].encode()).hexdigest()
+            self.assertEqual(os.path.basename(target), expected)
+            self.assertTrue(os.path.exists(target))
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens("中文"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.llm_client import LLMClient
+from app.core.tag_parser import TagContentStream, VLMOutputStream, render_vlm_output
+from app.schemas.process import ProcessRequest
+from app.services.orchestrator import Orchestrator
+from app.services.processing_service import ProcessingService
+from benchmarks.corpora import generate_pdf
+from benchmarks.mock_server import MockOpenAIServer, MockServerConfig
+
+VLM_OUTPUT = """<processed_content>
+<text>Market Analysis</text>
+<figure_caption> A pie chart.</figure_caption>
+<text>Company A leads.</text>
+</processed_content>"""
+
+
+def pieces(text: str, size: int):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class TestIncrementalRendering(unittest.TestCase):
+    def test_vlm_stream_matches_final_rendering(self):
+        for size in (1, 3, 11):
+            renderer = VLMOutputStream()
+            text = "".join(renderer.feed(p) for p in pieces(VLM_OUTPUT, size)) + renderer.close()
+            self.assertEqual(text.strip(), render_vlm_output(VLM_OUTPUT))
+
+    def test_tag_content_stream(self):
+        stream = TagContentStream("cleaned_text")
+        text = "".join(stream.feed(p) for p in pieces("<cleaned_text>\n  Hello</cleaned_text>", 2))
+        self.assertEqual(text + stream.close(), "Hello")
+
+
+class TestStreamedProcessing(unittest.TestCase):
+    def test_deltas_add_up_to_processed_content(self):
+        llm_client = MagicMock(spec=LLMClient)
+        llm_client.stream_completion.side_effect = lambda prompt, system_prompt: iter(
+            pieces("<cleaned_text>\n" + prompt.rsplit("Text:", 1)[-1].strip().upper() + "\n</cleaned_text>", 3)
+        )
+        orchestrator = Orchestrator()
+        orchestrator.processing_service = ProcessingService(llm_client)
+        request = ProcessRequest(
+            text="abcdefghij" * 3,
+            chunking_options={"method": "fixed_size", "chunk_size": 10, "chunk_overlap": 0},
+            processing_options={"clean_text": True, "stream_tokens": True},
+        )
+
+        async def collect():
+            return [event async for event in orchestrator.process_stream(request)]
+
+        events = asyncio.run(collect())
+        deltas, contents = {}, {}
+        for event in events:
+            if event["type"] == "delta":
+                self.assertEqual(event["field"], "content")
+                deltas[event["original_index"]] = deltas.get(event["original_index"], "") + event["delta"]
+            elif event["type"] == "chunk":
+                contents[event["chunk"]["original_index"]] = event["chunk"]["content"]
+
+        self.assertEqual(len(contents), 3)
+        self.assertEqual({i: d.strip() for i, d in deltas.items()}, contents)
+        self.assertTrue(all(c == "ABCDEFGHIJ" for c in contents.values()))
+        llm_client.get_completion.assert_not_called()
+
+    def test_stream_completion_records_usage(self):
+        with MockOpenAIServer(MockServerConfig(latency=0, jitter=0)) as server:
+            client = LLMClient(api_key="test", base_url=server.base_url, model_name="mock")
+            text = "".join(client.stream_completion("Text:\nSome content", "Clean this"))
+        self.assertEqual(text, "<cleaned_text>\nSome content\n</cleaned_text>")
+        self.assertEqual(client.usage.report().llm.requests, 1)
+        self.assertGreater(client.usage.report().llm.total_tokens, 0)
+
+    def test_usage_of_a_closed_stream_is_estimated(self):
+        with MockOpenAIServer(MockServerConfig(latency=0, jitter=0)) as server:
+            client = LLMClient(api_key="test", base_url=server.base_url, model_name="mock")
+            stream = client.stream_completion("Text:\nSome content", "Clean this")
+            next(stream)
+            # The client went away before the final usage chunk
+            stream.close()
+        usage = client.usage.report().llm
+        self.assertEqual(usage.requests, 1)
+        self.assertGreater(usage.prompt_tokens, 0)
+        self.assertGreater(usage.completion_tokens, 0)
+
+
+class TestFileStreamEndpoint(unittest.TestCase):
+    def test_pdf_pages_stream_before_done(self):
+        with MockOpenAIServer(MockServerConfig(latency=0, jitter=0)) as server:
+            with patch.dict(os.environ, {"VLM_API_KEY": "test", "VLM_BASE_URL": server.base_url}):
+                response = TestClient(app).post(
+                    "/api/v1/process/upload_file/stream",
+                    files={"file": ("doc.pdf", generate_pdf(2), "application/pdf")},
+                )
+
+        self.assertEqual(response.status_code, 200)
+        events = [
+            line[len("data: "):] for line in response.text.split("\n\n") if line.startswith("data: ")
+        ]
+        self.assertEqual(events[-1], "[DONE]")
+        events = [json.loads(e) for e in events[:-1]]
+        self.assertEqual(events[-1]["type"], "done")
+        self.assertEqual(events[-1]["usage"]["vlm"]["requests"], 2)
+
+        pages = {}
+        for event in events[:-1]:
+            self.assertEqual(event["type"], "delta")
+            pages[event["page"]] = pages.get(event["page"], "") + event["delta"]
+        self.assertEqual(set(pages), {1, 2})
+        self.assertIn("[Image: A mock figure.]", pages[1])
+        self.assertIn(pages[1].strip(), events[-1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
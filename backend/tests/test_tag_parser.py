@@ -0,0 +1,44 @@
+import unittest
+from app.core.tag_parser import TagParser, extract_tag, parse, render_vlm_output
+
+VLM_OUTPUT = """<processed_content>
+<text>Market Analysis</text>
+<figure_caption>A pie chart of market share.</figure_caption>
+<text>Company A remains the leader.</text>
+</processed_content>"""
+
+
+class TestTagParser(unittest.TestCase):
+    def test_render_vlm_output(self):
+        self.assertEqual(
+            render_vlm_output(VLM_OUTPUT),
+            "Market Analysis\n\n[Image: A pie chart of market share.]\n\nCompany A remains the leader.",
+        )
+
+    def test_render_truncated_output(self):
+        truncated = "<processed_content>\n<text>First</text>\n<text>Cut off mid-sent"
+        self.assertEqual(render_vlm_output(truncated), "First\n\nCut off mid-sent")
+
+    def test_extract_unclosed_tag(self):
+        self.assertEqual(extract_tag("<cleaned_text>\nPartial", "cleaned_text"), "Partial")
+
+    def test_extract_ignores_other_tags_inside(self):
+        text = "<summary>Use <text> tags</summary>"
+        self.assertEqual(extract_tag(text, "summary"), "Use <text> tags")
+
+    def test_incremental_feed_matches_single_pass(self):
+        expected = [event for event in parse(VLM_OUTPUT) if event[0] != "data"]
+        for step in (1, 2, 3, 7):
+            parser = TagParser()
+            events = []
+            for i in range(0, len(VLM_OUTPUT), step):
+                events += parser.feed(VLM_OUTPUT[i : i + step])
+            events += parser.close()
+
+            self.assertEqual([e for e in events if e[0] != "data"], expected)
+            text = "".join(e[2] for e in events if e[0] == "data" and e[1] == "text")
+            self.assertEqual(text, "Market AnalysisCompany A remains the leader.")
+
+
+if __name__ == "__main__":
+    unittest.main()
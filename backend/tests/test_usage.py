@@ -0,0 +1,75 @@
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.endpoint_pool import EndpointPool
+from app.core.llm_client import LLMClient
+from app.core.metrics import MetricsRegistry
+from app.core.usage import UsageTracker
+
+
+class TestUsageTracker(unittest.TestCase):
+    def test_record_accumulates_per_kind(self):
+        tracker = UsageTracker()
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+        tracker.record("llm", "gpt-4o", usage)
+        tracker.record("llm", "gpt-4o", usage)
+        tracker.record("vlm", "gpt-4o", usage, image_count=1)
+
+        report = tracker.report()
+        self.assertEqual(report.llm.requests, 2)
+        self.assertEqual(report.llm.prompt_tokens, 200)
+        self.assertEqual(report.llm.completion_tokens, 40)
+        self.assertEqual(report.vlm.image_count, 1)
+        self.assertEqual(report.total_tokens, 360)
+
+    def test_missing_usage_counts_request_only(self):
+        tracker = UsageTracker()
+        tracker.record("embedding", "text-embedding-3-small", None)
+        report = tracker.report()
+        self.assertEqual(report.embedding.requests, 1)
+        self.assertEqual(report.embedding.total_tokens, 0)
+
+    @patch.dict(
+        os.environ,
+        {"LLM_PROMPT_PRICE_PER_1K": "0.01", "LLM_COMPLETION_PRICE_PER_1K": "0.03"},
+    )
+    def test_estimated_cost(self):
+        tracker = UsageTracker()
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=1000, total_tokens=2000)
+        tracker.record("llm", "gpt-4o", usage)
+        self.assertAlmostEqual(tracker.report().estimated_cost, 0.04)
+
+    def test_llm_client_records_response_usage(self):
+        tracker = UsageTracker()
+        client = LLMClient(api_key="test", usage_tracker=tracker)
+        mock = MagicMock()
+        client.pool = EndpointPool("llm", [None], "test", client_factory=lambda url: mock)
+        mock.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="hi"))],
+            usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3, total_tokens=15),
+        )
+
+        self.assertEqual(client.get_completion("Say hi"), "hi")
+        self.assertEqual(tracker.report().llm.total_tokens, 15)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render_prometheus(self):
+        registry = MetricsRegistry()
+        registry.inc("model_requests_total", help_text="Calls.", client="llm")
+        registry.inc("model_requests_total", client="llm")
+        rendered = registry.render()
+        self.assertIn("# TYPE kb_chunker_model_requests_total counter", rendered)
+        self.assertIn('kb_chunker_model_requests_total{client="llm"} 2', rendered)
+
+    def test_metrics_endpoint(self):
+        response = TestClient(app).get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+
+
+if __name__ == "__main__":
+    unittest.main()